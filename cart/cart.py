@@ -1,130 +1,184 @@
-from store.models import Product, Profile
+from decimal import Decimal
+
+from ecom.backend import post_json, normalize_product
+from fastapi_app.pricing import from_cents, to_cents
+from store import pricing
+from store.models import Product
+from . import persistence
+from .storage import CartStore
+
+
+class CartLine():
+    """One priced cart entry, computed once per request.
+
+    ``product`` is the API's product dict, or a Product instance when the
+    cart had to be priced locally.
+    """
+    __slots__ = ('product_id', 'product', 'quantity', 'unit_price', 'total')
+
+    def __init__(self, product_id, product, quantity, unit_price, total):
+        self.product_id = product_id
+        self.product = product
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.total = total
+
 
 class Cart():
     def __init__(self, request):
-        self.session = request.session
         # get request
         self.request = request
 
-        #Get the current session key if it exist
-        cart = self.session.get('session_key')
-
-        # if the user is new no session key! Create One
-        if 'session_key' not in request.session:
-            cart = self.session['session_key'] = {}
+        # Cart lives in a signed cookie (or the carts cache), not in the DB session
+        self.store = CartStore(request)
 
         # make sure cart is available on all pages of site
-        self.cart = cart
+        self.cart = self.store.load()
+
+        # Priced lines, loaded on first use (see _load)
+        self._lines = None
+        self._total = 0
+
+    @classmethod
+    def for_request(cls, request):
+        """Return the cart shared by the views and the context processor for this request."""
+        cart = getattr(request, '_cart', None)
+        if cart is None:
+            cart = request._cart = cls(request)
+        return cart
+
+    def _load(self):
+        if self._lines is not None:
+            return
+        if not self.cart:
+            self._lines, self._total = [], 0
+            return
+        try:
+            self._load_from_api()
+        except Exception:
+            # FastAPI down: price locally so the cart still works
+            self._load_from_db()
+
+    def _load_from_api(self):
+        # The pricing service is the source of truth, the same prices the order is charged at
+        data = post_json('/cart/price', {key: quantity for key, quantity in self.cart.items()}, timeout=5)
+        lines = []
+        for item in data['lines']:
+            product = normalize_product(item['product'])
+            lines.append(CartLine(
+                product['id'],
+                product,
+                item['quantity'],
+                Decimal(item['unit_price']),
+                Decimal(item['line_total']),
+            ))
+        lines.sort(key=lambda line: line.product['name'])
+        self._lines = lines
+        self._total = Decimal(data['total'])
+
+    def _load_from_db(self):
+        # Same engine as the API: one vectorized pass prices every line, one query fetches the products
+        quantities = {int(key): quantity for key, quantity in self.cart.items()}
+        priced, total, missing = pricing.get_engine().price_carts([quantities])[0]
+        products = Product.objects.in_bulk([product_id for product_id, _, _, _ in priced])
+        lines = []
+        for product_id, quantity, unit_cents, line_cents in priced:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            product.effective_price = from_cents(unit_cents)
+            product.discounted = unit_cents < to_cents(product.price)
+            lines.append(CartLine(product_id, product, quantity, product.effective_price, from_cents(line_cents)))
+        lines.sort(key=lambda line: line.product.name)
+        self._lines = lines
+        self._total = sum((line.total for line in lines), Decimal('0.00'))
+
+    def _changed(self):
+        self._lines = None
+        self.store.modified = True
+
+    @property
+    def lines(self):
+        self._load()
+        return self._lines
+
+    @property
+    def total(self):
+        self._load()
+        return self._total
+
+    def _save_to_profile(self):
+        # Deal with logged in user: written once when the request finishes (cart.persistence)
+        if self.request.user.is_authenticated:
+            persistence.schedule(self.request, self.cart)
 
     def add(self, product, quantity):
         product_id = str(product.id)
-        product_qty = str(quantity) 
+        product_qty = str(quantity)
         #Logic
         if product_id in self.cart:
             pass
         else:
-            #self.cart[product_id] = {'price': str(product.price)}
             self.cart[product_id] = int(product_qty)
 
-        self.session.modified = True
+        self._changed()
+        self._save_to_profile()
 
-        # Deal with logged in user
-        if self.request.user.is_authenticated:
-            # Get the current user profile
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            carty = str(self.cart)
-            carty = carty.replace("\'", "\"")
-            # Save carty to profile model
-            current_user.update(old_cart=str(carty))
-    
     def __len__(self):
         return len(self.cart)
-    
+
     def get_prods(self):
-        # Get ids from cart
-        product_ids = self.cart.keys()
-        # Use ids to lookup products in dataase model
-        products = Product.objects.filter(id__in=product_ids)
-        # Return those looked up products
-        return products
+        return [line.product for line in self.lines]
 
     def get_quants(self):
         quantities = self.cart
         return quantities
-    
+
     def update(self, product, quantity):
         product_id = str(product)
         product_qty = int(quantity)
-        #Get cart
-        ourcart = self.cart
         # update dictionary/cart
-        ourcart[product_id] = product_qty
-        self.session.modified = True
+        self.cart[product_id] = product_qty
 
-        self.session.modified = True
+        self._changed()
+        self._save_to_profile()
 
-        # Deal with logged in user
-        if self.request.user.is_authenticated:
-            # Get the current user profile
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            carty = str(self.cart)
-            carty = carty.replace("\'", "\"")
-            # Save carty to profile model
-            current_user.update(old_cart=str(carty))
-            
         thing = self.cart
         return thing
-    
+
     def delete(self, product):
         product_id = str(product)
         # delete dictionary/cart
         if product_id in self.cart:
             del self.cart[product_id]
 
-        self.session.modified = True
-
-        # Deal with logged in user
-        if self.request.user.is_authenticated:
-            # Get the current user profile
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            carty = str(self.cart)
-            carty = carty.replace("\'", "\"")
-            # Save carty to profile model
-            current_user.update(old_cart=str(carty))
+        self._changed()
+        self._save_to_profile()
 
     def cart_total(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        quantities = self.cart
-        total = 0
-
-        for key, value in quantities.items():
-            key = int(key)
-            for product in products:
-                if product.id == key:
-                    if product.is_sale:
-                        total = total + (product.sale_price * value)
-                    else:
-                        total = total + (product.price * value)
-
-        return total
-        
+        return self.total
+
+    def clear(self):
+        """Empty the cart without touching the saved profile cart."""
+        self.cart.clear()
+        self._changed()
+
+    def merge(self, saved_cart):
+        """Add every item of a saved ``{product_id: quantity}`` cart in one go."""
+        for product_id, quantity in saved_cart.items():
+            self.cart.setdefault(str(product_id), int(quantity))
+
+        self._changed()
+        self._save_to_profile()
+
     def db_add(self, product, quantity):
         product_id = str(product)
-        product_qty = str(quantity) 
+        product_qty = str(quantity)
         #Logic
         if product_id in self.cart:
             pass
         else:
-            #self.cart[product_id] = {'price': str(product.price)}
             self.cart[product_id] = int(product_qty)
 
-        self.session.modified = True
-        # Deal with logged in user
-        if self.request.user.is_authenticated:
-            # Get the current user profile
-            current_user = Profile.objects.filter(user__id=self.request.user.id)
-            carty = str(self.cart)
-            carty = carty.replace("\'", "\"")
-            # Save carty to profile model
-            current_user.update(old_cart=str(carty))
+        self._changed()
+        self._save_to_profile()
@@ -1,6 +1,7 @@
+from django.utils.functional import SimpleLazyObject
 from .cart import Cart
 
 # Create context processor so our cart can work on all page
 def cart(request):
-    # Return the default data from pur cart
-    return {'cart':Cart(request)}
\ No newline at end of file
+    # Shared with the views through Cart.for_request, built only if a template uses it
+    return {'cart': SimpleLazyObject(lambda: Cart.for_request(request))}
@@ -0,0 +1,34 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in small batches. Unlike clearsessions this never holds the "
+        "SQLite write lock for long, so it can run from cron while the shop is live."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Sessions deleted per transaction")
+        parser.add_argument('--pause', type=float, default=0.05, help="Seconds to sleep between batches")
+        parser.add_argument('--max-batches', type=int, default=0, help="Stop after this many batches (0 = until done)")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = batches = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list('session_key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            batches += 1
+            if options['max_batches'] and batches >= options['max_batches']:
+                break
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired sessions in {batches} batches."))
@@ -0,0 +1,140 @@
+"""Write-behind persistence of logged-in users' carts to ``Profile.old_cart``.
+
+Cart edits only mark the request; ``CartPersistenceMiddleware`` serializes the
+final cart once when the response goes out. With ``CART_PERSIST_DELAY`` > 0
+the write is buffered for that many seconds so a burst of clicks across
+requests ends up as a single UPDATE per user.
+
+The buffer is per process, so a delay is only safe with a single worker: with
+several, a cart buffered in one worker can land after a newer write from
+another (``save_now`` only drops its own process's buffer), and a worker that
+is killed loses what it buffered. The default is 0.
+"""
+import atexit
+import json
+import threading
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db import connection
+
+from store.models import Profile
+
+
+def encode_cart(cart):
+    """Compact JSON for ``Profile.old_cart``; an empty cart is stored as ''."""
+    return json.dumps(cart, separators=(',', ':'), sort_keys=True) if cart else ''
+
+
+def decode_cart(text):
+    """Parse a saved cart into ``{product_id: quantity}``, ignoring bad data."""
+    if not text:
+        return {}
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    cart = {}
+    for key, value in data.items():
+        try:
+            cart[str(int(key))] = int(value)
+        except (TypeError, ValueError):
+            continue
+    return cart
+
+
+def _write(user_id, payload):
+    Profile.objects.filter(user_id=user_id).update(old_cart=payload)
+
+
+class WriteBehindBuffer():
+    """Latest pending cart per user, flushed by a timer ``delay`` seconds after the first put."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def put(self, user_id, payload, delay):
+        with self._lock:
+            self._pending[user_id] = payload
+            if self._timer is None:
+                self._timer = threading.Timer(delay, self._run)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def discard(self, user_id):
+        with self._lock:
+            self._pending.pop(user_id, None)
+
+    def flush(self, user_ids=None):
+        """Write pending carts now (all of them, or only ``user_ids``)."""
+        with self._lock:
+            if user_ids is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {uid: self._pending.pop(uid) for uid in user_ids if uid in self._pending}
+        for user_id, payload in batch.items():
+            _write(user_id, payload)
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # Timer threads get their own DB connection, don't leak it.
+            connection.close()
+
+
+buffer = WriteBehindBuffer()
+atexit.register(buffer.flush)
+
+
+def schedule(request, cart):
+    """Remember that ``cart`` must be persisted when this request finishes."""
+    request._cart_to_persist = cart
+
+
+def save_now(user_id, cart):
+    """Persist ``cart`` immediately, dropping any buffered state for the user."""
+    buffer.discard(user_id)
+    _write(user_id, encode_cart(cart))
+
+
+def flush_request(request):
+    cart = getattr(request, '_cart_to_persist', None)
+    if cart is None or not request.user.is_authenticated:
+        return
+    request._cart_to_persist = None
+    payload = encode_cart(cart)
+    delay = getattr(settings, 'CART_PERSIST_DELAY', 0)
+    if delay > 0:
+        buffer.put(request.user.id, payload, delay)
+    else:
+        _write(request.user.id, payload)
+
+
+def flush_on_logout(sender, request, user, **kwargs):
+    # Don't leave a buffered cart behind when the session ends.
+    if request is not None:
+        flush_request(request)
+    if user is not None:
+        buffer.flush([user.id])
+
+
+user_logged_out.connect(flush_on_logout)
+
+
+class CartPersistenceMiddleware:
+    """Write the request's final cart to the profile once, after the view ran."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        flush_request(request)
+        return response
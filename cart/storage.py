@@ -0,0 +1,119 @@
+"""Cart storage outside the database-backed session.
+
+Small carts live in a signed cookie using a compact ``id:qty.id:qty``
+encoding, so adding to the cart writes no database row at all. Carts too big
+for a cookie are kept in the ``carts`` cache and the cookie only carries a
+signed reference to them. Logged-in users' carts are additionally saved to
+``Profile.old_cart`` by cart.persistence.
+"""
+import secrets
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.core import signing
+from django.core.cache import caches
+
+COOKIE_NAME = 'cart'
+SALT = 'cart.storage'
+
+# Keep well below the ~4KB browser cookie limit
+MAX_COOKIE_VALUE = 2048
+
+# Prefix marking a cookie that references a cache entry instead of holding the cart
+CACHE_REF = '~'
+
+# Where carts lived before this module existed
+LEGACY_SESSION_KEY = 'session_key'
+
+
+def encode(cart):
+    return '.'.join(f'{product_id}:{quantity}' for product_id, quantity in cart.items())
+
+
+def decode(value):
+    cart = {}
+    for item in value.split('.') if value else ():
+        product_id, _, quantity = item.partition(':')
+        if product_id.isdigit() and quantity.isdigit():
+            cart[product_id] = int(quantity)
+    return cart
+
+
+class CartStore():
+    """Load and save one request's cart; the response cookie is set by CartStorageMiddleware."""
+
+    def __init__(self, request):
+        self.request = request
+        self.signer = signing.TimestampSigner(salt=SALT)
+        self.cache = caches[settings.CART_CACHE_ALIAS]
+        self.max_age = settings.CART_COOKIE_AGE
+        self.modified = False
+        self._cache_key = None
+
+    def load(self):
+        cart = None
+        raw = self.request.COOKIES.get(COOKIE_NAME)
+        if raw:
+            try:
+                value = self.signer.unsign(raw, max_age=self.max_age)
+            except signing.BadSignature:
+                value = ''
+            if value.startswith(CACHE_REF):
+                self._cache_key = value[len(CACHE_REF):]
+                cart = self.cache.get(self._cache_key)
+            else:
+                cart = decode(value)
+        if cart is None:
+            cart = {}
+            # Carry over a cart stored in the session by older versions
+            session = getattr(self.request, 'session', None)
+            if session is not None and LEGACY_SESSION_KEY in session:
+                cart = dict(session.pop(LEGACY_SESSION_KEY) or {})
+                self.modified = True
+        return cart
+
+    def save(self, cart, response):
+        if not cart:
+            if self._cache_key:
+                self.cache.delete(self._cache_key)
+            response.delete_cookie(COOKIE_NAME, samesite='Lax')
+            return
+        value = encode(cart)
+        if len(value) > MAX_COOKIE_VALUE:
+            self._cache_key = self._cache_key or secrets.token_urlsafe(16)
+            self.cache.set(self._cache_key, dict(cart), self.max_age)
+            value = CACHE_REF + self._cache_key
+        elif self._cache_key:
+            self.cache.delete(self._cache_key)
+        response.set_cookie(
+            COOKIE_NAME,
+            self.signer.sign(value),
+            max_age=self.max_age,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite='Lax',
+        )
+
+
+def clear_on_logout(sender, request, **kwargs):
+    # Logging out used to drop the session and the cart with it, keep it that way.
+    if request is not None:
+        from .cart import Cart
+        Cart.for_request(request).clear()
+
+
+user_logged_out.connect(clear_on_logout)
+
+
+class CartStorageMiddleware:
+    """Write the cart cookie when the request's cart changed."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cart = getattr(request, '_cart', None)
+        if cart is not None and cart.store.modified:
+            cart.store.save(cart.cart, response)
+        return response
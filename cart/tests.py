@@ -1,3 +1,71 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from ecom.testing import FakeAPI, QueryBudgetMixin, count_queries, make_products, set_cart
+from store import pricing
+from store.models import Category, Profile
+
+CART_SIZES = (1, 10, 100)
+
+
+@override_settings(CART_PERSIST_DELAY=0, OUTBOX_DISPATCH_ON_COMMIT=False, TRACE_SAMPLE_RATE=0)
+class CartQueryCountTests(QueryBudgetMixin, TestCase):
+    """Cart pages cost the same number of queries for 1 or 100 items."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes')
+        cls.products = make_products(max(CART_SIZES), category)
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw')
+
+    def setUp(self):
+        self.api = FakeAPI(self.products)
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+        pricing.invalidate()
+
+    def summary_queries(self, size):
+        set_cart(self.client, self.products[:size])
+        response, queries = count_queries(lambda: self.client.get(reverse('cart_summary')))
+        self.assertEqual(len(response.context['cart_lines']), size)
+        return queries
+
+    def test_cart_summary_guest(self):
+        self.assertConstantQueries(self.summary_queries, CART_SIZES, budget=0)
+
+    def test_cart_summary_logged_in(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(self.summary_queries, CART_SIZES, budget=2)
+
+    def test_cart_summary_priced_locally_when_api_is_down(self):
+        self.api.down = True
+        pricing.get_engine()
+        self.assertConstantQueries(self.summary_queries, CART_SIZES, budget=1)
+
+    def test_cart_summary_related_products(self):
+        last = self.products[-1]
+        self.api.related = {product.id: [last.id, self.products[0].id] for product in self.products}
+
+        def measure(size):
+            queries = self.summary_queries(size)
+            related = self.client.get(reverse('cart_summary')).context['related_products']
+            # One API call for the whole cart, products already in it left out
+            self.assertEqual([p['id'] for p in related], [last.id])
+            return queries
+
+        self.assertConstantQueries(measure, CART_SIZES[:2], budget=0)
+
+    def test_cart_update_saves_profile_once(self):
+        self.client.force_login(self.user)
+
+        def update_queries(size):
+            set_cart(self.client, self.products[:size])
+            response, queries = count_queries(lambda: self.client.post(reverse('cart_update'), {
+                'action': 'post', 'product_id': self.products[0].id, 'product_qty': 3,
+            }))
+            self.assertEqual(response.status_code, 200)
+            return queries
+
+        self.assertConstantQueries(update_queries, CART_SIZES, budget=3)
+        self.assertIn(f'"{self.products[0].id}":3', Profile.objects.get(user=self.user).old_cart)
@@ -3,17 +3,21 @@ from .cart import Cart
 from django.contrib import messages
 from store.models import Product
 from django.http import JsonResponse
+from ecom.backend import related_products
+from urllib.parse import urlencode
 
 def cart_summary(request):
-    cart = Cart(request)
-    cart_products = cart.get_prods
-    quantities = cart.get_quants
-    totals = cart.cart_total()
-    return render(request, 'cart_summary.html', {'cart_products':cart_products, 'quantities':quantities, 'totals':totals})
+    cart = Cart.for_request(request)
+    related = []
+    if cart.lines:
+        # "Customers also bought" for the whole cart, in one API call
+        ids = [line.product_id for line in cart.lines][:100]
+        related = related_products(f"/cart/related?{urlencode({'ids': ids}, doseq=True)}")
+    return render(request, 'cart_summary.html', {'cart_lines':cart.lines, 'totals':cart.total, 'related_products':related})
 
 def cart_add(request):
     #Get the Cart
-    cart = Cart(request)
+    cart = Cart.for_request(request)
     # test for Post
     if request.POST.get('action') == 'post':
         # Get stuff
@@ -33,7 +37,7 @@ def cart_add(request):
 
 
 def cart_delete(request):
-    cart = Cart(request)
+    cart = Cart.for_request(request)
     if request.POST.get('action') == 'post':
         # Get stuff
         product_id = int(request.POST.get('product_id'))
@@ -43,7 +47,7 @@ def cart_delete(request):
         return response
 
 def cart_update(request):
-    cart = Cart(request)
+    cart = Cart.for_request(request)
     if request.POST.get('action') == 'post':
         # Get stuff
         product_id = int(request.POST.get('product_id'))
@@ -0,0 +1,71 @@
+"""Small JSON client for the FastAPI service (``settings.FASTAPI_BASE_URL``)."""
+import contextvars
+import datetime
+import json
+from urllib.request import urlopen, Request
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from fastapi_app import tracing
+
+
+# Shopper the current request is served for (set by ecom.middleware.ForwardClientMiddleware).
+# Sent as X-Forwarded-For so the API rate-limits each shopper, not the whole storefront.
+client_ip = contextvars.ContextVar('api_client_ip', default=None)
+
+
+def get_json(path, timeout=5, headers=None):
+    req = Request(f"{settings.FASTAPI_BASE_URL}{path}", headers=headers or {})
+    return _send(req, path, timeout)
+
+
+def post_json(path, payload, timeout=10, headers=None):
+    req = Request(
+        f"{settings.FASTAPI_BASE_URL}{path}",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json', **(headers or {})},
+    )
+    return _send(req, path, timeout)
+
+
+def _send(req, path, timeout):
+    # Client span; the API continues the trace from the traceparent header
+    with tracing.child_span(f"HTTP {req.get_method()} {tracing.path_name(path.split('?')[0])}", 'client') as span:
+        header = tracing.traceparent()
+        if header:
+            req.add_header('traceparent', header)
+        ip = client_ip.get()
+        if ip:
+            req.add_header('X-Forwarded-For', ip)
+        with urlopen(req, timeout=timeout) as resp:
+            span.set(status=resp.status)
+            return json.loads(resp.read().decode())
+
+
+def normalize_product(p):
+    """Give an API product dict the ``image.url`` shape templates expect."""
+    img = p.get('image')
+    if img and not str(img).startswith(('http://', 'https://', settings.MEDIA_URL)):
+        p['image'] = {'url': f"{settings.MEDIA_URL}{img}"}
+    elif isinstance(img, str):
+        p['image'] = {'url': img}
+    return p
+
+
+def related_products(path, timeout=2):
+    """Products from a ``/related`` endpoint, or none if the API can't answer (they're optional)."""
+    try:
+        return [normalize_product(p) for p in get_json(path, timeout=timeout)]
+    except Exception:
+        return []
+
+
+def parse_api_datetime(value):
+    """API datetimes are naive UTC ISO strings; return an aware datetime (or None)."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is not None and parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
@@ -0,0 +1,66 @@
+"""Superuser-only profiling views for the Django workers (see fastapi_app/profiling.py).
+
+- Any page requested with ``X-Profile: 1`` by a superuser is profiled by
+  ``ProfileRequestMiddleware``; fetch it from ``debug/profile/<id>/`` using
+  the ``X-Profile-Id`` response header. Profiles are kept by the worker that
+  served the page, so with several gunicorn workers a fetch may need a retry.
+- ``debug/memory/`` shows heap growth since the baseline recorded with a
+  POST to ``debug/memory/baseline/`` (``debug/memory/stop/`` turns tracing off).
+
+There is no whole-worker profile on this side: gunicorn's sync workers serve
+one request at a time, so a view sampling "the worker" would only see itself
+sleeping (and a long one would hit the worker timeout). Use the API's
+``/debug/profile`` for that.
+"""
+from django.contrib.auth.decorators import user_passes_test
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+
+from fastapi_app import profiling
+
+superuser_required = user_passes_test(lambda u: u.is_active and u.is_superuser, login_url='admin:login')
+
+
+def _number(request, name, default, low, high):
+    try:
+        value = float(request.GET.get(name, default))
+    except ValueError:
+        value = default
+    return min(max(value, low), high)
+
+
+@require_GET
+@superuser_required
+def request_profile(request, profile_id):
+    collapsed = profiling.request_profiles.get(str(profile_id))
+    if collapsed is None:
+        raise Http404('Profile not found')
+    return HttpResponse(collapsed, content_type='text/plain')
+
+
+@require_GET
+@superuser_required
+def memory(request):
+    limit = int(_number(request, 'limit', 25, 1, 500))
+    key_type = request.GET.get('key_type', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        key_type = 'lineno'
+    try:
+        lines = profiling.memory_snapshots.diff(limit, key_type)
+    except RuntimeError as e:
+        return HttpResponse(str(e), status=409, content_type='text/plain')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain')
+
+
+@require_POST
+@superuser_required
+def memory_baseline(request):
+    frames = int(_number(request, 'frames', 10, 1, 100))
+    return JsonResponse(profiling.memory_snapshots.baseline(frames))
+
+
+@require_POST
+@superuser_required
+def memory_stop(request):
+    profiling.memory_snapshots.stop()
+    return JsonResponse(profiling.memory_snapshots.status())
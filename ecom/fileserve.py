@@ -0,0 +1,229 @@
+"""Zero-copy file serving for STATIC_ROOT and MEDIA_ROOT.
+
+Python never reads file bodies on the normal path:
+
+* with ``FILE_SERVE_ACCEL`` set, the response is an empty ``X-Accel-Redirect``
+  (nginx) or ``X-Sendfile`` (Apache/lighttpd) handoff to the front proxy;
+* otherwise full bodies go out through the WSGI server's ``wsgi.file_wrapper``,
+  which gunicorn implements with ``os.sendfile``.
+
+Byte ranges that can't be handed off are streamed with ``os.pread`` from a
+cached descriptor. Conditional requests (``If-None-Match``,
+``If-Modified-Since``, ``If-Range``) are answered from cached stat results
+without touching the file.
+"""
+import mimetypes
+import os
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FileEntry:
+    """Open descriptor plus the stat data needed to answer a request."""
+
+    __slots__ = ('path', 'fd', 'size', 'mtime', 'ino', 'etag', 'last_modified', 'content_type', 'checked_at')
+
+    def __init__(self, path, fd, stat):
+        self.path = path
+        self.fd = fd
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.ino = stat.st_ino
+        self.etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        self.last_modified = http_date(stat.st_mtime)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.checked_at = time.monotonic()
+
+    def matches(self, stat):
+        return (self.size, self.mtime, self.ino) == (stat.st_size, stat.st_mtime, stat.st_ino)
+
+    def __del__(self):
+        # Closed once neither the cache nor an in-flight response holds the entry.
+        _close(self.fd)
+
+
+class FileCache:
+    """LRU of open descriptors and stat results, keyed by absolute path.
+
+    Entries are re-stat'ed at most every ``ttl`` seconds, so a burst of
+    requests for the same image costs one ``stat`` and no ``open``.
+    """
+
+    def __init__(self, maxsize=512, ttl=2.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return the FileEntry for ``path`` or None when it is not a regular file."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+                if now - entry.checked_at < self.ttl:
+                    return entry
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._discard(path)
+            return None
+        if entry is not None and entry.matches(stat):
+            entry.checked_at = now
+            return entry
+        if not os.path.isfile(path):
+            self._discard(path)
+            return None
+        fd = os.open(path, os.O_RDONLY)
+        entry = FileEntry(path, fd, os.fstat(fd))
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _discard(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+
+
+def _close(fd):
+    try:
+        os.close(fd)
+    except OSError:
+        pass
+
+
+def _iter_range(entry, start, length):
+    # pread keeps no file offset, so concurrent requests can share the cached fd.
+    # Holding ``entry`` keeps the descriptor open even if the LRU evicts it meanwhile.
+    while length > 0:
+        chunk = os.pread(entry.fd, min(CHUNK_SIZE, length), start)
+        if not chunk:
+            break
+        start += len(chunk)
+        length -= len(chunk)
+        yield chunk
+
+
+def parse_range(header, size):
+    """Parse a single ``bytes=`` range into ``(start, end)`` (inclusive).
+
+    Returns None to serve the full body (absent, malformed or multi-range
+    header) and ``False`` when the range can't be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, sep, end = header[len('bytes='):].strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if start == '':
+            # Suffix range: the last N bytes.
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class FileServer:
+    """Serve files under ``root`` for URLs below ``url_prefix``."""
+
+    def __init__(self, root, url_prefix, accel=None, accel_prefix='/internal', cache=None):
+        self.root = os.path.realpath(root)
+        self.url_prefix = url_prefix
+        self.accel = accel
+        self.accel_prefix = accel_prefix.rstrip('/')
+        self.cache = cache or FileCache()
+
+    def resolve(self, name):
+        """Absolute path for the URL-relative ``name``, or None if it escapes ``root``."""
+        name = posixpath.normpath(name).lstrip('/')
+        if name.startswith('..') or '\x00' in name:
+            return None
+        return os.path.join(self.root, name)
+
+    def serve(self, request, name, path=None, content_type=None, headers=None):
+        """Build the response for ``name``; returns None if there is no such file.
+
+        ``path`` overrides the file that is actually sent (e.g. a ``.br``
+        sibling) while ``name`` stays the public name used for the handoff.
+        """
+        path = path or self.resolve(name)
+        entry = self.cache.get(path) if path else None
+        if entry is None:
+            return None
+
+        validators = {'ETag': entry.etag, 'Last-Modified': entry.last_modified}
+        if self._not_modified(request, entry):
+            response = HttpResponseNotModified()
+            return self._finish(response, validators, headers)
+
+        content_type = content_type or entry.content_type
+        if self.accel:
+            response = self._handoff(path, content_type)
+            return self._finish(response, validators, headers)
+
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range in (entry.etag, entry.last_modified):
+            byte_range = parse_range(request.headers.get('Range'), entry.size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{entry.size}'
+        elif byte_range is not None and byte_range != (0, entry.size - 1):
+            start, end = byte_range
+            body = [] if request.method == 'HEAD' else _iter_range(entry, start, end - start + 1)
+            response = StreamingHttpResponse(body, status=206, content_type=content_type)
+            response.headers['Content-Range'] = f'bytes {start}-{end}/{entry.size}'
+            response.headers['Content-Length'] = str(end - start + 1)
+        else:
+            # A fresh handle per response: sendfile uses the file offset, which a
+            # shared descriptor would race on.
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            del response.headers['Content-Disposition']
+        response.headers['Accept-Ranges'] = 'bytes'
+        return self._finish(response, validators, headers)
+
+    def _not_modified(self, request, entry):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            return '*' in tags or entry.etag in tags
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return since is not None and int(entry.mtime) <= since
+
+    def _handoff(self, path, content_type):
+        response = HttpResponse(content_type=content_type)
+        if self.accel == 'x-sendfile':
+            response.headers['X-Sendfile'] = path
+        else:
+            relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = f'{self.accel_prefix}{self.url_prefix}{relative}'
+        return response
+
+    def _finish(self, response, validators, headers):
+        for header, value in {**validators, **(headers or {})}.items():
+            response.headers[header] = value
+        return response
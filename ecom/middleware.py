@@ -0,0 +1,156 @@
+import os
+import posixpath
+import threading
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+from fastapi_app import profiling
+
+from . import backend
+from .fileserve import FileCache, FileServer
+
+# Hashed names never change content, so browsers may keep them for a year.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=300'
+
+# Preferred first.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# One descriptor/stat cache per process, shared by the static and media servers.
+file_cache = FileCache(maxsize=settings.FILE_SERVE_CACHE_SIZE)
+
+
+def accepted_encodings(header):
+    """Parse ``Accept-Encoding`` into ``{coding: q}`` (lowercase codings, ``*`` included)."""
+    codings = {}
+    for part in header.split(','):
+        coding, *params = [piece.strip() for piece in part.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.lower()] = q
+    return codings
+
+
+def _is_hashed_media(name):
+    # Image variants carry a content hash: <stem>.<hash>.<width>w.<ext> (see store.images)
+    return '/variants/' in name
+
+
+class StaticAssetMiddleware:
+    """Serve collected files from STATIC_ROOT before the rest of the stack runs.
+
+    Picks the precompressed ``.br`` / ``.gz`` sibling written by collectstatic
+    based on ``Accept-Encoding`` and marks hashed names as immutable.
+    Anything not found in STATIC_ROOT falls through to the normal handlers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server = FileServer(
+            settings.STATIC_ROOT, settings.STATIC_URL,
+            accel=settings.FILE_SERVE_ACCEL, accel_prefix=settings.FILE_SERVE_ACCEL_PREFIX, cache=file_cache,
+        )
+        immutable_names = getattr(staticfiles_storage, 'immutable_names', None)
+        self.immutable = immutable_names() if immutable_names else set()
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.server.url_prefix):
+            response = self.serve(request, request.path[len(self.server.url_prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        path = self.server.resolve(name)
+        # No original, no response: a stray .br/.gz sibling alone isn't served
+        entry = self.server.cache.get(path) if path else None
+        if entry is None:
+            return None
+
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        headers = {
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': (
+                IMMUTABLE_CACHE_CONTROL if posixpath.normpath(name) in self.immutable else DEFAULT_CACHE_CONTROL
+            ),
+        }
+        # Highest q first, our preference breaks ties; q=0 means "not acceptable"
+        candidates = sorted(
+            ((accepted.get(encoding, accepted.get('*', 0)), -rank, encoding, suffix)
+             for rank, (encoding, suffix) in enumerate(ENCODINGS)),
+            reverse=True,
+        )
+        for q, _, encoding, suffix in candidates:
+            if q > 0 and os.path.isfile(path + suffix):
+                headers['Content-Encoding'] = encoding
+                return self.server.serve(
+                    request, name, path=path + suffix, content_type=entry.content_type, headers=headers,
+                )
+        return self.server.serve(request, name, headers=headers)
+
+
+class MediaFileMiddleware:
+    """Serve uploads from MEDIA_ROOT through the zero-copy file server."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server = FileServer(
+            settings.MEDIA_ROOT, settings.MEDIA_URL,
+            accel=settings.FILE_SERVE_ACCEL, accel_prefix=settings.FILE_SERVE_ACCEL_PREFIX, cache=file_cache,
+        )
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.server.url_prefix):
+            name = request.path[len(self.server.url_prefix):]
+            cache_control = IMMUTABLE_CACHE_CONTROL if _is_hashed_media(name) else DEFAULT_CACHE_CONTROL
+            response = self.server.serve(request, name, headers={'Cache-Control': cache_control})
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+
+class ForwardClientMiddleware:
+    """Make API calls made while serving a request carry the shopper's address (see ecom.backend)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = backend.client_ip.set(request.META.get('REMOTE_ADDR'))
+        try:
+            return self.get_response(request)
+        finally:
+            backend.client_ip.reset(token)
+
+
+class ProfileRequestMiddleware:
+    """Profile a superuser's request sent with ``X-Profile: 1`` (see ecom.debug).
+
+    Only the thread serving the request is sampled, waits included, so time
+    spent blocked on the database or the API shows up too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.headers.get('X-Profile') != '1' or not request.user.is_superuser:
+            return self.get_response(request)
+        profile_id = profiling.request_profiles.new_id()
+        profiler = profiling.SamplingProfiler(0.001, thread_ids=[threading.get_ident()], include_idle=True).start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+            profiling.request_profiles.save(profile_id, f'{request.method} {request.path}', profiler)
+        response['X-Profile-Id'] = profile_id
+        return response
@@ -45,19 +45,27 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'ecom.middleware.StaticAssetMiddleware',
+    'ecom.middleware.MediaFileMiddleware',
+    'ecom.tracing.TracingMiddleware',
+    'ecom.middleware.ForwardClientMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ecom.middleware.ProfileRequestMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'cart.persistence.CartPersistenceMiddleware',
+    'cart.storage.CartStorageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ecom.tracing.ViewSpanMiddleware',
 ]
 
 ROOT_URLCONF = 'ecom.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'ecom.tracing.TracedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -121,14 +129,72 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = ['static/']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Hashed file names + .gz/.br siblings at collectstatic time (see ecom/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'ecom.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Static/media file serving (see ecom/fileserve.py).
+# 'x-accel-redirect' (nginx) or 'x-sendfile' hands the body to the front proxy;
+# unset, gunicorn sends it with os.sendfile.
+FILE_SERVE_ACCEL = os.environ.get('FILE_SERVE_ACCEL') or None
+FILE_SERVE_ACCEL_PREFIX = os.environ.get('FILE_SERVE_ACCEL_PREFIX', '/internal')
+FILE_SERVE_CACHE_SIZE = 512  # open descriptors + stat results kept per process
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Carts too large for the cart cookie (see cart/storage.py), shared by all workers on the host
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'carts',
+    },
+}
+
+CART_CACHE_ALIAS = 'carts'
+CART_COOKIE_AGE = 60 * 60 * 24 * 14  # two weeks, same as the session cookie
+
+# Seconds to buffer cart writes to Profile.old_cart (0 = once at the end of each request).
+# The buffer lives in one process: keep 0 with several gunicorn workers, or a stale buffered
+# cart from one worker can overwrite a newer write (e.g. the emptied cart after checkout)
+# from another, and a killed worker loses what it buffered.
+CART_PERSIST_DELAY = float(os.environ.get('CART_PERSIST_DELAY', 0))
+
 # FastAPI base URL (Django will fetch product/order data via this API)
 FASTAPI_BASE_URL = os.environ.get('FASTAPI_BASE_URL', 'http://127.0.0.1:8000')
+
+# Checkout outbox (payment/outbox.py): delivery to FastAPI happens after the response.
+# Start a dispatcher thread when an order commits; run `manage.py dispatch_outbox --loop` for retries.
+OUTBOX_DISPATCH_ON_COMMIT = os.environ.get('OUTBOX_DISPATCH_ON_COMMIT', '1') == '1'
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_MAX_ATTEMPTS = 8
+
+# Request tracing (fastapi_app/tracing.py): spans go to TRACE_DIR/django-<pid>.jsonl, rotated at 10 MB.
+# 1% of requests are traced; set TRACE_SAMPLE_RATE=1 to trace everything while investigating.
+# Summarize with `python -m fastapi_app.tracing --dir traces summarize`.
+TRACE_DIR = os.environ.get('TRACE_DIR', BASE_DIR / 'traces')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.01))
+
+# "Customers also bought" (store.RelatedProduct): neighbours kept per product, and the largest
+# order (distinct products) that counts. The API reads the same variables for its incremental updates.
+RELATED_KEEP = int(os.environ.get('RELATED_KEEP', 20))
+RELATED_MAX_BASKET = int(os.environ.get('RELATED_MAX_BASKET', 20))
@@ -0,0 +1,62 @@
+"""Static files storage: content-hashed names plus precompressed siblings.
+
+``collectstatic`` writes ``styles.<hash>.css`` together with ``styles.<hash>.css.gz``
+and ``styles.<hash>.css.br`` so the serving layer (``ecom.middleware``) never
+has to compress anything per request.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, .gz siblings are still produced
+    brotli = None
+
+# Already-compressed formats (images, fonts) gain nothing from gzip/brotli.
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico'}
+
+# Below this size the extra file is not worth a lookup.
+MIN_COMPRESS_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Templates keep rendering before collectstatic has been run (dev, tests).
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            # Missing file (not collected yet, or a dangling url() in a stylesheet):
+            # keep the plain name instead of failing the whole page or collectstatic.
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        """Write ``name.gz`` (and ``name.br`` when brotli is installed) if they are smaller."""
+        path = self.path(name)
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        encoded = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            encoded['.br'] = brotli.compress(data, quality=11)
+        for suffix, payload in encoded.items():
+            if len(payload) < len(data):
+                with open(path + suffix, 'wb') as fh:
+                    fh.write(payload)
+
+    def immutable_names(self):
+        """Names that carry a content hash and can be cached forever."""
+        return set(self.hashed_files.values())
@@ -0,0 +1,266 @@
+"""Test helpers: an in-memory stand-in for the FastAPI service and query counting.
+
+``FakeAPI`` answers the calls ``ecom.backend`` makes (``/items``,
+``/cart/price``, ``/orders``...) from data handed to it by the test, so views
+can be rendered without a running API and without the stand-in's own
+lookups showing up in the test's query counts.
+"""
+import io
+import json
+import os
+import re
+from decimal import Decimal
+from unittest import mock
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qs, urlsplit
+
+from django.core import signing
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from cart.storage import COOKIE_NAME, SALT, encode
+from store.models import Product
+
+
+def product_data(product):
+    """The API's product dict for a Product (sale price applied, no promotions)."""
+    price = product.sale_price if product.is_sale else product.price
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': str(product.price),
+        'category_id': product.category_id,
+        'description': product.description,
+        'image': product.image.name if product.image else None,
+        'is_sale': product.is_sale,
+        'sale_price': str(product.sale_price),
+        'effective_price': str(price),
+        'discounted': price < product.price,
+        'image_variants': product.image_variants or {},
+        'srcset': {},
+        'stock': product.stock,
+    }
+
+
+class _Response(io.BytesIO):
+    status = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeAPI:
+    """Replace ``ecom.backend.urlopen`` with in-memory routes.
+
+    Use as a context manager. ``down = True`` makes every call fail as if the
+    API were unreachable, to exercise the ORM fallbacks.
+
+    Attributes:
+        products: API product dicts by id
+        orders: API order dicts (with ``items``) by id
+        related: "Customers also bought" product ids by product id
+        reservations: Held quantities (product id -> quantity) by reservation key
+        categories: API category dicts (with counts) by slug
+        calls: ``(method, path)`` of every call made
+        headers: Headers of the last call
+        order_error: ``(status, detail)`` to refuse ``POST /orders`` with, e.g. a 409
+    """
+
+    def __init__(self, products=(), down=False):
+        self.products = {}
+        self.orders = {}
+        self.related = {}
+        self.reservations = {}
+        self.categories = {}
+        self.calls = []
+        self.headers = {}
+        self.order_error = None
+        self.down = down
+        self.add_products(products)
+        self._patch = mock.patch('ecom.backend.urlopen', self.urlopen)
+
+    def add_products(self, products):
+        for product in products:
+            self.products[product.id] = product_data(product)
+
+    def add_categories(self, categories):
+        """Serve ``/categories``, counting the products added so far."""
+        for category in categories:
+            products = [p for p in self.products.values() if p['category_id'] == category.id]
+            self.categories[category.slug] = {
+                'id': category.id,
+                'name': category.name,
+                'slug': category.slug,
+                'product_count': len(products),
+                'sale_count': sum(p['is_sale'] for p in products),
+            }
+
+    def add_order(self, order, items):
+        """Serve ``GET /orders/<id>`` for an Order and its OrderItems."""
+        self.orders[order.id] = {
+            'id': order.id,
+            'user_id': order.user_id,
+            'full_name': order.full_name,
+            'email': order.email,
+            'shipping_address': order.shipping_address,
+            'amount_paid': str(order.amount_paid),
+            'date_oredered': order.date_oredered.replace(tzinfo=None).isoformat(),
+            'shipped': order.shipped,
+            'date_shipped': None,
+            'items': [{
+                'id': item.id,
+                'product_id': item.product_id,
+                'quantity': item.quantity,
+                'price': str(item.price),
+                'product': self.products.get(item.product_id),
+            } for item in items],
+        }
+
+    def __enter__(self):
+        self._patch.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._patch.stop()
+
+    def urlopen(self, req, timeout=None):
+        url = req.full_url
+        path, query = urlsplit(url).path, parse_qs(urlsplit(url).query)
+        method = req.get_method()
+        self.calls.append((method, path))
+        self.headers = dict(req.header_items())
+        if self.down:
+            raise URLError('API down (FakeAPI)')
+        body = json.loads(req.data) if req.data else None
+
+        if method == 'GET' and path == '/items':
+            return self._json(url, list(self.products.values()))
+        match = re.fullmatch(r'/items/(\d+)', path)
+        if method == 'GET' and match:
+            return self._json(url, self.products.get(int(match.group(1))))
+        match = re.fullmatch(r'/items/(\d+)/related', path)
+        if method == 'GET' and match and int(match.group(1)) in self.products:
+            return self._json(url, self._related([int(match.group(1))]))
+        if method == 'GET' and path == '/cart/related':
+            return self._json(url, self._related([int(i) for i in query.get('ids', [])]))
+        if method == 'POST' and path == '/cart/price':
+            return self._json(url, self._price(body))
+        match = re.fullmatch(r'/orders/(\d+)', path)
+        if method == 'GET' and match:
+            return self._json(url, self.orders.get(int(match.group(1))))
+        if method == 'GET' and path == '/categories':
+            return self._json(url, sorted(self.categories.values(), key=lambda c: c['name']))
+        match = re.fullmatch(r'/categories/([-\w]+)/items', path)
+        if method == 'GET' and match:
+            return self._json(url, self._category_page(match.group(1), query))
+        if method == 'POST' and path == '/reservations':
+            return self._json(url, self._reserve(body))
+        if method == 'POST' and path == '/orders':
+            if self.order_error:
+                code, detail = self.order_error
+                raise HTTPError(url, code, 'Refused', {}, io.BytesIO(json.dumps({'detail': detail}).encode()))
+            order_id = max(self.orders, default=0) + 1
+            self.orders[order_id] = dict(body, id=order_id)
+            return self._json(url, {'message': 'Order created', 'order_id': order_id})
+        return self._json(url, None)
+
+    def _related(self, product_ids):
+        ids = []
+        for product_id in product_ids:
+            ids.extend(i for i in self.related.get(product_id, ()) if i not in product_ids and i not in ids)
+        return [self.products[i] for i in ids if i in self.products]
+
+    def _category_page(self, slug, query, limit=24):
+        category = self.categories.get(slug)
+        if category is None:
+            return None
+        after = int(query.get('after', ['0'])[0])
+        products = sorted(
+            (p for p in self.products.values() if p['category_id'] == category['id'] and p['id'] > after),
+            key=lambda p: p['id'],
+        )
+        return {'category': category, 'items': products[:limit],
+                'next_cursor': products[limit - 1]['id'] if len(products) > limit else None}
+
+    def _reserve(self, body):
+        # Stock isn't decremented here; lines over a product's stock are reported unavailable
+        held, unavailable = {}, []
+        for item in body['items']:
+            product = self.products.get(item['product_id'])
+            if product is None or (product['stock'] is not None and product['stock'] < item['quantity']):
+                unavailable.append(item['product_id'])
+            elif product['stock'] is not None:
+                held[item['product_id']] = item['quantity']
+        self.reservations[body['key']] = held
+        return {'key': body['key'], 'unavailable': unavailable, 'expires_at': '2030-01-01T00:00:00',
+                'reserved': [{'product_id': pid, 'quantity': qty} for pid, qty in held.items()]}
+
+    def _price(self, quantities):
+        lines, total, missing = [], Decimal('0.00'), []
+        for key, quantity in quantities.items():
+            product = self.products.get(int(key))
+            if product is None:
+                missing.append(int(key))
+                continue
+            unit = Decimal(product['effective_price'])
+            lines.append({
+                'product': dict(product),
+                'quantity': quantity,
+                'unit_price': str(unit),
+                'line_total': str(unit * quantity),
+            })
+            total += unit * quantity
+        return {'lines': lines, 'item_count': sum(line['quantity'] for line in lines),
+                'total': str(total), 'missing': missing}
+
+    def _json(self, url, data):
+        if data is None:
+            raise HTTPError(url, 404, 'Not Found', {}, io.BytesIO(b'{"detail": "Not found"}'))
+        return _Response(json.dumps(data).encode())
+
+
+def make_products(count, category, prefix='Product'):
+    """Create ``count`` products in one INSERT (no save signals) and return them."""
+    Product.objects.bulk_create(
+        Product(name=f'{prefix} {i:04d}', price=Decimal('10.00') + i, category=category, image='uploads/product/x.jpg')
+        for i in range(count)
+    )
+    return list(Product.objects.filter(name__startswith=prefix).order_by('id'))
+
+
+def count_queries(func):
+    """Run ``func`` and return ``(result, number of queries it ran)``."""
+    with CaptureQueriesContext(connection) as queries:
+        result = func()
+    return result, len(queries)
+
+
+def set_cart(client, products, quantity=1):
+    """Put ``products`` in the test client's cart cookie."""
+    cart = {str(product.id): quantity for product in products}
+    client.cookies[COOKIE_NAME] = signing.TimestampSigner(salt=SALT).sign(encode(cart))
+
+
+class QueryBudgetMixin:
+    """``assertConstantQueries``: the same number of queries at every data size."""
+
+    def assertConstantQueries(self, measure, sizes, budget):
+        """
+        Fail if the query count changes with the data size or goes over ``budget``.
+
+        ``measure(size)`` sets up ``size`` rows and returns the query count of
+        the request under test. Run with ``SHOW_QUERY_COUNTS=1`` to print the
+        counts when adjusting a budget.
+        """
+        counts = {size: measure(size) for size in sizes}
+        if os.environ.get('SHOW_QUERY_COUNTS'):
+            print(f'{self.id()}: {counts}')
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f'Query count grows with the data (N+1?): {counts}',
+        )
+        self.assertLessEqual(max(counts.values()), budget, f'Query budget of {budget} exceeded: {counts}')
+        return counts
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .middleware import StaticAssetMiddleware, accepted_encodings
+
+
+class StaticAssetMiddlewareTests(SimpleTestCase):
+    """Precompressed siblings are picked from STATIC_ROOT by Accept-Encoding."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.write('app.css', b'body{}')
+        self.write('app.css.br', b'br')
+        self.write('app.css.gz', b'gz')
+        with override_settings(STATIC_ROOT=self.root):
+            self.middleware = StaticAssetMiddleware(lambda request: HttpResponse('fallback', status=404))
+
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), 'wb') as f:
+            f.write(content)
+
+    def get(self, name, accept_encoding=''):
+        request = RequestFactory().get(f'/static/{name}', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return self.middleware(request)
+
+    def test_compressed_sibling(self):
+        response = self.get('app.css', 'gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Content-Type'], 'text/css')
+
+    def test_sibling_without_original(self):
+        os.remove(os.path.join(self.root, 'app.css'))
+        response = self.get('app.css', 'br')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content, b'fallback')
+
+    def test_refused_encodings(self):
+        response = self.get('app.css', 'br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        response = self.get('app.css', 'gzip;q=0, brotli')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.get('app.css', '*;q=0.5, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        response = self.get('app.css', '*, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('GZIP; q=0.5, br;q=0, identity'), {'gzip': 0.5, 'br': 0.0, 'identity': 1.0})
+        self.assertEqual(accepted_encodings(''), {})
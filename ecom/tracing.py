@@ -0,0 +1,81 @@
+"""Django side of request tracing (see fastapi_app/tracing.py).
+
+``TracingMiddleware`` opens the request span, continues an incoming
+``traceparent`` and records every ORM query; ``ViewSpanMiddleware`` (last in
+MIDDLEWARE) times the view itself; ``TracedDjangoTemplates`` times template
+renders. Calls to the API through ``ecom.backend`` get client spans and
+forward the trace.
+"""
+from django.conf import settings
+from django.db import connection
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from fastapi_app import tracing
+
+
+def trace_sql(execute, sql, params, many, context):
+    # connection.execute_wrapper hook
+    with tracing.child_span(tracing.sql_span_name(sql), 'sql', attrs={'sql': sql[:tracing.SQL_MAX_LENGTH]}):
+        return execute(sql, params, many, context)
+
+
+class TracingMiddleware:
+    """Request span named after the URL route, with the trace id in an ``X-Trace-Id`` header."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        tracing.configure(service='django', directory=settings.TRACE_DIR, sample_rate=settings.TRACE_SAMPLE_RATE)
+
+    def __call__(self, request):
+        parent = tracing.parse_traceparent(request.headers.get('traceparent'))
+        span = tracing.start_span(f'{request.method} {tracing.path_name(request.path)}', 'server', parent=parent)
+        try:
+            with connection.execute_wrapper(trace_sql):
+                response = self.get_response(request)
+            span.set(status=response.status_code)
+            response['X-Trace-Id'] = span.trace_id
+            return response
+        finally:
+            match = getattr(request, 'resolver_match', None)
+            if match is not None and match.route:
+                span.name = f'{request.method} /{match.route}'
+            span.end()
+
+
+class ViewSpanMiddleware:
+    """Time the view alone; keep it last in MIDDLEWARE so nothing else runs inside the span."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            span = getattr(request, '_view_span', None)
+            if span is not None:
+                span.end()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = f'{view_func.__module__}.{getattr(view_func, "__name__", type(view_func).__name__)}'
+        request._view_span = tracing.child_span(f'view {name}', 'view')
+
+
+class TracedTemplate(Template):
+    def render(self, context=None, request=None):
+        with tracing.child_span(f'template {self.template.origin.template_name}', 'template'):
+            return super().render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with a span per top-level render."""
+
+    def from_string(self, template_code):
+        return TracedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TracedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
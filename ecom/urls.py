@@ -1,11 +1,15 @@
 from django.contrib import admin
 from django.urls import path, include
-from . import settings
-from django.conf.urls.static import static
+from . import debug
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('store.urls')),
     path('cart/', include('cart.urls')),
     path('payment/', include('payment.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('debug/profile/<int:profile_id>/', debug.request_profile, name='debug_request_profile'),
+    path('debug/memory/', debug.memory, name='debug_memory'),
+    path('debug/memory/baseline/', debug.memory_baseline, name='debug_memory_baseline'),
+    path('debug/memory/stop/', debug.memory_stop, name='debug_memory_stop'),
+]
+# Media files are served by ecom.middleware.MediaFileMiddleware
@@ -0,0 +1,312 @@
+"""Admission control for the API: concurrency limits, priorities and rate limits.
+
+Every request is put in a route class (checkout, orders, catalog,
+analytics). Before it reaches the threadpool it must
+
+1. get a token from its client's bucket for that class, else ``429``;
+2. get a concurrency slot. Slots are handed out by priority (checkout
+   first), each class has its own cap, and ``ADMISSION_CHECKOUT_RESERVE``
+   slots are kept for checkout only. A request that would wait longer
+   than its class allows is turned away with ``503`` right away instead
+   of queueing until it times out.
+
+Both rejections carry ``Retry-After``. The Django outbox already retries
+429/503, so a shed checkout is delivered later, not lost.
+
+Nearly every call comes from the Django containers, so buckets are kept per
+shopper, not per peer: ``ecom.backend`` forwards the shopper's address in
+``X-Forwarded-For`` and the Django peers are listed in
+``ADMISSION_TRUSTED_PROXIES``. A trusted peer calling on nobody's behalf
+(the outbox, management commands) skips the buckets and is only subject to
+the concurrency slots.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+# Stay under the threadpool size (40) so admitted requests don't queue again in there
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "32"))
+ADMISSION_CHECKOUT_RESERVE = int(os.environ.get("ADMISSION_CHECKOUT_RESERVE", "8"))
+# Peers allowed to tell us the real client in X-Forwarded-For (e.g. the Django web container)
+ADMISSION_TRUSTED_PROXIES = {
+    ip.strip() for ip in os.environ.get("ADMISSION_TRUSTED_PROXIES", "").split(",") if ip.strip()
+}
+ADMISSION_MAX_CLIENTS = 10000
+
+# Long-lived or trivial routes that never wait (and the admin-only /debug/ endpoints)
+EXEMPT_PATHS = {"/", "/health", "/orders/events", "/docs", "/redoc", "/openapi.json"}
+
+
+class RouteClass:
+    """Limits shared by a group of routes.
+
+    Attributes:
+        name: Class name
+        priority: Lower is served first
+        max_concurrency: Requests of this class running at once
+        max_wait: Longest a request may wait for a slot, in seconds
+        rate: Requests per second per client
+        burst: Bucket size per client
+    """
+
+    def __init__(self, name: str, priority: int, max_concurrency: int, max_wait: float, rate: float, burst: int):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.rate = rate
+        self.burst = burst
+
+
+CHECKOUT = RouteClass("checkout", 0, 24, 5.0, rate=5, burst=20)
+ORDERS = RouteClass("orders", 1, 8, 1.0, rate=20, burst=40)
+CATALOG = RouteClass("catalog", 2, 16, 0.5, rate=50, burst=100)
+ANALYTICS = RouteClass("analytics", 3, 4, 0.25, rate=2, burst=5)
+ROUTE_CLASSES = (CHECKOUT, ORDERS, CATALOG, ANALYTICS)
+
+
+def classify(method: str, path: str) -> Optional[RouteClass]:
+    """
+    Pick the route class of a request.
+
+    Args:
+        method: HTTP method
+        path: Request path
+
+    Returns:
+        Optional[RouteClass]: The class, or None for exempt routes
+    """
+    if path in EXEMPT_PATHS or path.startswith("/debug/"):
+        return None
+    if method == "POST" and path in ("/orders", "/reservations"):
+        return CHECKOUT
+    if path.startswith(("/ecom/", "/sales")):
+        return ANALYTICS
+    if path.startswith(("/items", "/cart/", "/categories")):
+        return CATALOG
+    return ORDERS
+
+
+class ClientBuckets:
+    """Token buckets per (client, route class), least recently seen clients evicted first."""
+
+    def __init__(self, max_clients: int = ADMISSION_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+
+    def take(self, client: str, route_class: RouteClass, now: Optional[float] = None) -> float:
+        """
+        Spend one token.
+
+        Args:
+            client: Client address
+            route_class: Class of the request
+            now: Monotonic time, for tests
+
+        Returns:
+            float: 0 if the request may go ahead, else seconds until a token is available
+        """
+        now = time.monotonic() if now is None else now
+        key = (client, route_class.name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(route_class.burst), now]
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        tokens, updated = bucket
+        tokens = min(route_class.burst, tokens + (now - updated) * route_class.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / route_class.rate
+
+
+class AdmissionController:
+    """Hands out concurrency slots by priority. Used from the event loop only, so no locks.
+
+    Attributes:
+        active: Running requests per class name
+        waiting: Queued requests per class name
+        service_time: Moving average of request duration per class name, in seconds
+    """
+
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+                 checkout_reserve: int = ADMISSION_CHECKOUT_RESERVE):
+        self.max_concurrency = max_concurrency
+        self.checkout_reserve = min(checkout_reserve, max_concurrency - 1)
+        self.active: Dict[str, int] = {c.name: 0 for c in ROUTE_CLASSES}
+        self.waiting: Dict[str, int] = {c.name: 0 for c in ROUTE_CLASSES}
+        self.service_time: Dict[str, float] = {c.name: 0.05 for c in ROUTE_CLASSES}
+        self.total = 0
+        self._waiters: list = []
+        self._seq = itertools.count()
+
+    def _can_run(self, route_class: RouteClass) -> bool:
+        if self.active[route_class.name] >= route_class.max_concurrency:
+            return False
+        limit = self.max_concurrency
+        if route_class is not CHECKOUT:
+            limit -= self.checkout_reserve
+        return self.total < limit
+
+    def _queued_ahead(self, route_class: RouteClass) -> int:
+        return sum(self.waiting[c.name] for c in ROUTE_CLASSES if c.priority <= route_class.priority)
+
+    def expected_wait(self, route_class: RouteClass) -> float:
+        """
+        Rough time a new request of this class would wait for a slot.
+
+        Args:
+            route_class: Class of the request
+
+        Returns:
+            float: Seconds
+        """
+        ahead = self._queued_ahead(route_class) + 1
+        return ahead / route_class.max_concurrency * self.service_time[route_class.name]
+
+    async def acquire(self, route_class: RouteClass) -> bool:
+        """
+        Wait for a slot, at most ``route_class.max_wait`` seconds.
+
+        Args:
+            route_class: Class of the request
+
+        Returns:
+            bool: True if the request holds a slot (call ``release``), False if it was shed
+        """
+        if not self._queued_ahead(route_class) and self._can_run(route_class):
+            self._take(route_class)
+            return True
+        if self.expected_wait(route_class) > route_class.max_wait:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (route_class.priority, next(self._seq), route_class, future))
+        self.waiting[route_class.name] += 1
+        try:
+            await asyncio.wait_for(future, route_class.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            # The slot may have been granted as the timer fired
+            return future.done() and not future.cancelled()
+        except asyncio.CancelledError:
+            # Client went away; give back a slot granted just before
+            if future.done() and not future.cancelled():
+                self.release(route_class, 0.0)
+            raise
+        finally:
+            self.waiting[route_class.name] -= 1
+
+    def release(self, route_class: RouteClass, duration: float) -> None:
+        """
+        Give a slot back and start the next eligible waiters.
+
+        Args:
+            route_class: Class of the finished request
+            duration: How long it ran, in seconds
+        """
+        self.active[route_class.name] -= 1
+        self.total -= 1
+        if duration:
+            average = self.service_time[route_class.name]
+            self.service_time[route_class.name] = 0.8 * average + 0.2 * duration
+        self._wake()
+
+    def _take(self, route_class: RouteClass) -> None:
+        self.active[route_class.name] += 1
+        self.total += 1
+
+    def _wake(self) -> None:
+        blocked = []
+        while self._waiters and self.total < self.max_concurrency:
+            entry = heapq.heappop(self._waiters)
+            route_class, future = entry[2], entry[3]
+            if future.done():
+                continue
+            if self._can_run(route_class):
+                self._take(route_class)
+                future.set_result(None)
+            else:
+                # Its class is at its cap, let lower priorities through meanwhile
+                blocked.append(entry)
+        for entry in blocked:
+            heapq.heappush(self._waiters, entry)
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware applying ``ClientBuckets`` and ``AdmissionController`` to HTTP requests."""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None,
+                 buckets: Optional[ClientBuckets] = None):
+        self.app = app
+        self.controller = controller or AdmissionController()
+        self.buckets = buckets or ClientBuckets()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class = classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        client = client_address(scope)
+        wait = self.buckets.take(client, route_class) if client is not None else 0.0
+        if wait:
+            await _reject(send, 429, "Too many requests", wait)
+            return
+        if not await self.controller.acquire(route_class):
+            await _reject(send, 503, "Server busy, try again shortly", route_class.max_wait)
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class, time.monotonic() - started)
+
+
+def client_address(scope) -> Optional[str]:
+    """
+    The client a request is accounted to.
+
+    Args:
+        scope: ASGI scope
+
+    Returns:
+        Optional[str]: Peer address, or the first X-Forwarded-For hop when the
+        peer is a trusted proxy; None for a trusted proxy calling on its own behalf
+    """
+    peer = scope.get("client")
+    host = peer[0] if peer else "unknown"
+    if host not in ADMISSION_TRUSTED_PROXIES:
+        return host
+    for name, value in scope.get("headers", ()):
+        if name == b"x-forwarded-for":
+            return value.decode("latin-1").split(",")[0].strip() or None
+    return None
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
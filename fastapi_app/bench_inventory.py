@@ -0,0 +1,124 @@
+"""Flash-sale benchmark: thousands of buyers racing for a product with little stock.
+
+Runs ``add_order`` from many threads against a scratch SQLite database (the
+real one is never touched) and checks that exactly ``--stock`` units were
+sold. Each run is done with the sold-out gate on and off, to show what
+turning late buyers away before the write lock saves::
+
+    python -m fastapi_app.bench_inventory --buyers 5000 --stock 100 --threads 32
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from . import inventory, models
+from .catalog import catalog_cache
+from .database import Base
+from .main import OrderIn, add_order
+
+
+def _setup(path: str, stock: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        db.add(models.Category(id=1, name="Shoes", slug="shoes"))
+        db.add(models.Product(id=1, name="Limited sneaker", price=200, category_id=1, stock=stock))
+        db.add(models.Product(id=2, name="Socks", price=5, category_id=1))  # not stock-tracked
+        db.commit()
+    return engine, Session
+
+
+def run(buyers: int, stock: int, threads: int, gate: bool) -> dict:
+    """
+    Race ``buyers`` single-unit orders for a product with ``stock`` units.
+
+    Args:
+        buyers: Number of orders
+        stock: Units on sale
+        threads: Orders in flight at once
+        gate: Use the sold-out gate
+
+    Returns:
+        dict: Outcome counts, latencies and the final stock
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = _setup(os.path.join(tmp, "bench.sqlite3"), stock)
+        inventory.sold_out_gate.clear([1])
+        inventory.sold_out_gate.ttl = inventory.SOLD_OUT_TTL if gate else 0
+        catalog_cache.invalidate()
+        outcomes = {"sold": 0, "sold_out": 0, "errors": 0}
+        latencies = []
+        lock = threading.Lock()
+
+        def buy(i: int) -> None:
+            items = [{"product_id": 1, "quantity": 1}]
+            if i % 4 == 0:
+                items.append({"product_id": 2, "quantity": 2})
+            order = OrderIn(full_name=f"Buyer {i}", email=f"buyer{i}@example.com",
+                            shipping_address="1 Main St", items=items)
+            started = time.perf_counter()
+            with Session() as db:
+                try:
+                    add_order(order, idempotency_key=None, db=db)
+                    outcome = "sold"
+                except HTTPException:
+                    outcome = "sold_out"
+                except OperationalError:
+                    db.rollback()
+                    outcome = "errors"  # database is locked past the busy timeout
+            elapsed = time.perf_counter() - started
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(elapsed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(buy, range(buyers)))
+        elapsed = time.perf_counter() - started
+
+        with Session() as db:
+            left = db.get(models.Product, 1).stock
+            orders = db.scalar(select(func.count()).select_from(models.PaymentOrder))
+        engine.dispose()
+
+    latencies.sort()
+    return {
+        **outcomes,
+        "orders": orders,
+        "stock_left": left,
+        "seconds": elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=5000)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+
+    for gate in (True, False):
+        result = run(args.buyers, args.stock, args.threads, gate)
+        oversold = result["sold"] > args.stock or result["stock_left"] != args.stock - result["sold"]
+        print(
+            f"gate={'on ' if gate else 'off'} sold={result['sold']} sold_out={result['sold_out']} "
+            f"errors={result['errors']} orders={result['orders']} stock_left={result['stock_left']} "
+            f"{args.buyers / result['seconds']:.0f} orders/s p50={result['p50_ms']:.1f}ms "
+            f"p99={result['p99_ms']:.1f}ms{'  OVERSOLD' if oversold else ''}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""In-process product catalog cache shared by the read and pricing endpoints."""
+import os
+import threading
+import time
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+from . import models
+from .pricing import PricingEngine, active_promotions, from_cents, pricing_key, to_cents
+
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL", "30"))
+
+
+class Catalog:
+    """Immutable snapshot of ``store_product`` and the active promotions.
+
+    Every product gets ``effective_price`` and ``discounted`` attributes from
+    the pricing engine, so list pages need no per-product pricing.
+
+    Attributes:
+        products: All products, ordered by id
+        by_id: Products indexed by id
+        by_category: Products of each category id, ordered by id
+        promotions: Promotions active when the snapshot was loaded
+        engine: Compiled pricing engine
+        pricing_key: Inputs ``engine`` was compiled from
+        version: Increases every time a new snapshot is loaded
+    """
+
+    def __init__(self, products: List[models.Product], promotions: list,
+                 engine: PricingEngine, key: tuple, version: int):
+        self.products = products
+        self.by_id: Dict[int, models.Product] = {p.id: p for p in products}
+        self.by_category: Dict[int, List[models.Product]] = {}
+        for product in products:
+            self.by_category.setdefault(product.category_id, []).append(product)
+        self.promotions = promotions
+        self.engine = engine
+        self.pricing_key = key
+        self.version = version
+        if products:
+            effective = engine.unit_prices([p.id for p in products]).tolist()
+            for product, cents in zip(products, effective):
+                product.effective_price = from_cents(cents)
+                product.discounted = cents < to_cents(product.price)
+
+
+class CatalogCache:
+    """
+    Load the catalog at most once every ``ttl`` seconds.
+
+    Readers always get a complete snapshot; only one thread reloads it. The
+    pricing engine is only recompiled when prices or promotions changed.
+    """
+
+    def __init__(self, ttl: float = CATALOG_TTL):
+        self.ttl = ttl
+        self._catalog: Catalog | None = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> Catalog:
+        """
+        Return the current snapshot, reloading it when it has expired.
+
+        Args:
+            db: Database session used for a reload
+
+        Returns:
+            Catalog: Current catalog snapshot
+        """
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return catalog
+        with self._lock:
+            if self._catalog is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._reload(db)
+            return self._catalog
+
+    def invalidate(self) -> None:
+        """Force a reload on the next ``get``."""
+        self._loaded_at = 0.0
+
+    def _reload(self, db: Session) -> None:
+        products = db.query(models.Product).order_by(models.Product.id).all()
+        promotions = active_promotions(db.query(models.Promotion).all())
+        # Detach the rows so the snapshot outlives the request's session.
+        for row in (*products, *promotions):
+            db.expunge(row)
+        key = pricing_key(products, promotions)
+        previous = self._catalog
+        if previous is not None and previous.pricing_key == key:
+            engine = previous.engine
+        else:
+            engine = PricingEngine(products, promotions)
+        self._version += 1
+        self._catalog = Catalog(products, promotions, engine, key, self._version)
+        self._loaded_at = time.monotonic()
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,146 @@
+"""In-process broadcaster for the ``GET /orders/events`` Server-Sent Events feed.
+
+The order endpoints publish an event after each commit. Every subscriber has
+its own bounded asyncio queue, so one slow dashboard can't hold up the
+others, and the last ``ORDER_EVENTS_BUFFER`` events are kept in a ring buffer
+so a client that reconnects with ``Last-Event-ID`` gets what it missed.
+
+Event ids are only meaningful within one process: run a single API worker
+(or pin dashboards to one) for the feed to see every change.
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from typing import List, Optional
+
+ORDER_EVENTS_BUFFER = int(os.environ.get("ORDER_EVENTS_BUFFER", "1000"))
+ORDER_EVENTS_QUEUE_SIZE = int(os.environ.get("ORDER_EVENTS_QUEUE_SIZE", "256"))
+
+CREATED = "created"
+UPDATED = "updated"
+SHIPPED = "shipped"
+DELETED = "deleted"
+# Sent instead of a replay when the requested events are no longer buffered
+RESET = "reset"
+
+
+class Event:
+    """One order change."""
+
+    __slots__ = ("id", "kind", "data")
+
+    def __init__(self, event_id: int, kind: str, data: dict):
+        self.id = event_id
+        self.kind = kind
+        self.data = data
+
+    def encode(self) -> str:
+        """
+        Format the event as an SSE message.
+
+        Returns:
+            str: ``id``/``event``/``data`` lines followed by a blank line
+        """
+        data = json.dumps(self.data, separators=(",", ":"), default=str)
+        return f"id: {self.id}\nevent: {self.kind}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """A subscriber's queue; ``None`` in the queue means the stream must end."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Optional[Event]]" = asyncio.Queue(maxsize)
+
+    def push(self, event: Event) -> None:
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: end the stream, the client resumes from the ring buffer
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class OrderEventBroadcaster:
+    """Fan order events out to every subscriber in the process.
+
+    ``publish`` is thread-safe: the order endpoints are sync and run in the
+    threadpool, subscribers live on the event loop.
+    """
+
+    def __init__(self, buffer_size: int = ORDER_EVENTS_BUFFER, queue_size: int = ORDER_EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._buffer: "deque[Event]" = deque(maxlen=buffer_size)
+        self._subscribers: set = set()
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def publish(self, kind: str, data: dict) -> Event:
+        """
+        Record an event and hand it to every subscriber.
+
+        Args:
+            kind: Event type (created, updated, shipped, deleted)
+            data: JSON-compatible payload, always with the order ``id``
+
+        Returns:
+            Event: The published event
+        """
+        with self._lock:
+            self._last_id += 1
+            event = Event(self._last_id, kind, data)
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:
+                # Its event loop is gone
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> tuple:
+        """
+        Register a subscriber on the running event loop.
+
+        Args:
+            last_event_id: ``Last-Event-ID`` sent by a reconnecting client
+
+        Returns:
+            tuple: The Subscription and the buffered events it missed
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            # Under the lock so no event falls between the backlog and the queue
+            backlog = self._since(last_event_id)
+            self._subscribers.add(subscription)
+        return subscription, backlog
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop delivering events to a subscriber."""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _since(self, last_event_id: Optional[str]) -> List[Event]:
+        if last_event_id is None:
+            return []
+        try:
+            seen = int(last_event_id)
+        except ValueError:
+            seen = -1
+        oldest = self._buffer[0].id if self._buffer else self._last_id + 1
+        if seen > self._last_id or seen < oldest - 1:
+            # Events were dropped from the buffer (or the server restarted): the client has to reload
+            return [Event(self._last_id, RESET, {"last_event_id": last_event_id})]
+        return [event for event in self._buffer if event.id > seen]
+
+
+broadcaster = OrderEventBroadcaster()
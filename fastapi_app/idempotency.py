@@ -0,0 +1,151 @@
+"""Idempotency-Key support for ``POST /orders``.
+
+The first request with a key stores ``(key, request hash, order_id,
+response)`` in ``payment_idempotencykey`` inside the order's own
+transaction. Retries with the same key get the stored response back instead
+of a second order. A bounded in-process LRU sits in front of the table so hot
+retries are answered without touching the database.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from . import models
+
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+# (request hash, response body)
+Stored = Tuple[str, dict]
+
+
+class ReplayCache:
+    """Thread-safe LRU of recently stored idempotent responses."""
+
+    def __init__(self, maxsize: int = IDEMPOTENCY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Stored]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Stored]:
+        """
+        Look up a key, marking it as recently used.
+
+        Args:
+            key: Idempotency key
+
+        Returns:
+            Optional[Stored]: Request hash and response, or None
+        """
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is not None:
+                self._entries.move_to_end(key)
+            return stored
+
+    def put(self, key: str, stored: Stored) -> None:
+        """
+        Remember a response, evicting the least recently used one when full.
+
+        Args:
+            key: Idempotency key
+            stored: Request hash and response
+        """
+        with self._lock:
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        with self._lock:
+            self._entries.clear()
+
+
+replay_cache = ReplayCache()
+
+
+def request_hash(payload: dict) -> str:
+    """
+    Fingerprint a request body so a reused key with a different body is caught.
+
+    Args:
+        payload: JSON-compatible request body
+
+    Returns:
+        str: SHA-256 hex digest of the canonical JSON
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def lookup(db: Session, key: str, use_cache: bool = True) -> Optional[Stored]:
+    """
+    Find the stored response for a key, in the LRU first, then in the table.
+
+    Args:
+        db: Database session
+        key: Idempotency key
+        use_cache: False to go straight to the table
+
+    Returns:
+        Optional[Stored]: Request hash and response, or None for a new key
+    """
+    if use_cache:
+        stored = replay_cache.get(key)
+        if stored is not None:
+            return stored
+    row = db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).first()
+    if row is None:
+        return None
+    stored = (row.request_hash, row.response)
+    replay_cache.put(key, stored)
+    return stored
+
+
+def replay(stored: Stored, fingerprint: str) -> dict:
+    """
+    Return the original response for a duplicate request.
+
+    Args:
+        stored: Request hash and response saved for the key
+        fingerprint: Hash of the current request
+
+    Returns:
+        dict: The response of the first request
+
+    Raises:
+        HTTPException: 422 if the key was used for a different request
+    """
+    original_hash, response = stored
+    if original_hash != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request"
+        )
+    return response
+
+
+def record(db: Session, key: str, fingerprint: str, order_id: int, response: dict) -> None:
+    """
+    Add the key row to the current transaction; it commits with the order.
+
+    Args:
+        db: Database session holding the new order
+        key: Idempotency key
+        fingerprint: Hash of the request
+        order_id: ID of the created order
+        response: Response body to replay
+    """
+    db.add(models.IdempotencyKey(
+        key=key,
+        request_hash=fingerprint,
+        order_id=order_id,
+        response=response,
+    ))
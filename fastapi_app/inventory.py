@@ -0,0 +1,245 @@
+"""Stock levels: conditional decrements at checkout and short-lived cart reservations.
+
+``store_product.stock`` is NULL for products that aren't stock-tracked.
+For tracked ones, every write is a single set-based statement:
+
+* ``take`` decrements all lines of an order with one
+  ``UPDATE ... SET stock = stock - qty WHERE stock >= qty`` inside the order's
+  transaction. A line missing from ``RETURNING`` didn't have the units, and
+  the caller rolls the whole order back, so stock never goes below zero and
+  never needs a read-then-write.
+* ``reserve`` takes the units off ``stock`` the same way when a shopper
+  reaches billing and records them in ``store_stockreservation``. The order
+  claims its reservation with ``DELETE ... RETURNING``, so a reservation is
+  used up exactly once, whether by the order or by the expiry sweep.
+
+SQLite serialises writers on one database lock, so for a hot product the
+cost is not row locks but every buyer queueing for that lock. ``SoldOutGate``
+remembers products that just sold out and turns later orders for them away
+before they open a write transaction.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, insert, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+RESERVATION_TTL = int(os.environ.get("RESERVATION_TTL", "600"))
+RESERVATION_MAX_TTL = 3600
+RESERVATION_SWEEP_INTERVAL = float(os.environ.get("RESERVATION_SWEEP_INTERVAL", "5"))
+# How long a product stays gated after selling out (picks up restocks made outside the API)
+SOLD_OUT_TTL = float(os.environ.get("SOLD_OUT_TTL", "5"))
+
+_products = models.Product.__table__
+_reservations = models.StockReservation.__table__
+
+
+class SoldOut(Exception):
+    """Some lines of an order don't have enough stock.
+
+    Attributes:
+        product_ids: The products that ran short
+    """
+
+    def __init__(self, product_ids: Iterable[int]):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Sold out: {self.product_ids}")
+
+
+class SoldOutGate:
+    """Products known to be sold out, for ``ttl`` seconds after it was noticed."""
+
+    def __init__(self, ttl: float = SOLD_OUT_TTL):
+        self.ttl = ttl
+        self._until: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def check(self, product_ids: Iterable[int]) -> List[int]:
+        """
+        Which of these products are currently gated.
+
+        Args:
+            product_ids: Products of an order
+
+        Returns:
+            List[int]: Gated product ids, sorted
+        """
+        if not self._until:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            return sorted(pid for pid in set(product_ids) if self._until.get(pid, 0) > now)
+
+    def mark(self, product_ids: Iterable[int]) -> None:
+        until = time.monotonic() + self.ttl
+        with self._lock:
+            for product_id in product_ids:
+                self._until[product_id] = until
+            if len(self._until) > 1000:
+                now = time.monotonic()
+                self._until = {pid: t for pid, t in self._until.items() if t > now}
+
+    def clear(self, product_ids: Iterable[int]) -> None:
+        """Stock came back (a reservation was released), let orders through again."""
+        with self._lock:
+            for product_id in product_ids:
+                self._until.pop(product_id, None)
+
+
+sold_out_gate = SoldOutGate()
+
+
+def _quantity(quantities: Dict[int, int]):
+    # A CASE rather than a VALUES CTE: Python's sqlite3 only opens the implicit
+    # transaction for statements starting with INSERT/UPDATE/DELETE/REPLACE, so
+    # a WITH ... UPDATE would autocommit and survive the order's rollback.
+    return case(quantities, value=_products.c.id)
+
+
+def _decrement(db: Session, quantities: Dict[int, int]) -> Dict[int, Optional[int]]:
+    # One statement for all lines; untracked products (NULL stock) always match and stay NULL
+    qty = _quantity(quantities)
+    rows = db.execute(
+        update(_products)
+        .values(stock=_products.c.stock - qty)
+        .where(_products.c.id.in_(sorted(quantities)))
+        .where(_products.c.stock.is_(None) | (_products.c.stock >= qty))
+        .returning(_products.c.id, _products.c.stock)
+    )
+    return dict(rows.all())
+
+
+def _increment(db: Session, quantities: Dict[int, int]) -> None:
+    db.execute(
+        update(_products)
+        .values(stock=_products.c.stock + _quantity(quantities))
+        .where(_products.c.id.in_(sorted(quantities)))
+        .where(_products.c.stock.is_not(None))
+    )
+
+
+def _give_back(db: Session, rows) -> List[int]:
+    quantities: Dict[int, int] = {}
+    for product_id, quantity in rows:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if quantities:
+        _increment(db, quantities)
+    return sorted(quantities)
+
+
+def take(db: Session, quantities: Dict[int, int],
+         reservation_key: Optional[str] = None) -> Tuple[List[int], List[int]]:
+    """
+    Take an order's units off stock (not committed).
+
+    Units the order's reservation already holds are used first; only the
+    rest is decremented. Reserved units the order doesn't need go back.
+
+    Args:
+        db: Session holding the order's transaction
+        quantities: Quantity per product id
+        reservation_key: Key passed to ``reserve`` at billing, if any
+
+    Returns:
+        Tuple[List[int], List[int]]: Products this order sold out, and products
+        that got unneeded reserved units back
+
+    Raises:
+        SoldOut: Some lines didn't have the units; roll the transaction back
+    """
+    held: Dict[int, int] = {}
+    if reservation_key:
+        claimed = db.execute(
+            delete(_reservations)
+            .where(_reservations.c.key == reservation_key)
+            .returning(_reservations.c.product_id, _reservations.c.quantity)
+        )
+        held = dict(claimed.all())
+
+    needed = {pid: qty - held.get(pid, 0) for pid, qty in quantities.items() if qty > held.get(pid, 0)}
+    remaining = _decrement(db, needed) if needed else {}
+    short = set(needed) - set(remaining)
+    if short:
+        raise SoldOut(short)
+    surplus = {pid: qty - quantities.get(pid, 0) for pid, qty in held.items() if qty > quantities.get(pid, 0)}
+    if surplus:
+        _increment(db, surplus)
+    return sorted(pid for pid, stock in remaining.items() if stock == 0), sorted(surplus)
+
+
+def reserve(db: Session, key: str, quantities: Dict[int, int], ttl: int = RESERVATION_TTL) -> dict:
+    """
+    Hold a cart's units for ``ttl`` seconds (not committed).
+
+    A previous reservation under the same key is released first, so calling
+    this again after the cart changed replaces the hold. Lines without
+    enough stock are left out; untracked products need no hold.
+
+    Args:
+        db: Database session
+        key: Reservation key, later sent with the order
+        quantities: Quantity per product id
+        ttl: Seconds until the units go back on sale
+
+    Returns:
+        dict: ``reserved`` quantities, ``unavailable`` product ids, ``sold_out``
+        product ids this hold took to zero and ``expires_at``
+    """
+    release(db, key)
+    remaining = _decrement(db, quantities) if quantities else {}
+    tracked = {pid: quantities[pid] for pid, stock in remaining.items() if stock is not None}
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    if tracked:
+        db.execute(insert(_reservations), [
+            {"key": key, "product_id": pid, "quantity": qty, "expires_at": expires_at}
+            for pid, qty in sorted(tracked.items())
+        ])
+    return {
+        "reserved": tracked,
+        "unavailable": sorted(set(quantities) - set(remaining)),
+        "sold_out": sorted(pid for pid, stock in remaining.items() if stock == 0),
+        "expires_at": expires_at,
+    }
+
+
+def release(db: Session, key: str) -> List[int]:
+    """
+    Put a reservation's units back on sale (not committed).
+
+    Args:
+        db: Database session
+        key: Reservation key
+
+    Returns:
+        List[int]: Products that got units back
+    """
+    rows = db.execute(
+        delete(_reservations)
+        .where(_reservations.c.key == key)
+        .returning(_reservations.c.product_id, _reservations.c.quantity)
+    )
+    return _give_back(db, rows.all())
+
+
+def release_expired(db: Session, now: Optional[datetime] = None) -> List[int]:
+    """
+    Put every expired reservation's units back on sale (not committed).
+
+    Args:
+        db: Database session
+        now: Naive UTC time, for tests
+
+    Returns:
+        List[int]: Products that got units back
+    """
+    rows = db.execute(
+        delete(_reservations)
+        .where(_reservations.c.expires_at <= (now or datetime.utcnow()))
+        .returning(_reservations.c.product_id, _reservations.c.quantity)
+    )
+    return _give_back(db, rows.all())
@@ -1,24 +1,98 @@
 """FastAPI application for E-commerce API."""
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from .database import SessionLocal
-from . import models
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, Body, Depends, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from .database import SessionLocal, engine
+from . import events, idempotency, inventory, models, profiling, related, tracing
+from .admission import ADMISSION_ENABLED, AdmissionControlMiddleware
+from .catalog import catalog_cache
+from .idempotency import request_hash
+from .pricing import price_cart, price_carts
+from .singleflight import coalesced_response, request_key
+from .suggest import SUGGEST_LIMIT, suggest_index
+from pydantic import BaseModel, Field, TypeAdapter, computed_field
 from typing import List, Optional
 from datetime import datetime, timezone
 from decimal import Decimal
+from contextlib import asynccontextmanager
+from operator import attrgetter
+import asyncio
+import bisect
+import hmac
+import os
+
+
+def _build_suggest_index() -> None:
+    with SessionLocal() as db:
+        suggest_index.refresh(db, catalog_cache.get(db))
+
+
+def _release_expired_reservations() -> List[int]:
+    with SessionLocal() as db:
+        released = inventory.release_expired(db)
+        db.commit()
+    return released
+
+
+async def _sweep_reservations() -> None:
+    # Put abandoned carts' units back on sale
+    while True:
+        await asyncio.sleep(inventory.RESERVATION_SWEEP_INTERVAL)
+        try:
+            released = await run_in_threadpool(_release_expired_reservations)
+        except SQLAlchemyError:
+            continue  # Database busy or not migrated yet; try again next round
+        inventory.sold_out_gate.clear(released)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the autocomplete index before the first keystroke arrives
+    try:
+        await run_in_threadpool(_build_suggest_index)
+    except SQLAlchemyError:
+        pass  # No schema yet; /items/suggest builds it on first use
+    sweeper = asyncio.create_task(_sweep_reservations())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
 
 
 app = FastAPI(
     title="E-commerce API",
     description="RESTful API for managing products, orders, and sales analytics",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Admin token for the /debug endpoints and X-Profile requests; unset disables them
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+
+
+def _is_admin_token(token: Optional[str]) -> bool:
+    return bool(PROFILING_TOKEN and token) and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+
+# Shed load before it queues in the threadpool (see admission.py)
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
+# Outermost, so a profiled request includes the time spent in admission
+app.add_middleware(profiling.ProfileRequestMiddleware, authorize=_is_admin_token)
+
+# Continue Django's traces with route and SQL spans (see tracing.py)
+tracing.configure(service="api")
+tracing.instrument_engine(engine)
+app.add_middleware(tracing.TracingMiddleware, skip_paths={"/health", "/orders/events"})
+
 # Constants
 HTTP_404_NOT_FOUND = status.HTTP_404_NOT_FOUND
 HTTP_201_CREATED = status.HTTP_201_CREATED
+HTTP_409_CONFLICT = status.HTTP_409_CONFLICT
+MEDIA_URL = os.environ.get("MEDIA_URL", "/media/")
 
 # Pydantic Models for Response
 class ProductOut(BaseModel):
@@ -31,10 +105,29 @@ class ProductOut(BaseModel):
     image: Optional[str] = None
     is_sale: bool = False
     sale_price: Decimal = Decimal('0.00')
+    effective_price: Optional[Decimal] = Field(None, description="Unit price after promotions")
+    discounted: bool = Field(False, description="True when effective_price is below price")
+    image_variants: Optional[dict] = None
+    stock: Optional[int] = Field(None, description="Units left (as of the catalog snapshot); None when not tracked")
 
     class Config:
         from_attributes = True
 
+    @computed_field
+    @property
+    def srcset(self) -> dict[str, str]:
+        """
+        Ready-to-use ``srcset`` values per image format (avif, webp, jpeg).
+
+        Returns:
+            dict: Format name mapped to "url width" candidates
+        """
+        variants = (self.image_variants or {}).get("variants", {})
+        return {
+            fmt: ", ".join(f"{MEDIA_URL}{name} {width}w" for name, width in entries)
+            for fmt, entries in variants.items()
+        }
+
 
 class PaymentOrderOut(BaseModel):
     """Payment order response model."""
@@ -52,6 +145,29 @@ class PaymentOrderOut(BaseModel):
         from_attributes = True
 
 
+class OrderItemOut(BaseModel):
+    """Order line response model."""
+    id: int
+    product_id: Optional[int] = None
+    quantity: int
+    price: Decimal
+    product: Optional[ProductOut] = None
+
+    class Config:
+        from_attributes = True
+
+
+class OrderDetailOut(PaymentOrderOut):
+    """Order with its items and their products."""
+    items: List[OrderItemOut] = Field(default_factory=list)
+
+
+class OrderPageOut(BaseModel):
+    """One keyset page of a customer's orders."""
+    orders: List[OrderDetailOut]
+    next_cursor: Optional[str] = Field(None, description="Pass as ?after= for the next page; null on the last page")
+
+
 def get_db() -> Session:
     """
     Database dependency for FastAPI routes.
@@ -87,18 +203,76 @@ def read_root() -> dict[str, str]:
     return {"message": "Hello World"}
 
 
+_product_list = TypeAdapter(List[ProductOut])
+
+
 @app.get("/items", response_model=List[ProductOut])
-def get_items(db: Session = Depends(get_db)) -> List[ProductOut]:
+def get_items(request: Request, db: Session = Depends(get_db)) -> Response:
     """
     Get all products.
-    
+
+    The list is serialized once per catalog snapshot and shared by every
+    request that sees the same snapshot.
+
     Args:
+        request: Incoming request
         db: Database session
         
     Returns:
         List[Product]: List of all products
     """
-    return db.query(models.Product).all()
+    catalog = catalog_cache.get(db)
+    return coalesced_response(
+        f"{request_key(request)}@{catalog.version}",
+        lambda: _product_list.dump_json(_product_list.validate_python(catalog.products, from_attributes=True)),
+        ttl=catalog_cache.ttl,
+    )
+
+
+class SuggestionOut(BaseModel):
+    """Autocomplete suggestion."""
+    id: int
+    name: str
+    category: Optional[str] = None
+    effective_price: Optional[Decimal] = None
+    image: Optional[str] = None
+
+
+# Declared before /items/{item_id}, which would otherwise match "suggest"
+@app.get("/items/suggest", response_model=List[SuggestionOut])
+def suggest_items(
+    q: str = Query(..., min_length=1, max_length=100, description="What the shopper has typed so far"),
+    limit: int = Query(SUGGEST_LIMIT, ge=1, le=50),
+    db: Session = Depends(get_db),
+) -> List[SuggestionOut]:
+    """
+    Autocomplete products by name and category, best sellers first.
+
+    The last word is matched as a prefix unless followed by a space, and
+    words with a typo or two still match (see suggest.py).
+
+    Args:
+        q: Search box contents
+        limit: Number of suggestions
+        db: Database session
+
+    Returns:
+        List[SuggestionOut]: Matching products
+    """
+    catalog = catalog_cache.get(db)
+    suggest_index.refresh(db, catalog)
+    suggestions = []
+    for product_id in suggest_index.suggest(q, limit):
+        product = catalog.by_id.get(product_id)
+        if product is not None:
+            suggestions.append(SuggestionOut(
+                id=product.id,
+                name=product.name,
+                category=suggest_index.category_name(product.id),
+                effective_price=product.effective_price,
+                image=product.image,
+            ))
+    return suggestions
 
 
 @app.get("/items/{item_id}", response_model=ProductOut)
@@ -116,7 +290,7 @@ def get_item(item_id: int, db: Session = Depends(get_db)) -> ProductOut:
     Raises:
         HTTPException: 404 if product not found
     """
-    item = db.query(models.Product).filter(models.Product.id == item_id).first()
+    item = catalog_cache.get(db).by_id.get(item_id)
     if not item:
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND,
@@ -124,6 +298,233 @@ def get_item(item_id: int, db: Session = Depends(get_db)) -> ProductOut:
         )
     return item
 
+
+@app.get("/items/{item_id}/related", response_model=List[ProductOut])
+def get_related_items(
+    item_id: int,
+    request: Request,
+    limit: int = Query(related.RELATED_LIMIT, ge=1, le=related.RELATED_KEEP),
+    db: Session = Depends(get_db),
+) -> Response:
+    """
+    Products most often bought in the same order as this one.
+
+    Read from the precomputed neighbour table (see related.py) and shared
+    by identical requests for a couple of seconds.
+
+    Args:
+        item_id: Product ID
+        request: Incoming request
+        limit: Number of products
+        db: Database session
+
+    Returns:
+        List[Product]: Related products, most shared orders first
+
+    Raises:
+        HTTPException: 404 if product not found
+    """
+    catalog = catalog_cache.get(db)
+    if item_id not in catalog.by_id:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Item not found")
+
+    def products() -> bytes:
+        ids = related.related_ids(db, item_id, limit)
+        return _product_list.dump_json(_product_list.validate_python(
+            [catalog.by_id[i] for i in ids if i in catalog.by_id], from_attributes=True,
+        ))
+
+    return coalesced_response(f"{request_key(request)}@{catalog.version}", products)
+
+
+# ============================================================
+# GET API: Categories
+# ============================================================
+CATEGORY_PAGE_SIZE = 24
+
+
+class CategoryOut(BaseModel):
+    """Category with its product counts."""
+    id: int
+    name: str
+    slug: str
+    product_count: int = Field(0, description="Products in the category")
+    sale_count: int = Field(0, description="Products marked on sale")
+
+
+class CategoryItemsOut(BaseModel):
+    """One page of a category's products."""
+    category: CategoryOut
+    items: List[ProductOut]
+    next_cursor: Optional[int] = Field(None, description="Pass as ``after`` for the next page; None on the last page")
+
+
+def _category_out(category: models.Category) -> CategoryOut:
+    counts = category.counts
+    return CategoryOut(
+        id=category.id,
+        name=category.name,
+        slug=category.slug,
+        product_count=counts.products if counts else 0,
+        sale_count=counts.on_sale if counts else 0,
+    )
+
+
+@app.get("/categories", response_model=List[CategoryOut])
+def get_categories(db: Session = Depends(get_db)) -> List[CategoryOut]:
+    """
+    All categories with their product and on-sale counts.
+
+    The counts are kept by triggers on ``store_product`` (store migration
+    0010), so this reads the categories only, never the products.
+
+    Args:
+        db: Database session
+
+    Returns:
+        List[CategoryOut]: Categories ordered by name
+    """
+    return [_category_out(category) for category in db.query(models.Category).order_by(models.Category.name)]
+
+
+@app.get("/categories/{slug}/items", response_model=CategoryItemsOut)
+def get_category_items(
+    slug: str,
+    after: Optional[int] = Query(None, ge=0, description="next_cursor of the previous page"),
+    limit: int = Query(CATEGORY_PAGE_SIZE, ge=1, le=100),
+    db: Session = Depends(get_db),
+) -> CategoryItemsOut:
+    """
+    A category's products, ordered by id, a page at a time.
+
+    The category is found through the unique slug index; its products come
+    from the catalog snapshot, already grouped by category.
+
+    Args:
+        slug: Category slug
+        after: Last product id of the previous page
+        limit: Products per page
+        db: Database session
+
+    Returns:
+        CategoryItemsOut: The category, one page of products and the next cursor
+
+    Raises:
+        HTTPException: 404 if there is no category with this slug
+    """
+    category = db.query(models.Category).filter(models.Category.slug == slug).first()
+    if category is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Category not found")
+    products = catalog_cache.get(db).by_category.get(category.id, [])
+    start = bisect.bisect_right(products, after, key=attrgetter("id")) if after is not None else 0
+    page = products[start:start + limit]
+    next_cursor = page[-1].id if start + limit < len(products) else None
+    return CategoryItemsOut(category=_category_out(category), items=page, next_cursor=next_cursor)
+
+
+class CartLineOut(BaseModel):
+    """Priced cart line response model."""
+    product: ProductOut
+    quantity: int
+    unit_price: Decimal
+    line_total: Decimal
+
+
+class CartPriceOut(BaseModel):
+    """Priced cart response model."""
+    lines: List[CartLineOut]
+    item_count: int
+    total: Decimal
+    missing: List[int] = Field(default_factory=list, description="Unknown product IDs")
+
+
+def _cart_price_out(lines: List[dict], total: Decimal, missing: List[int]) -> CartPriceOut:
+    return CartPriceOut(
+        lines=[
+            CartLineOut(
+                product=ProductOut.model_validate(line["product"]),
+                quantity=line["quantity"],
+                unit_price=line["unit_price"],
+                line_total=line["line_total"],
+            )
+            for line in lines
+        ],
+        item_count=sum(line["quantity"] for line in lines),
+        total=total,
+        missing=missing,
+    )
+
+
+def _check_quantities(carts: List[dict[int, int]]) -> None:
+    if any(quantity <= 0 for cart in carts for quantity in cart.values()):
+        raise HTTPException(status_code=422, detail="Quantities must be positive")
+
+
+@app.get("/cart/related", response_model=List[ProductOut])
+def get_cart_related(
+    ids: List[int] = Query(..., min_length=1, max_length=100, description="Product IDs in the cart"),
+    limit: int = Query(related.RELATED_LIMIT, ge=1, le=related.RELATED_KEEP),
+    db: Session = Depends(get_db),
+) -> List[ProductOut]:
+    """
+    Products most often bought with the ones in a cart, excluding those already in it.
+
+    Args:
+        ids: Product IDs in the cart
+        limit: Number of products
+        db: Database session
+
+    Returns:
+        List[Product]: Related products, most shared orders first
+    """
+    catalog = catalog_cache.get(db)
+    return [catalog.by_id[i] for i in related.related_to_cart(db, ids, limit) if i in catalog.by_id]
+
+
+@app.post("/cart/price", response_model=CartPriceOut)
+def price_cart_endpoint(
+    cart: dict[int, int] = Body(..., description="Product ID mapped to quantity"),
+    db: Session = Depends(get_db)
+) -> CartPriceOut:
+    """
+    Price a cart from the cached catalog, promotions included.
+
+    Args:
+        cart: Product ID mapped to quantity
+        db: Database session (only used to refresh the catalog)
+
+    Returns:
+        CartPriceOut: Priced lines, item count and total
+
+    Raises:
+        HTTPException: 422 if a quantity is not positive
+    """
+    _check_quantities([cart])
+    return _cart_price_out(*price_cart(catalog_cache.get(db), cart))
+
+
+@app.post("/cart/price/batch", response_model=List[CartPriceOut])
+def price_carts_endpoint(
+    carts: List[dict[int, int]] = Body(..., description="One product ID to quantity mapping per cart"),
+    db: Session = Depends(get_db)
+) -> List[CartPriceOut]:
+    """
+    Price many carts in one vectorized pass.
+
+    Args:
+        carts: One product ID to quantity mapping per cart
+        db: Database session (only used to refresh the catalog)
+
+    Returns:
+        List[CartPriceOut]: Priced carts, in request order
+
+    Raises:
+        HTTPException: 422 if a quantity is not positive
+    """
+    _check_quantities(carts)
+    return [_cart_price_out(*result) for result in price_carts(catalog_cache.get(db), carts)]
+
+
 def _calculate_revenue(
     product_id: int,
     product_name: str,
@@ -147,19 +548,27 @@ def _calculate_revenue(
     }
 
 
-@app.get("/ecom/totalrevenue")
+@app.get("/ecom/totalrevenue", response_model=List[dict[str, float | int | str]])
 def get_total_revenue_per_product(
+    request: Request,
     db: Session = Depends(get_db)
-) -> List[dict[str, float | int | str]]:
+) -> Response:
     """
     Get total revenue per product.
+
+    Concurrent identical requests share one query (see singleflight.py).
     
     Args:
+        request: Incoming request
         db: Database session
         
     Returns:
         List[dict]: Revenue data for each product
     """
+    return coalesced_response(request_key(request), lambda: _total_revenue_per_product(db))
+
+
+def _total_revenue_per_product(db: Session) -> List[dict[str, float | int | str]]:
     results = (
         db.query(
             models.Product.id.label("product_id"),
@@ -177,14 +586,18 @@ def get_total_revenue_per_product(
     ]
 
 
-@app.get("/ecom/highest_selling")
+@app.get("/ecom/highest_selling", response_model=dict[str, float | int | str])
 def get_highest_selling_product(
+    request: Request,
     db: Session = Depends(get_db)
-) -> dict[str, float | int | str]:
+) -> Response:
     """
     Get the highest-selling product by quantity.
+
+    Concurrent identical requests share one query (see singleflight.py).
     
     Args:
+        request: Incoming request
         db: Database session
         
     Returns:
@@ -193,6 +606,10 @@ def get_highest_selling_product(
     Raises:
         HTTPException: 404 if no sales data available
     """
+    return coalesced_response(request_key(request), lambda: _highest_selling_product(db))
+
+
+def _highest_selling_product(db: Session) -> dict[str, float | int | str]:
     result = (
         db.query(
             models.Product.id.label("product_id"),
@@ -234,12 +651,197 @@ def get_sales(db: Session = Depends(get_db)) -> List[PaymentOrderOut]:
     return db.query(models.PaymentOrder).all()
 
 
+# ============================================================
+# GET API: Orders with items (fixed number of queries)
+# ============================================================
+MAX_BATCH_IDS = 500
+
+
+def _orders_with_items(db: Session):
+    # One query for the orders, one for their items, one for the items' products
+    return db.query(models.PaymentOrder).options(
+        selectinload(models.PaymentOrder.items).selectinload(models.OrderItem.product)
+    )
+
+
+def _encode_cursor(order: models.PaymentOrder) -> str:
+    stamp = order.date_oredered.replace(tzinfo=timezone.utc)
+    micros = int(stamp.timestamp()) * 1_000_000 + stamp.microsecond
+    return f"{micros}-{order.id}"
+
+
+def _decode_cursor(value: str) -> tuple[datetime, int]:
+    micros, _, order_id = value.partition("-")
+    if not micros.isdigit() or not order_id.isdigit():
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    seconds, micros = divmod(int(micros), 1_000_000)
+    # Stored as naive UTC, like Django writes it
+    stamp = datetime.fromtimestamp(seconds, tz=timezone.utc).replace(microsecond=micros, tzinfo=None)
+    return stamp, int(order_id)
+
+
+@app.get("/orders", response_model=List[OrderDetailOut])
+def get_orders_batch(
+    ids: List[str] = Query(..., description="Order IDs, comma separated and/or repeated"),
+    db: Session = Depends(get_db)
+) -> List[OrderDetailOut]:
+    """
+    Get several orders with their items in one call.
+
+    Args:
+        ids: Order IDs (``?ids=1,2,3`` or ``?ids=1&ids=2``)
+        db: Database session
+
+    Returns:
+        List[OrderDetailOut]: Orders found, in the requested order
+
+    Raises:
+        HTTPException: 422 if an ID is not a number or too many IDs are requested
+    """
+    try:
+        order_ids = list(dict.fromkeys(int(part) for value in ids for part in value.split(",") if part))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be integers")
+    if len(order_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    found = {
+        order.id: order
+        for order in _orders_with_items(db).filter(models.PaymentOrder.id.in_(order_ids))
+    }
+    return [found[order_id] for order_id in order_ids if order_id in found]
+
+
+# ============================================================
+# GET API: Live order changes (Server-Sent Events)
+# ============================================================
+# Comment line sent when nothing happened, keeps proxies from closing the stream
+ORDER_EVENTS_HEARTBEAT = float(os.environ.get("ORDER_EVENTS_HEARTBEAT", "15"))
+# Browser reconnect delay, in milliseconds
+ORDER_EVENTS_RETRY_MS = 3000
+
+
+def _order_event_data(order: models.PaymentOrder) -> dict:
+    return PaymentOrderOut.model_validate(order).model_dump(mode="json")
+
+
+async def _order_event_stream(request: Request, subscription: events.Subscription, backlog: list):
+    try:
+        yield f"retry: {ORDER_EVENTS_RETRY_MS}\n\n"
+        for event in backlog:
+            yield event.encode()
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), ORDER_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                break
+            yield event.encode()
+    finally:
+        events.broadcaster.unsubscribe(subscription)
+
+
+# Declared before /orders/{order_id} so "events" isn't read as an order id
+@app.get("/orders/events")
+async def order_events(
+    request: Request,
+    last_event_id: Optional[str] = Header(None, max_length=32)
+) -> StreamingResponse:
+    """
+    Stream order changes as Server-Sent Events.
+
+    Events are ``created``, ``updated``, ``shipped`` (data is the order) and
+    ``deleted`` (data is ``{"id": ...}``). A client reconnecting with
+    ``Last-Event-ID`` first gets the events it missed; if those are no
+    longer buffered it gets a ``reset`` event and should reload its data.
+
+    Args:
+        request: Incoming request, used to notice disconnects
+        last_event_id: ID of the last event the client received
+
+    Returns:
+        StreamingResponse: ``text/event-stream`` that stays open
+    """
+    subscription, backlog = events.broadcaster.subscribe(last_event_id)
+    return StreamingResponse(
+        _order_event_stream(request, subscription, backlog),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/orders/{order_id}", response_model=OrderDetailOut)
+def get_order(order_id: int, db: Session = Depends(get_db)) -> OrderDetailOut:
+    """
+    Get one order with its items and their products.
+
+    Args:
+        order_id: Order ID
+        db: Database session
+
+    Returns:
+        OrderDetailOut: The order
+
+    Raises:
+        HTTPException: 404 if the order doesn't exist
+    """
+    order = _orders_with_items(db).filter(models.PaymentOrder.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Order not found")
+    return order
+
+
+@app.get("/users/{user_id}/orders", response_model=OrderPageOut)
+def get_user_orders(
+    user_id: int,
+    after: Optional[str] = Query(None, description="Cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+) -> OrderPageOut:
+    """
+    A customer's order history, newest first, with keyset pagination.
+
+    Pages are an index range scan on ``(user_id, date_oredered)`` however
+    deep the client pages.
+
+    Args:
+        user_id: Customer (Django user) ID
+        after: Cursor returned with the previous page
+        limit: Orders per page
+        db: Database session
+
+    Returns:
+        OrderPageOut: Orders with items and the cursor of the next page
+
+    Raises:
+        HTTPException: 422 if the cursor is malformed
+    """
+    query = _orders_with_items(db).filter(models.PaymentOrder.user_id == user_id)
+    if after:
+        stamp, order_id = _decode_cursor(after)
+        query = query.filter(
+            models.PaymentOrder.date_oredered <= stamp,
+            or_(models.PaymentOrder.date_oredered < stamp, models.PaymentOrder.id < order_id),
+        )
+    # One extra row tells whether there is a next page without a COUNT
+    orders = (
+        query.order_by(models.PaymentOrder.date_oredered.desc(), models.PaymentOrder.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = _encode_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return OrderPageOut(orders=orders[:limit], next_cursor=next_cursor)
+
+
 # Pydantic Models for Request/Response
 class OrderItemIn(BaseModel):
     """Order item input model."""
     product_id: int = Field(..., gt=0, description="Product ID")
     quantity: int = Field(..., gt=0, description="Quantity ordered")
-    price: Decimal = Field(..., gt=0, description="Price per item")
+    price: Optional[Decimal] = Field(None, gt=0, description="Ignored, items are priced server-side")
 
 
 class OrderIn(BaseModel):
@@ -248,36 +850,215 @@ class OrderIn(BaseModel):
     full_name: str = Field(..., min_length=1, max_length=250, description="Customer full name")
     email: str = Field(..., description="Customer email address")
     shipping_address: str = Field(..., min_length=1, description="Shipping address")
-    amount_paid: Decimal = Field(..., gt=0, description="Total amount paid")
+    amount_paid: Optional[Decimal] = Field(None, gt=0, description="Total the customer saw; must match the server-side price")
     items: List[OrderItemIn] = Field(default_factory=list, description="Order items")
+    reservation_key: Optional[str] = Field(None, max_length=64, description="Key of the stock reservation made at billing")
 
 
 @app.post("/orders")
-def add_order(order: OrderIn, db: Session = Depends(get_db)):
+def add_order(
+    order: OrderIn,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: Session = Depends(get_db)
+):
+    # Retries with the same Idempotency-Key get the first response back
+    fingerprint = None
+    if idempotency_key:
+        fingerprint = request_hash(order.model_dump(mode="json"))
+        stored = idempotency.lookup(db, idempotency_key)
+        if stored is not None:
+            return idempotency.replay(stored, fingerprint)
+
+    # Price the order ourselves instead of trusting client-supplied prices
+    quantities: dict[int, int] = {}
+    for item in order.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    lines, total, missing = price_cart(catalog_cache.get(db), quantities)
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Unknown products: {missing}")
+    if order.amount_paid is not None and order.amount_paid != total:
+        raise HTTPException(
+            status_code=HTTP_409_CONFLICT,
+            detail=f"Order total changed to {total}"
+        )
+    # Products that just sold out are turned away without taking the write lock
+    if not order.reservation_key:
+        gated = inventory.sold_out_gate.check(quantities)
+        if gated:
+            raise HTTPException(status_code=HTTP_409_CONFLICT, detail=f"Sold out: {gated}")
+
+    # Stock first, so an order that can't be filled holds the write lock as briefly as possible
+    try:
+        sold_out, returned = inventory.take(db, quantities, order.reservation_key)
+    except inventory.SoldOut as exc:
+        db.rollback()
+        inventory.sold_out_gate.mark(exc.product_ids)
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail=str(exc))
+
     new_order = models.PaymentOrder(
         user_id=order.user_id,
         full_name=order.full_name,
         email=order.email,
         shipping_address=order.shipping_address,
-        amount_paid=order.amount_paid
+        amount_paid=total
     )
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    db.flush()
 
-    # Add order items
-    for item in order.items:
+    # Add order items (same transaction as the order)
+    for line in lines:
         order_item = models.OrderItem(
             order_id=new_order.id,
-            product_id=item.product_id,
+            product_id=line["product"].id,
             user_id=order.user_id,
-            quantity=item.quantity,
-            price=item.price
+            quantity=line["quantity"],
+            price=line["unit_price"]
         )
         db.add(order_item)
+    related.record_order(db, [line["product"].id for line in lines])
+
+    response = {"message": "Order created", "order_id": new_order.id}
+    if idempotency_key:
+        idempotency.record(db, idempotency_key, fingerprint, new_order.id, response)
+    try:
+        with tracing.child_span("db.commit", "sql"):
+            db.commit()
+    except IntegrityError:
+        # A concurrent request with the same key won the race; replay its order instead
+        db.rollback()
+        if not idempotency_key:
+            raise
+        stored = idempotency.lookup(db, idempotency_key, use_cache=False)
+        if stored is None:
+            raise
+        return idempotency.replay(stored, fingerprint)
+    if idempotency_key:
+        idempotency.replay_cache.put(idempotency_key, (fingerprint, response))
+    inventory.sold_out_gate.clear(returned)
+    inventory.sold_out_gate.mark(sold_out)
+    events.broadcaster.publish(events.CREATED, _order_event_data(new_order))
+    suggest_index.record_sale({line["product"].id: line["quantity"] for line in lines})
+
+    return response
+
+
+# ============================================================
+# POST / DELETE API: Stock reservations
+# ============================================================
+class ReservationIn(BaseModel):
+    """Units to hold while the shopper fills in billing."""
+    key: str = Field(..., min_length=1, max_length=64, description="Reservation key, sent again with the order")
+    items: List[OrderItemIn] = Field(..., max_length=500, description="Cart lines")
+    ttl: int = Field(inventory.RESERVATION_TTL, gt=0, le=inventory.RESERVATION_MAX_TTL, description="Seconds to hold the units")
+
+
+@app.post("/reservations", status_code=HTTP_201_CREATED)
+def create_reservation(data: ReservationIn, db: Session = Depends(get_db)):
+    """
+    Hold a cart's units for ``ttl`` seconds, replacing an earlier hold with the same key.
+
+    Lines without enough stock are left out and listed in ``unavailable``.
+
+    Args:
+        data: Key, cart lines and hold time
+        db: Database session
+
+    Returns:
+        dict: Reserved quantities, unavailable product ids and expiry time
+    """
+    quantities: dict[int, int] = {}
+    for item in data.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    result = inventory.reserve(db, data.key, quantities, data.ttl)
+    db.commit()
+    inventory.sold_out_gate.mark(result.pop("sold_out"))
+    return {
+        "key": data.key,
+        "reserved": [{"product_id": pid, "quantity": qty} for pid, qty in sorted(result["reserved"].items())],
+        "unavailable": result["unavailable"],
+        "expires_at": result["expires_at"],
+    }
+
+
+@app.delete("/reservations/{key}")
+def delete_reservation(key: str, db: Session = Depends(get_db)):
+    """
+    Give a reservation's units back (e.g. the cart was emptied).
+
+    Args:
+        key: Reservation key
+        db: Database session
+
+    Returns:
+        dict: Products that got units back
+    """
+    released = inventory.release(db, key)
+    db.commit()
+    inventory.sold_out_gate.clear(released)
+    return {"message": "Reservation released", "product_ids": released}
+
+
+# ============================================================
+# POST API: Bulk ship / unship orders
+# ============================================================
+class ShipOrdersIn(BaseModel):
+    """Bulk shipping status change."""
+    order_ids: List[int] = Field(..., min_length=1, max_length=50000, description="Orders to update")
+    shipped: bool = Field(True, description="False moves the orders back to the unshipped queue")
+
+
+# Stay below SQLite's bound-parameter limit in IN (...) lists
+SHIP_CHUNK_SIZE = 500
+
+
+@app.post("/orders:ship")
+def ship_orders(data: ShipOrdersIn, db: Session = Depends(get_db)):
+    """
+    Mark many orders shipped (or unshipped) in one transaction.
+
+    Each chunk of ids is a single ``UPDATE ... WHERE id IN (...) AND
+    shipped = <old state> RETURNING id`` that also sets ``date_shipped``
+    (cleared when unshipping). Orders already in the requested state are
+    left untouched, and the ids the UPDATE itself returns are the ones
+    published to ``/orders/events``, so two overlapping requests never both
+    report the same order. Changes made on the Django side
+    (``Order.objects.set_shipped``, the admin actions) don't go through
+    here and never reach the feed.
+
+    Args:
+        data: Order IDs and the target status
+        db: Database session
+
+    Returns:
+        dict: Number of orders that changed
+    """
+    order_ids = sorted(set(data.order_ids))
+    values = {
+        "shipped": data.shipped,
+        "date_shipped": datetime.utcnow() if data.shipped else None,
+    }
+    changed = []
+    for start in range(0, len(order_ids), SHIP_CHUNK_SIZE):
+        chunk = order_ids[start:start + SHIP_CHUNK_SIZE]
+        rows = db.execute(
+            update(models.PaymentOrder)
+            .where(models.PaymentOrder.id.in_(chunk), models.PaymentOrder.shipped == (not data.shipped))
+            .values(**values)
+            .returning(models.PaymentOrder.id)
+            .execution_options(synchronize_session=False)
+        )
+        changed.extend(order_id for (order_id,) in rows)
     db.commit()
 
-    return {"message": "Order created", "order_id": new_order.id}
+    kind = events.SHIPPED if data.shipped else events.UPDATED
+    date_shipped = values["date_shipped"]
+    for order_id in sorted(changed):
+        events.broadcaster.publish(kind, {
+            "id": order_id,
+            "shipped": data.shipped,
+            "date_shipped": date_shipped.isoformat() if date_shipped else None,
+        })
+    return {"message": "Orders updated", "updated": len(changed)}
 
 
 # ============================================================
@@ -301,6 +1082,8 @@ def update_order(order_id: int, update_data: UpdateOrderIn, db: Session = Depend
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
+    was_shipped = order.shipped
+
     # Update status fields
     if update_data.shipped is not None:
         order.shipped = update_data.shipped
@@ -325,6 +1108,8 @@ def update_order(order_id: int, update_data: UpdateOrderIn, db: Session = Depend
 
     db.commit()
     db.refresh(order)
+    kind = events.SHIPPED if order.shipped and not was_shipped else events.UPDATED
+    events.broadcaster.publish(kind, _order_event_data(order))
     return {"message": "Order updated", "order": order}
 
 
@@ -338,6 +1123,123 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Order not found")
     db.delete(order)
     db.commit()
+    events.broadcaster.publish(events.DELETED, {"id": order_id})
     return {"message": "Order deleted successfully"}
 # Seed endpoint removed per requirement
 
+
+# ============================================================
+# Debug API: Sampling profiler and memory snapshots (admin only)
+# ============================================================
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Allow the request only with the right ``X-Admin-Token``.
+
+    Args:
+        x_admin_token: Token sent by the client
+
+    Raises:
+        HTTPException: 404 when profiling is disabled, 403 for a wrong token
+    """
+    if not PROFILING_TOKEN:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Not Found")
+    if not _is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+@app.get("/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin_token)])
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=profiling.MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+    idle: bool = Query(False, description="Also keep samples of threads parked in waits")
+) -> str:
+    """
+    Sample every thread of the worker that handles this request.
+
+    Args:
+        seconds: How long to sample
+        interval_ms: Milliseconds between samples
+        idle: Keep samples of idle threads
+
+    Returns:
+        str: Collapsed stacks (flamegraph.pl / speedscope input)
+
+    Raises:
+        HTTPException: 409 if a profile is already running in this worker
+    """
+    try:
+        return await run_in_threadpool(profiling.profile_process, seconds, interval_ms / 1000, idle)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail=str(e))
+
+
+@app.get("/debug/profile/requests/{profile_id}", response_class=PlainTextResponse,
+         dependencies=[Depends(require_admin_token)])
+def get_request_profile(profile_id: str) -> str:
+    """
+    Fetch the profile of a request sent with ``X-Profile: 1``.
+
+    Args:
+        profile_id: Value of the ``X-Profile-Id`` response header
+
+    Returns:
+        str: Collapsed stacks
+
+    Raises:
+        HTTPException: 404 if the profile is unknown or was evicted
+    """
+    collapsed = profiling.request_profiles.get(profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Profile not found")
+    return collapsed
+
+
+@app.post("/debug/memory/baseline", dependencies=[Depends(require_admin_token)])
+def memory_baseline(frames: int = Query(10, ge=1, le=100)) -> dict:
+    """
+    Start ``tracemalloc`` if needed and record the heap as the baseline.
+
+    Args:
+        frames: Stack depth kept per allocation
+
+    Returns:
+        dict: Tracing status and traced memory
+    """
+    return profiling.memory_snapshots.baseline(frames)
+
+
+@app.get("/debug/memory/diff", response_class=PlainTextResponse, dependencies=[Depends(require_admin_token)])
+def memory_diff(
+    limit: int = Query(25, ge=1, le=500),
+    key_type: str = Query("lineno", pattern="^(lineno|filename|traceback)$")
+) -> str:
+    """
+    Heap growth since the baseline, biggest first.
+
+    Args:
+        limit: Number of allocation sites
+        key_type: Group by ``lineno``, ``filename`` or ``traceback``
+
+    Returns:
+        str: One line per allocation site
+
+    Raises:
+        HTTPException: 409 if no baseline was recorded
+    """
+    try:
+        lines = profiling.memory_snapshots.diff(limit, key_type)
+    except RuntimeError as e:
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail=str(e))
+    return "\n".join(lines) + "\n"
+
+
+@app.delete("/debug/memory", dependencies=[Depends(require_admin_token)])
+def memory_stop() -> dict:
+    """
+    Stop ``tracemalloc`` and drop the baseline.
+
+    Returns:
+        dict: Tracing status
+    """
+    profiling.memory_snapshots.stop()
+    return profiling.memory_snapshots.status()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Numeric
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Numeric, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 import datetime
@@ -18,10 +18,84 @@ class Product(Base):
     image = Column(String(250))
     is_sale = Column(Boolean, default=False)
     sale_price = Column(Numeric(6, 2), default=0)
+    image_variants = Column(JSON, nullable=True)  # Written by Django's store.images
+    stock = Column(Integer, nullable=True)  # None: not stock-tracked (see inventory.py)
 
     order_items = relationship("OrderItem", back_populates="product")
 
 
+# ============================================================
+# store.Category
+# ============================================================
+class Category(Base):
+    __tablename__ = "store_category"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), nullable=False)
+    slug = Column(String(60), nullable=False, unique=True)
+
+    counts = relationship("CategoryCount", uselist=False, lazy="joined")
+
+
+# ============================================================
+# store.CategoryCount (kept current by triggers, see store migration 0010)
+# ============================================================
+class CategoryCount(Base):
+    __tablename__ = "store_categorycount"
+
+    category_id = Column(Integer, ForeignKey("store_category.id"), primary_key=True)
+    products = Column(Integer, nullable=False, default=0)
+    on_sale = Column(Integer, nullable=False, default=0)
+
+
+# ============================================================
+# store.StockReservation
+# ============================================================
+class StockReservation(Base):
+    __tablename__ = "store_stockreservation"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(64), nullable=False)
+    product_id = Column(Integer, ForeignKey("store_product.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (UniqueConstraint("key", "product_id"),)
+
+
+# ============================================================
+# store.RelatedProduct
+# ============================================================
+class RelatedProduct(Base):
+    __tablename__ = "store_relatedproduct"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("store_product.id"), nullable=False)
+    related_id = Column(Integer, ForeignKey("store_product.id"), nullable=False)
+    orders = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint("product_id", "related_id"),)
+
+
+# ============================================================
+# store.Promotion
+# ============================================================
+class Promotion(Base):
+    __tablename__ = "store_promotion"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    kind = Column(String(10), nullable=False)
+    product_id = Column(Integer, ForeignKey("store_product.id"), nullable=True)
+    category_id = Column(Integer, nullable=True)
+    percent_off = Column(Numeric(5, 2), default=0)
+    bundle_quantity = Column(Integer, default=0)
+    bundle_price = Column(Numeric(6, 2), default=0)
+    is_active = Column(Boolean, default=True)
+    starts_at = Column(DateTime, nullable=True)
+    ends_at = Column(DateTime, nullable=True)
+
+
 # ============================================================
 # payment.Order
 # ============================================================
@@ -57,3 +131,17 @@ class OrderItem(Base):
 
     order = relationship("PaymentOrder", back_populates="items")
     product = relationship("Product", back_populates="order_items")
+
+
+# ============================================================
+# payment.IdempotencyKey
+# ============================================================
+class IdempotencyKey(Base):
+    __tablename__ = "payment_idempotencykey"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(255), nullable=False, unique=True)
+    request_hash = Column(String(64), nullable=False)
+    order_id = Column(Integer, ForeignKey("payment_order.id"), nullable=False)
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,264 @@
+"""Vectorized pricing engine shared by the API and the Django cart.
+
+Active promotions are compiled once into integer-cent arrays indexed by
+product id, so pricing the whole catalog or a batch of carts is a handful of
+numpy operations instead of a Python loop per line. Promotions are:
+
+* ``percent``: percentage off one product
+* ``category``: percentage off every product of a category
+* ``bundle``: ``bundle_quantity`` units of one product for ``bundle_price``
+
+Percentages don't stack, the best one wins; bundles apply on top of it when
+they are cheaper. This module only depends on numpy and the standard library
+because Django imports it too (see store/pricing.py).
+"""
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import TYPE_CHECKING, Dict, Iterable, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .catalog import Catalog
+
+PERCENT = "percent"
+CATEGORY = "category"
+BUNDLE = "bundle"
+
+# (product_id, quantity, unit cents, line cents)
+PricedLine = Tuple[int, int, int, int]
+
+
+def to_cents(value) -> int:
+    """
+    Convert a money amount to integer cents, rounding half up.
+
+    Args:
+        value: Decimal, float, int or numeric string (None counts as 0)
+
+    Returns:
+        int: Amount in cents
+    """
+    if value is None:
+        return 0
+    return int((Decimal(str(value)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents) -> Decimal:
+    """
+    Convert integer cents back to a two-place Decimal.
+
+    Args:
+        cents: Amount in cents
+
+    Returns:
+        Decimal: Amount with two decimal places
+    """
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _utc(value: datetime.datetime) -> datetime.datetime:
+    # SQLAlchemy hands back naive UTC datetimes, Django aware ones.
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+
+
+def active_promotions(promotions: Iterable, now: datetime.datetime | None = None) -> list:
+    """
+    Filter promotions down to the ones running at ``now``.
+
+    Args:
+        promotions: Promotion rows (Django or SQLAlchemy)
+        now: Reference time, defaults to the current time
+
+    Returns:
+        list: Enabled promotions whose time window contains ``now``
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return [
+        rule for rule in promotions
+        if rule.is_active
+        and (rule.starts_at is None or _utc(rule.starts_at) <= now)
+        and (rule.ends_at is None or now < _utc(rule.ends_at))
+    ]
+
+
+def pricing_key(products: Iterable, promotions: Iterable) -> tuple:
+    """
+    Everything the compiled arrays depend on; an equal key means no recompile.
+
+    Args:
+        products: Product rows
+        promotions: Active promotion rows
+
+    Returns:
+        tuple: Hashable snapshot of prices and rules
+    """
+    return (
+        tuple(
+            (p.id, to_cents(p.price), to_cents(p.sale_price), bool(p.is_sale), p.category_id)
+            for p in products
+        ),
+        tuple(
+            (r.id, r.kind, r.product_id, r.category_id, to_cents(r.percent_off),
+             r.bundle_quantity, to_cents(r.bundle_price))
+            for r in promotions
+        ),
+    )
+
+
+class PricingEngine:
+    """
+    Promotions compiled into arrays indexed by product id.
+
+    Attributes:
+        known: True for ids that exist in the catalog
+        base_cents: Price before promotions (sale price when on sale)
+        unit_cents: Price of one unit after the best percentage promotion
+        bundle_qty: Bundle size per product, 0 when there is no bundle
+        bundle_cents: Price of one full bundle
+    """
+
+    def __init__(self, products: Iterable, promotions: Iterable):
+        products = list(products)
+        size = max((p.id for p in products), default=0) + 1
+        self.known = np.zeros(size, dtype=bool)
+        self.base_cents = np.zeros(size, dtype=np.int64)
+        category = np.full(size, -1, dtype=np.int64)
+        for p in products:
+            self.known[p.id] = True
+            self.base_cents[p.id] = to_cents(p.sale_price if p.is_sale else p.price)
+            if p.category_id is not None:
+                category[p.id] = p.category_id
+
+        # Best percentage per product and per category, in basis points
+        product_bp = np.zeros(size, dtype=np.int64)
+        category_bp: Dict[int, int] = {}
+        bundles: Dict[int, Tuple[int, int]] = {}
+        for rule in promotions:
+            bp = min(max(to_cents(rule.percent_off), 0), 10000)
+            if rule.kind == PERCENT and rule.product_id is not None and rule.product_id < size:
+                product_bp[rule.product_id] = max(product_bp[rule.product_id], bp)
+            elif rule.kind == CATEGORY and rule.category_id is not None:
+                category_bp[rule.category_id] = max(category_bp.get(rule.category_id, 0), bp)
+            elif rule.kind == BUNDLE and rule.product_id is not None and rule.product_id < size:
+                quantity, cents = rule.bundle_quantity or 0, to_cents(rule.bundle_price)
+                if quantity < 2:
+                    continue
+                best = bundles.get(rule.product_id)
+                # Keep the cheapest bundle per unit
+                if best is None or cents * best[0] < best[1] * quantity:
+                    bundles[rule.product_id] = (quantity, cents)
+
+        if category_bp:
+            lookup = np.zeros(max(max(category_bp), int(category.max())) + 2, dtype=np.int64)
+            lookup[list(category_bp)] = list(category_bp.values())
+            # category == -1 lands on the last slot, which is always 0
+            product_bp = np.maximum(product_bp, lookup[category])
+        self.unit_cents = self.base_cents - (self.base_cents * product_bp + 5000) // 10000
+
+        self.bundle_qty = np.zeros(size, dtype=np.int64)
+        self.bundle_cents = np.zeros(size, dtype=np.int64)
+        for product_id, (quantity, cents) in bundles.items():
+            self.bundle_qty[product_id] = quantity
+            self.bundle_cents[product_id] = cents
+
+    def unit_prices(self, product_ids: Sequence[int]) -> np.ndarray:
+        """
+        Effective unit prices for many products at once.
+
+        Args:
+            product_ids: Known product IDs
+
+        Returns:
+            np.ndarray: Unit prices in cents, aligned with ``product_ids``
+        """
+        return self.unit_cents[np.asarray(product_ids, dtype=np.int64)]
+
+    def price_carts(self, carts: Sequence[Mapping[int, int]]) -> List[Tuple[List[PricedLine], int, List[int]]]:
+        """
+        Price a batch of carts in one vectorized pass.
+
+        Args:
+            carts: One ``{product_id: quantity}`` mapping per cart
+
+        Returns:
+            list: ``(lines, total_cents, missing_ids)`` per cart
+        """
+        counts = [len(cart) for cart in carts]
+        n = sum(counts)
+        ids = np.fromiter((int(pid) for cart in carts for pid in cart), dtype=np.int64, count=n)
+        qty = np.fromiter((int(q) for cart in carts for q in cart.values()), dtype=np.int64, count=n)
+        owner = np.repeat(np.arange(len(carts)), counts)
+
+        valid = (ids >= 0) & (ids < self.known.size)
+        valid[valid] = self.known[ids[valid]]
+        safe = np.where(valid, ids, 0)
+
+        unit = self.unit_cents[safe]
+        plain = unit * qty
+        size = self.bundle_qty[safe]
+        has_bundle = valid & (size > 0)
+        size = np.where(has_bundle, size, 1)
+        bundled = (qty // size) * self.bundle_cents[safe] + (qty % size) * unit
+        line = np.where(has_bundle, np.minimum(plain, bundled), plain)
+        line = np.where(valid, line, 0)
+
+        totals = np.zeros(len(carts), dtype=np.int64)
+        np.add.at(totals, owner, line)
+
+        ids_l, qty_l, unit_l, line_l, valid_l = (a.tolist() for a in (ids, qty, unit, line, valid))
+        results = []
+        start = 0
+        for index, count in enumerate(counts):
+            lines, missing = [], []
+            for i in range(start, start + count):
+                if valid_l[i]:
+                    lines.append((ids_l[i], qty_l[i], unit_l[i], line_l[i]))
+                else:
+                    missing.append(ids_l[i])
+            results.append((lines, int(totals[index]), missing))
+            start += count
+        return results
+
+
+def price_carts(catalog: "Catalog", carts: Sequence[Dict[int, int]]) -> List[Tuple[List[dict], Decimal, List[int]]]:
+    """
+    Price several carts against a catalog snapshot.
+
+    Args:
+        catalog: Catalog snapshot
+        carts: One ``{product_id: quantity}`` mapping per cart
+
+    Returns:
+        list: ``(lines, total, missing)`` per cart, see ``price_cart``
+    """
+    results = []
+    for lines, total, missing in catalog.engine.price_carts(carts):
+        results.append((
+            [
+                {
+                    "product": catalog.by_id[product_id],
+                    "quantity": quantity,
+                    "unit_price": from_cents(unit),
+                    "line_total": from_cents(line),
+                }
+                for product_id, quantity, unit, line in lines
+            ],
+            from_cents(total),
+            missing,
+        ))
+    return results
+
+
+def price_cart(catalog: "Catalog", quantities: Dict[int, int]) -> Tuple[List[dict], Decimal, List[int]]:
+    """
+    Price every line of a cart.
+
+    Args:
+        catalog: Catalog snapshot
+        quantities: Product ID mapped to quantity
+
+    Returns:
+        tuple: Priced lines, cart total and the IDs of unknown products
+    """
+    return price_carts(catalog, [quantities])[0]
@@ -0,0 +1,290 @@
+"""On-demand sampling profiler and memory snapshots (stdlib only).
+
+Used by the FastAPI ``/debug`` endpoints and by the Django debug views, so
+this module must not import anything from FastAPI or Django.
+
+``SamplingProfiler`` reads every thread's stack from
+``sys._current_frames()`` at a fixed interval on a background thread. Nothing
+is hooked into the profiled code, so the overhead is the sampling thread
+alone (a few percent at the default 5 ms). Results are collapsed stacks,
+one ``frame;frame;frame count`` line per distinct stack, which
+``flamegraph.pl``, speedscope and inferno read directly.
+
+``MemorySnapshots`` wraps ``tracemalloc``: record a baseline, exercise the
+worker, then diff the current heap against it.
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Iterable, List, Optional
+
+DEFAULT_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 120
+REQUEST_PROFILES_KEPT = 20
+
+# Frames at the top of a stack that mean the thread is parked, not working
+IDLE_FUNCTIONS = {"wait", "select", "poll", "_worker", "accept", "_wait_for_tstate_lock"}
+
+
+class ProfilerBusy(Exception):
+    """A whole-process profile is already running in this worker."""
+
+
+def _frame_label(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    path = code.co_filename.replace(os.sep, "/")
+    short = "/".join(path.split("/")[-2:])
+    return f"{name} ({short}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Sample thread stacks on a background thread.
+
+    Attributes:
+        interval: Seconds between samples
+        thread_ids: Only sample these threads (None for all)
+        include_idle: Keep samples of threads parked in waits
+        samples: Number of sampling rounds taken
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_ids: Optional[Iterable[int]] = None,
+                 include_idle: bool = False):
+        self.interval = max(interval, 0.001)
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.include_idle = include_idle
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self.duration = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.monotonic() - self._started
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            self.samples += 1
+            for thread_id, frame in frames.items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                if not self.include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                stack.reverse()
+                self._stacks[";".join(stack)] += 1
+            del frames
+
+    def collapsed(self) -> str:
+        """
+        The samples as collapsed stacks.
+
+        Returns:
+            str: ``thread;outer;...;inner count`` lines, most frequent first
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+_process_lock = threading.Lock()
+
+
+def profile_process(seconds: float, interval: float = DEFAULT_INTERVAL, include_idle: bool = False) -> str:
+    """
+    Profile every thread of this worker for ``seconds`` (blocks the caller).
+
+    Args:
+        seconds: How long to sample, capped at ``MAX_PROFILE_SECONDS``
+        interval: Seconds between samples
+        include_idle: Keep samples of parked threads
+
+    Returns:
+        str: Collapsed stacks
+
+    Raises:
+        ProfilerBusy: Another whole-process profile is running
+    """
+    if not _process_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker")
+    try:
+        profiler = SamplingProfiler(interval, include_idle=include_idle).start()
+        try:
+            time.sleep(min(max(seconds, 0), MAX_PROFILE_SECONDS))
+        finally:
+            profiler.stop()
+        return profiler.collapsed()
+    finally:
+        _process_lock.release()
+
+
+class RequestProfiles:
+    """The last few single-request profiles, so they can be fetched after the response."""
+
+    def __init__(self, keep: int = REQUEST_PROFILES_KEPT):
+        self.keep = keep
+        self._profiles: "OrderedDict[str, str]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_id(self) -> str:
+        """ID for a profile that is about to start (it goes out in a response header first)."""
+        with self._lock:
+            return str(next(self._ids))
+
+    def save(self, profile_id: str, label: str, profiler: SamplingProfiler) -> None:
+        """
+        Store a finished profile.
+
+        Args:
+            profile_id: From ``new_id``
+            label: What was profiled, e.g. ``GET /items``
+            profiler: Stopped profiler
+        """
+        header = f"# {label} {profiler.duration * 1000:.1f}ms {profiler.samples} samples\n"
+        with self._lock:
+            self._profiles[profile_id] = header + profiler.collapsed()
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[str]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+request_profiles = RequestProfiles()
+
+
+class ProfileRequestMiddleware:
+    """ASGI middleware: profile a request sent with ``X-Profile: 1`` and a valid ``X-Admin-Token``.
+
+    The response gets an ``X-Profile-Id`` header; the profile is kept in
+    ``request_profiles``. Sync endpoints run in the threadpool, so every busy
+    thread of the worker is sampled: profile on a quiet worker.
+    """
+
+    def __init__(self, app, authorize, interval: float = DEFAULT_INTERVAL):
+        self.app = app
+        self.authorize = authorize
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", ()))
+        wanted = headers.get(b"x-profile") == b"1"
+        if not wanted or not self.authorize(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = request_profiles.new_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler(self.interval).start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            request_profiles.save(profile_id, f"{scope['method']} {scope['path']}", profiler)
+
+
+class MemorySnapshots:
+    """Heap snapshots with ``tracemalloc``, diffed against a baseline."""
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def baseline(self, frames: int = 10) -> dict:
+        """
+        Start tracing if needed and record the current heap as the baseline.
+
+        Args:
+            frames: Stack depth kept per allocation (only used when tracing starts)
+
+        Returns:
+            dict: Traced memory right now
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._baseline = self._take()
+            return self.status()
+
+    def diff(self, limit: int = 25, key_type: str = "lineno") -> List[str]:
+        """
+        Compare the heap with the baseline.
+
+        Args:
+            limit: Number of entries, biggest growth first
+            key_type: ``lineno``, ``filename`` or ``traceback``
+
+        Returns:
+            List[str]: One line per allocation site (a block of lines for tracebacks)
+
+        Raises:
+            RuntimeError: No baseline was recorded
+        """
+        with self._lock:
+            if self._baseline is None or not tracemalloc.is_tracing():
+                raise RuntimeError("Record a baseline first")
+            stats = self._take().compare_to(self._baseline, key_type)
+        lines = []
+        for stat in stats[:limit]:
+            if key_type == "traceback":
+                lines.append(str(stat))
+                lines.extend(f"    {line}" for line in stat.traceback.format())
+            else:
+                lines.append(str(stat))
+        return lines
+
+    def stop(self) -> None:
+        """Stop tracing and drop the baseline."""
+        with self._lock:
+            self._baseline = None
+            tracemalloc.stop()
+
+    def status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": tracemalloc.is_tracing(), "has_baseline": self._baseline is not None,
+                "current_bytes": current, "peak_bytes": peak}
+
+    def _take(self) -> tracemalloc.Snapshot:
+        # Leave out tracemalloc's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+
+memory_snapshots = MemorySnapshots()
@@ -0,0 +1,105 @@
+"""Incremental updates and lookups for "customers also bought".
+
+Django owns ``store_relatedproduct`` (store.RelatedProduct) and rebuilds it
+from every order with ``manage.py rebuild_related``. Between rebuilds
+``record_order`` adds a new order's product pairs in the order's own
+transaction, then trims the products it touched to ``2 * RELATED_KEEP``
+neighbours, so pairs that are just starting to sell together have room to
+climb. Reads are one index range scan per product.
+"""
+import os
+from typing import Iterable, List
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Same variables as Django's settings.RELATED_KEEP / RELATED_MAX_BASKET
+RELATED_KEEP = int(os.environ.get("RELATED_KEEP", "20"))
+RELATED_MAX_BASKET = int(os.environ.get("RELATED_MAX_BASKET", "20"))
+RELATED_LIMIT = 8
+
+_table = models.RelatedProduct.__table__
+
+
+def record_order(db: Session, product_ids: Iterable[int]) -> int:
+    """
+    Count one more order for every pair of products in it (not committed).
+
+    Args:
+        db: Session holding the order's transaction
+        product_ids: Products of the order
+
+    Returns:
+        int: Pairs updated (0 for single-product orders and ones over ``RELATED_MAX_BASKET``)
+    """
+    products = sorted(set(product_ids))
+    if not 2 <= len(products) <= RELATED_MAX_BASKET:
+        return 0
+    pairs = [{"product_id": a, "related_id": b, "orders": 1} for a in products for b in products if a != b]
+    db.execute(
+        insert(_table).on_conflict_do_update(
+            index_elements=["product_id", "related_id"], set_={"orders": _table.c.orders + 1},
+        ),
+        pairs,
+    )
+    ranked = (
+        select(
+            _table.c.id,
+            func.row_number().over(
+                partition_by=_table.c.product_id, order_by=(_table.c.orders.desc(), _table.c.related_id),
+            ).label("rank"),
+        )
+        .where(_table.c.product_id.in_(products))
+        .subquery()
+    )
+    db.execute(delete(_table).where(_table.c.id.in_(
+        select(ranked.c.id).where(ranked.c.rank > 2 * RELATED_KEEP)
+    )))
+    return len(pairs)
+
+
+def related_ids(db: Session, product_id: int, limit: int = RELATED_LIMIT) -> List[int]:
+    """
+    Products most often bought with a product.
+
+    Args:
+        db: Database session
+        product_id: Product being viewed
+        limit: Number of products
+
+    Returns:
+        List[int]: Product ids, most shared orders first
+    """
+    rows = db.execute(
+        select(_table.c.related_id)
+        .where(_table.c.product_id == product_id)
+        .order_by(_table.c.orders.desc(), _table.c.related_id)
+        .limit(limit)
+    )
+    return [related_id for (related_id,) in rows]
+
+
+def related_to_cart(db: Session, product_ids: List[int], limit: int = RELATED_LIMIT) -> List[int]:
+    """
+    Products most often bought with a cart's products, leaving out those already in it.
+
+    Args:
+        db: Database session
+        product_ids: Products in the cart
+        limit: Number of products
+
+    Returns:
+        List[int]: Product ids, most shared orders (summed over the cart) first
+    """
+    shared = func.sum(_table.c.orders)
+    rows = db.execute(
+        select(_table.c.related_id)
+        .where(_table.c.product_id.in_(product_ids), _table.c.related_id.notin_(product_ids))
+        .group_by(_table.c.related_id)
+        .order_by(shared.desc(), _table.c.related_id)
+        .limit(limit)
+    )
+    return [related_id for (related_id,) in rows]
@@ -0,0 +1,145 @@
+"""Request coalescing for hot read endpoints.
+
+Identical concurrent reads (same route and query parameters) share one
+computation: the first request runs it, the others wait for its result. The
+serialized response is then reused for ``SINGLEFLIGHT_TTL`` seconds, so a
+dashboard refresh or a catalog expiry turns into one query instead of a
+burst of identical ones.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+SINGLEFLIGHT_TTL = float(os.environ.get("SINGLEFLIGHT_TTL", "2"))
+SINGLEFLIGHT_MAX_KEYS = 1024
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "expires")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.expires = 0.0
+
+
+class SingleFlight:
+    """Thread-safe single-flight group with a short result cache.
+
+    The sync endpoints run in the threadpool, so waiting is done on a
+    ``threading.Event``. Errors are passed to the requests that waited for
+    them but are not cached.
+    """
+
+    def __init__(self, ttl: float = SINGLEFLIGHT_TTL, max_keys: int = SINGLEFLIGHT_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._calls: "OrderedDict[str, _Call]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Return the result of ``compute()``, shared with concurrent and recent calls for ``key``.
+
+        Args:
+            key: What makes two calls identical
+            compute: Produces the result
+            ttl: Seconds to keep the result (defaults to ``self.ttl``)
+
+        Returns:
+            Any: The shared result
+
+        Raises:
+            Exception: Whatever ``compute`` raised, in the caller that ran it and in the waiting ones
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None or (call.done.is_set() and call.expires <= time.monotonic())
+            if leader:
+                call = self._calls[key] = _Call()
+                self._calls.move_to_end(key)
+                self._evict()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = compute()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            raise
+        finally:
+            call.expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+            call.done.set()
+        return call.result
+
+    def forget(self, key: str) -> None:
+        """Drop the cached result of ``key``; a call in flight still finishes for its waiters."""
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every cached result."""
+        with self._lock:
+            self._calls.clear()
+
+    def _evict(self) -> None:
+        # Oldest keys first, never one that is still running
+        for key in list(self._calls):
+            if len(self._calls) <= self.max_keys:
+                break
+            if self._calls[key].done.is_set():
+                del self._calls[key]
+
+
+single_flight = SingleFlight()
+
+
+def request_key(request: Request) -> str:
+    """
+    Coalescing key of a request: method, path and sorted query parameters.
+
+    Args:
+        request: Incoming request
+
+    Returns:
+        str: Key such as ``GET /ecom/totalrevenue?a=1&b=2``
+    """
+    params = urlencode(sorted(request.query_params.multi_items()))
+    return f"{request.method} {request.url.path}?{params}"
+
+
+def json_bytes(content: Any) -> bytes:
+    """Serialize like ``JSONResponse`` does."""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def coalesced_response(key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Response:
+    """
+    JSON response for ``key``, computed once per flight and TTL.
+
+    Args:
+        key: Coalescing key, usually ``request_key(request)``
+        compute: Returns the response body, as bytes or as JSON-compatible data
+        ttl: Seconds to keep the result (defaults to ``SINGLEFLIGHT_TTL``)
+
+    Returns:
+        Response: ``application/json`` response with the shared body
+    """
+    def serialize() -> bytes:
+        content = compute()
+        return content if isinstance(content, bytes) else json_bytes(content)
+
+    return Response(content=single_flight.do(key, serialize, ttl), media_type="application/json")
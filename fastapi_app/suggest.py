@@ -0,0 +1,414 @@
+"""Typo-tolerant autocomplete over product names and categories.
+
+``SuggestIndex`` keeps every word of a product's name and category name in a
+character trie (prefix lookups) and in a trigram index (typo lookups). A query
+like ``air forc`` is split into words: the finished words must match a whole
+word, the last one may be a prefix since the shopper is still typing. A word
+that matches nothing is retried against indexed words within one or two
+edits, found through shared trigrams, so ``nkie dunk`` still finds Nike Dunks.
+Matches are ranked by units sold, then by name.
+
+The index follows the catalog cache: when a new snapshot is loaded only the
+products whose name or category changed are re-indexed, and units sold are
+added by ``POST /orders`` as orders come in.
+"""
+import heapq
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+from .catalog import Catalog
+
+SUGGEST_LIMIT = 10
+# Units sold are reloaded from the database this often (other workers take orders too)
+SUGGEST_SALES_REFRESH = float(os.environ.get("SUGGEST_SALES_REFRESH", "300"))
+# Rankings are redone at most this often after new sales
+SUGGEST_RERANK_INTERVAL = float(os.environ.get("SUGGEST_RERANK_INTERVAL", "10"))
+SUGGEST_CACHE_SIZE = 4096
+# Most indexed words checked for being a typo away from a query word
+SUGGEST_TYPO_CANDIDATES = 256
+# Rank by sorting the matches when they are fewer than 1/N of the catalog, else walk the ranking
+SUGGEST_WALK_RATIO = 64
+
+_WORD = re.compile(r"\w+")
+
+
+def words(text: Optional[str]) -> List[str]:
+    """Lowercased words of ``text``."""
+    return _WORD.findall((text or "").casefold())
+
+
+def trigrams(word: str, prefix: bool = False) -> Set[str]:
+    """
+    Padded trigrams of a word.
+
+    Args:
+        word: Lowercased word
+        prefix: The word may continue (no end padding)
+
+    Returns:
+        Set[str]: Trigrams such as ``"  n"``, ``" ni"``, ``"nik"``...
+    """
+    padded = f"  {word}" if prefix else f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(word: str) -> int:
+    """Edits tolerated in a word of this length (none in model numbers)."""
+    if len(word) < 3 or any(char.isdigit() for char in word):
+        return 0
+    return 1 if len(word) <= 5 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Damerau-Levenshtein distance (adjacent swaps count as one edit), bounded.
+
+    Args:
+        a: First word
+        b: Second word
+        limit: Stop once the distance is certainly above this
+
+    Returns:
+        int: The distance, or ``limit + 1`` if it is larger than ``limit``
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+class _Node:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.ids: Set[int] = set()
+
+
+class SuggestIndex:
+    """In-memory prefix trie and trigram index over the catalog.
+
+    Searches and updates are serialized by one lock. The slow parts of an
+    update (diffing a catalog snapshot, sorting every product by units sold)
+    are done before taking it, so searches never wait on them.
+
+    Attributes:
+        version: Catalog version the index was last synced to (0 before the first sync)
+    """
+
+    def __init__(self, cache_size: int = SUGGEST_CACHE_SIZE):
+        self.version = 0
+        self.cache_size = cache_size
+        self._root = _Node()
+        self._postings: Dict[str, Set[int]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        # id -> (name, category name, words) as indexed
+        self._indexed: Dict[int, Tuple[str, Optional[str], Tuple[str, ...]]] = {}
+        self._sort_names: Dict[int, str] = {}
+        self._sales: Dict[int, int] = {}
+        # Every product id best first, and each id's place in that order
+        self._order: List[int] = []
+        self._position: Dict[int, int] = {}
+        # Products under a trie prefix, and indexed words close to a typo
+        self._prefixes: "OrderedDict[str, Set[int]]" = OrderedDict()
+        self._typos: "OrderedDict[Tuple[str, bool], Set[int]]" = OrderedDict()
+        self._reranked_at = 0.0
+        self._sales_loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._rerank_lock = threading.Lock()
+
+    # ---- building -------------------------------------------------------
+
+    def refresh(self, db: Session, catalog: Catalog) -> None:
+        """
+        Bring the index up to date with a catalog snapshot.
+
+        The first call builds the index. Later ones only run when the catalog
+        version changed, and only in one thread: the others keep searching
+        the current index meanwhile.
+
+        Args:
+            db: Session used to read category names and units sold
+            catalog: Current catalog snapshot
+        """
+        if self.version == catalog.version:
+            return
+        if not self._sync_lock.acquire(blocking=self.version == 0):
+            return
+        try:
+            if self.version == catalog.version:
+                return
+            categories = dict(db.query(models.Category.id, models.Category.name).all())
+            sales = None
+            if time.monotonic() - self._sales_loaded_at >= SUGGEST_SALES_REFRESH or not self._sales_loaded_at:
+                sales = load_sales(db)
+                self._sales_loaded_at = time.monotonic()
+            self.sync(((p.id, p.name, categories.get(p.category_id)) for p in catalog.products),
+                      catalog.version, sales)
+        finally:
+            self._sync_lock.release()
+
+    def sync(self, products: Iterable[Tuple[int, str, Optional[str]]], version: int,
+             sales: Optional[Dict[int, int]] = None) -> int:
+        """
+        Re-index the products that changed and drop the ones that are gone.
+
+        Args:
+            products: ``(id, name, category name)`` of every product
+            version: Catalog version being synced to
+            sales: Units sold per product id, replacing the current counts
+
+        Returns:
+            int: Number of products added, changed or removed
+        """
+        seen: Set[int] = set()
+        changes = []
+        for product_id, name, category in products:
+            seen.add(product_id)
+            indexed = self._indexed.get(product_id)
+            if indexed is None or indexed[0] != name or indexed[1] != category:
+                changes.append((product_id, name, category))
+        removed = [product_id for product_id in self._indexed if product_id not in seen]
+
+        with self._lock:
+            for product_id in removed:
+                self._remove(product_id)
+            for product_id, name, category in changes:
+                self._remove(product_id)
+                self._add(product_id, name, category)
+            if sales is not None:
+                self._sales = dict(sales)
+            if changes or removed:
+                self._prefixes.clear()
+                self._typos.clear()
+        if changes or removed or sales is not None:
+            self._rerank()
+        with self._lock:
+            self.version = version
+        return len(changes) + len(removed)
+
+    def record_sale(self, quantities: Dict[int, int]) -> None:
+        """
+        Add units sold and re-rank if the last ranking is older than ``SUGGEST_RERANK_INTERVAL``.
+
+        Args:
+            quantities: Units per product id
+        """
+        with self._lock:
+            for product_id, quantity in quantities.items():
+                self._sales[product_id] = self._sales.get(product_id, 0) + quantity
+        if time.monotonic() - self._reranked_at >= SUGGEST_RERANK_INTERVAL:
+            self._rerank()
+
+    def _rerank(self) -> None:
+        # Sort on copies so searches carry on with the old order meanwhile
+        with self._rerank_lock:
+            with self._lock:
+                sales, names = dict(self._sales), dict(self._sort_names)
+            order = sorted(names, key=lambda i: (-sales.get(i, 0), names[i], i))
+            position = {product_id: n for n, product_id in enumerate(order)}
+            with self._lock:
+                self._order, self._position = order, position
+            self._reranked_at = time.monotonic()
+
+    def _add(self, product_id: int, name: str, category: Optional[str]) -> None:
+        terms = tuple(dict.fromkeys(words(name) + words(category)))
+        self._indexed[product_id] = (name, category, terms)
+        self._sort_names[product_id] = name.casefold()
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                node = self._root
+                for char in term:
+                    node = node.children.setdefault(char, _Node())
+                postings = self._postings[term] = node.ids
+                for gram in trigrams(term):
+                    self._trigrams.setdefault(gram, set()).add(term)
+            postings.add(product_id)
+
+    def _remove(self, product_id: int) -> None:
+        indexed = self._indexed.pop(product_id, None)
+        if indexed is None:
+            return
+        del self._sort_names[product_id]
+        for term in indexed[2]:
+            postings = self._postings[term]
+            postings.discard(product_id)
+            if not postings:
+                del self._postings[term]
+                self._prune(term)
+                for gram in trigrams(term):
+                    terms = self._trigrams[gram]
+                    terms.discard(term)
+                    if not terms:
+                        del self._trigrams[gram]
+
+    def _prune(self, term: str) -> None:
+        path = [self._root]
+        for char in term:
+            path.append(path[-1].children[char])
+        for depth in range(len(term), 0, -1):
+            node = path[depth]
+            if node.ids or node.children:
+                break
+            del path[depth - 1].children[term[depth - 1]]
+
+    # ---- searching ------------------------------------------------------
+
+    def category_name(self, product_id: int) -> Optional[str]:
+        """Category name a product was indexed with."""
+        indexed = self._indexed.get(product_id)
+        return indexed[1] if indexed else None
+
+    def suggest(self, query: str, limit: int = SUGGEST_LIMIT) -> List[int]:
+        """
+        Product ids matching what the shopper typed so far, best first.
+
+        Args:
+            query: Search box contents
+            limit: Number of suggestions
+
+        Returns:
+            List[int]: Product ids, most sold first
+        """
+        tokens = words(query)
+        if not tokens or limit <= 0:
+            return []
+        # A trailing space means the last word is finished
+        finished, partial = (tokens, None) if query[-1:].isspace() else (tokens[:-1], tokens[-1])
+
+        with self._lock:
+            matches = None
+            for word in finished:
+                ids = self._word_ids(word)
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    return []
+            if partial is not None:
+                ids = self._prefix_ids(partial)
+                matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+            if len(matches) * SUGGEST_WALK_RATIO < len(self._order):
+                return heapq.nsmallest(limit, matches, key=self._rank_key())
+            # Plenty of matches: walk the ranking, about limit * ratio steps at most
+            results = []
+            for product_id in self._order:
+                if product_id in matches:
+                    results.append(product_id)
+                    if len(results) == limit:
+                        return results
+            # Products added since the last ranking
+            results.extend(sorted(matches.difference(self._position))[:limit - len(results)])
+            return results
+
+    def _rank_key(self) -> Callable[[int], int]:
+        position, last = self._position, len(self._position)
+        # Products added since the last ranking go after the ranked ones
+        return lambda product_id: position.get(product_id, last)
+
+    def _word_ids(self, word: str) -> Set[int]:
+        ids = self._postings.get(word)
+        if ids:
+            return ids
+        return self._typo_ids(word, prefix=False)
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        ids = self._prefixes.get(prefix)
+        if ids is not None:
+            self._prefixes.move_to_end(prefix)
+            return ids
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                break
+        ids = set()
+        if node is not None:
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                ids.update(current.ids)
+                stack.extend(current.children.values())
+        else:
+            ids = self._typo_ids(prefix, prefix=True)
+        self._prefixes[prefix] = ids
+        if len(self._prefixes) > self.cache_size:
+            self._prefixes.popitem(last=False)
+        return ids
+
+    def _typo_ids(self, word: str, prefix: bool) -> Set[int]:
+        """Products with a word within ``max_typos`` of ``word`` (of its start, for a prefix)."""
+        key = (word, prefix)
+        cached = self._typos.get(key)
+        if cached is not None:
+            self._typos.move_to_end(key)
+            return cached
+        limit = max_typos(word)
+        similar = []
+        if limit:
+            grams = trigrams(word, prefix)
+            shared: Dict[str, int] = {}
+            for gram in grams:
+                for term in self._trigrams.get(gram, ()):
+                    shared[term] = shared.get(term, 0) + 1
+            # An edit changes at most three trigrams, a swap four
+            needed = max(1, len(grams) - 4 * limit)
+            candidates = [term for term, count in shared.items() if count >= needed]
+            if len(candidates) > SUGGEST_TYPO_CANDIDATES:
+                # Short words share a trigram with lots of words: check the closest, commonest ones
+                postings = self._postings
+                candidates = heapq.nlargest(SUGGEST_TYPO_CANDIDATES, candidates,
+                                            key=lambda term: (shared[term], len(postings[term])))
+            for term in candidates:
+                if prefix:
+                    distance = min(edit_distance(word, term[:len(word) + d], limit) for d in (-1, 0, 1))
+                else:
+                    distance = edit_distance(word, term, limit)
+                if distance <= limit:
+                    similar.append(term)
+        ids = self._typos[key] = set().union(*(self._postings[term] for term in similar))
+        if len(self._typos) > self.cache_size:
+            self._typos.popitem(last=False)
+        return ids
+
+
+def load_sales(db: Session) -> Dict[int, int]:
+    """
+    Units sold per product, from all order lines.
+
+    Args:
+        db: Database session
+
+    Returns:
+        Dict[int, int]: Product id mapped to units sold
+    """
+    rows = (
+        db.query(models.OrderItem.product_id, func.sum(models.OrderItem.quantity))
+        .filter(models.OrderItem.product_id.isnot(None))
+        .group_by(models.OrderItem.product_id)
+        .all()
+    )
+    return {product_id: int(units or 0) for product_id, units in rows}
+
+
+suggest_index = SuggestIndex()
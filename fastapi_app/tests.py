@@ -0,0 +1,152 @@
+"""Tests for the API modules that don't need a running server.
+
+Discovered by ``python manage.py test`` along with the Django apps' tests.
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from . import admission, inventory, models
+from .catalog import catalog_cache
+from .database import Base
+
+
+def _scope(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return {"type": "http", "client": (peer, 50000), "headers": headers}
+
+
+class AdmissionTests(unittest.TestCase):
+    def test_cart_pricing_is_not_checkout(self):
+        self.assertIs(admission.classify("POST", "/orders"), admission.CHECKOUT)
+        self.assertIs(admission.classify("POST", "/cart/price"), admission.CATALOG)
+
+    @mock.patch.object(admission, "ADMISSION_TRUSTED_PROXIES", {"172.28.0.10"})
+    def test_client_address(self):
+        # Untrusted peers are themselves, whatever they claim
+        self.assertEqual(admission.client_address(_scope("198.51.100.1", "203.0.113.7")), "198.51.100.1")
+        # The storefront is accounted per shopper
+        self.assertEqual(admission.client_address(_scope("172.28.0.10", "203.0.113.7, 10.0.0.1")), "203.0.113.7")
+        # ... and its own calls (outbox) skip the buckets
+        self.assertIsNone(admission.client_address(_scope("172.28.0.10")))
+
+
+class InventoryTests(unittest.TestCase):
+    """``inventory`` against a scratch SQLite database (the real one is never touched)."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.engine = create_engine(f"sqlite:///{os.path.join(tmp.name, 'test.sqlite3')}")
+        self.addCleanup(self.engine.dispose)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine, autoflush=False)
+        with self.Session() as db:
+            db.add(models.Category(id=1, name="Shoes", slug="shoes"))
+            db.add(models.Product(id=1, name="Sneaker", price=100, category_id=1, stock=5))
+            db.add(models.Product(id=2, name="Socks", price=5, category_id=1))  # not stock-tracked
+            db.add(models.Product(id=3, name="Boot", price=150, category_id=1, stock=1))
+            db.commit()
+        self.db = self.Session()
+        self.addCleanup(self.db.close)
+
+    def stock(self, product_id):
+        with self.Session() as db:
+            return db.get(models.Product, product_id).stock
+
+    def reservations(self):
+        with self.Session() as db:
+            return db.scalar(select(func.count()).select_from(models.StockReservation))
+
+    def test_take_is_all_or_nothing(self):
+        with self.assertRaises(inventory.SoldOut) as caught:
+            inventory.take(self.db, {1: 2, 3: 2})
+        self.db.rollback()
+        self.assertEqual(caught.exception.product_ids, [3])
+        self.assertEqual((self.stock(1), self.stock(3)), (5, 1))
+
+        self.assertEqual(inventory.take(self.db, {1: 2, 3: 1}), ([3], []))
+        self.db.commit()
+        self.assertEqual((self.stock(1), self.stock(3)), (3, 0))
+
+    def test_reservation_claimed_by_the_order_only_once(self):
+        inventory.reserve(self.db, "k", {1: 2})
+        self.db.commit()
+        self.assertEqual(self.stock(1), 3)
+
+        # The order uses the held units instead of taking more
+        self.assertEqual(inventory.take(self.db, {1: 2}, "k"), ([], []))
+        self.db.commit()
+        self.assertEqual(self.stock(1), 3)
+
+        # ... so the sweep has nothing left to give back
+        self.assertEqual(inventory.release_expired(self.db, datetime.utcnow() + timedelta(days=1)), [])
+        self.db.commit()
+        self.assertEqual(self.stock(1), 3)
+
+    def test_reservation_claimed_by_the_sweep_only_once(self):
+        inventory.reserve(self.db, "k", {1: 2}, ttl=60)
+        self.db.commit()
+        self.assertEqual(inventory.release_expired(self.db), [])  # not expired yet
+        self.assertEqual(inventory.release_expired(self.db, datetime.utcnow() + timedelta(minutes=2)), [1])
+        self.db.commit()
+        self.assertEqual((self.stock(1), self.reservations()), (5, 0))
+
+        # A late order finds no hold and takes its units like any other
+        self.assertEqual(inventory.take(self.db, {1: 2}, "k"), ([], []))
+        self.db.commit()
+        self.assertEqual(self.stock(1), 3)
+
+    def test_surplus_reserved_units_go_back(self):
+        inventory.reserve(self.db, "k", {1: 3})
+        self.db.commit()
+        self.assertEqual(self.stock(1), 2)
+
+        self.assertEqual(inventory.take(self.db, {1: 1}, "k"), ([], [1]))
+        self.db.commit()
+        self.assertEqual((self.stock(1), self.reservations()), (4, 0))
+
+    def test_untracked_products_are_left_alone(self):
+        self.assertEqual(inventory.take(self.db, {2: 50}), ([], []))
+        held = inventory.reserve(self.db, "k", {2: 3, 3: 2})
+        self.db.commit()
+        self.assertEqual((held["reserved"], held["unavailable"]), ({}, [3]))
+        self.assertEqual(inventory.release_expired(self.db, datetime.utcnow() + timedelta(days=1)), [])
+        self.db.commit()
+        self.assertEqual((self.stock(2), self.stock(3), self.reservations()), (None, 1, 0))
+
+    def test_sold_out_gate(self):
+        gate = inventory.SoldOutGate(ttl=60)
+        gate.mark([3])
+        self.assertEqual(gate.check([1, 3]), [3])
+        gate.clear([3])
+        self.assertEqual(gate.check([1, 3]), [])
+        self.assertEqual(inventory.SoldOutGate(ttl=0).check([3]), [])
+
+    def test_reserved_order_skips_the_gate(self):
+        from .main import OrderIn, add_order
+
+        inventory.reserve(self.db, "k", {3: 1})
+        self.db.commit()
+        catalog_cache.invalidate()
+        self.addCleanup(catalog_cache.invalidate)
+        gate = inventory.SoldOutGate(ttl=60)
+        gate.mark([3])
+
+        def order(**kwargs):
+            return OrderIn(full_name="Ann", email="ann@example.com", shipping_address="1 Main St",
+                           items=[{"product_id": 3, "quantity": 1}], **kwargs)
+
+        with mock.patch.object(inventory, "sold_out_gate", gate):
+            with self.assertRaises(HTTPException) as caught:
+                add_order(order(), idempotency_key=None, db=self.db)
+            self.assertEqual(caught.exception.status_code, 409)
+            # The shopper holding the last boot still gets it
+            add_order(order(reservation_key="k"), idempotency_key=None, db=self.db)
+        self.assertEqual((self.stock(3), self.reservations()), (0, 0))
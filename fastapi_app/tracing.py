@@ -0,0 +1,499 @@
+"""Lightweight request tracing shared by Django and the API (stdlib only).
+
+A trace is a tree of spans (server request, view, template, SQL, outgoing
+HTTP call...). The current span lives in a context variable; the trace
+crosses from Django to the API in a W3C ``traceparent`` header, so the API's
+request span becomes a child of Django's HTTP client span.
+
+Spans are buffered per request and written as JSON lines when the request
+ends, one rotating file per process (``<TRACE_DIR>/<service>-<pid>.jsonl``),
+so gunicorn workers never rotate a file from under each other. Django and
+the API share TRACE_DIR (a volume in docker-compose), so a trace's spans
+from both sides can be joined. Only ``TRACE_SAMPLE_RATE`` of new traces are
+recorded (1% by default; the API follows Django's decision). Summarize
+them with::
+
+    python -m fastapi_app.tracing summarize [--dir traces] [--top 10]
+    python -m fastapi_app.tracing show <trace_id>
+"""
+import argparse
+import contextvars
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+TRACE_DIR = os.environ.get("TRACE_DIR", "traces")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.environ.get("TRACE_BACKUPS", "5"))
+SQL_MAX_LENGTH = 300
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+SQL_NAME_RE = re.compile(r'^\s*(\w+)(?:.*?\b(?:FROM|INTO|UPDATE)\s+"?(\w+))?', re.IGNORECASE | re.DOTALL)
+ID_IN_PATH_RE = re.compile(r"/\d+(?=/|$)")
+
+
+class SpanContext(NamedTuple):
+    """What a child span needs from its parent."""
+    trace_id: str
+    span_id: str
+    sampled: bool
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """
+    Read a W3C ``traceparent`` header.
+
+    Args:
+        value: Header value
+
+    Returns:
+        Optional[SpanContext]: The remote parent, or None if missing or malformed
+    """
+    match = TRACEPARENT_RE.match((value or "").strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+def sql_span_name(sql: str) -> str:
+    """``SQL SELECT store_product`` style name, so statements group by verb and table."""
+    match = SQL_NAME_RE.match(sql)
+    if not match:
+        return "SQL"
+    verb, table = match.groups()
+    return f"SQL {verb.upper()} {table}" if table else f"SQL {verb.upper()}"
+
+
+def path_name(path: str) -> str:
+    """Replace numeric path segments with ``{id}``, e.g. ``/orders/{id}``."""
+    return ID_IN_PATH_RE.sub("/{id}", path)
+
+
+class _Buffer:
+    """Spans of one trace recorded by this process for the current request."""
+    __slots__ = ("spans",)
+
+    def __init__(self):
+        self.spans: List[dict] = []
+
+
+class Span:
+    """One timed operation. Use as a context manager, or call ``end()``."""
+
+    __slots__ = ("tracer", "name", "kind", "trace_id", "span_id", "parent_id", "sampled",
+                 "attrs", "start", "_started", "_buffer", "_root", "_parent", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, kind: str, trace_id: str, parent_id: Optional[str],
+                 sampled: bool, buffer: _Buffer, root: bool, parent: Optional["Span"], attrs: Optional[dict]):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attrs = dict(attrs or {})
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._buffer = buffer
+        self._root = root
+        self._parent = parent
+        self._token = _current.set(self)
+
+    @property
+    def context(self) -> SpanContext:
+        return SpanContext(self.trace_id, self.span_id, self.sampled)
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def end(self) -> None:
+        duration = time.perf_counter() - self._started
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Ended in another context than it started in
+            _current.set(self._parent)
+        if not self.sampled:
+            return
+        self._buffer.spans.append({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": self.tracer.service,
+            "start": round(self.start, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "attrs": self.attrs,
+        })
+        if self._root:
+            self.tracer.write(self._buffer.spans)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.end()
+
+
+class _NullSpan:
+    """Stand-in when there is no trace to add a child span to."""
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("trace_span", default=None)
+
+
+class Tracer:
+    """Creates spans and writes finished traces to this process's rotating file."""
+
+    def __init__(self):
+        self.service = "app"
+        self.directory = TRACE_DIR
+        self.sample_rate = TRACE_SAMPLE_RATE
+        self.max_bytes = TRACE_MAX_BYTES
+        self.backups = TRACE_BACKUPS
+        self._handler: Optional[logging.Handler] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+
+    def configure(self, service: str, directory: Optional[str] = None, sample_rate: Optional[float] = None) -> None:
+        """
+        Name this process's service and pick where its traces go.
+
+        Args:
+            service: Service name, the start of the trace file names
+            directory: Trace directory (defaults to ``TRACE_DIR``)
+            sample_rate: Share of new traces recorded, 0 to 1 (defaults to ``TRACE_SAMPLE_RATE``)
+        """
+        with self._lock:
+            self.service = service
+            if directory is not None:
+                self.directory = str(directory)
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+            if self._handler is not None:
+                self._handler.close()
+                self._handler = None
+
+    def start_span(self, name: str, kind: str = "internal", parent: Optional[SpanContext] = None,
+                   attrs: Optional[dict] = None) -> Span:
+        """
+        Start a span as a child of the current one.
+
+        With no current span it starts a new local root: a child of
+        ``parent`` when given (a remote caller, another thread), else a new
+        trace. A local root writes its request's spans when it ends.
+
+        Args:
+            name: Span name, keep it low-cardinality (route, not URL)
+            kind: server, client, view, template, sql or internal
+            parent: Parent from another process or thread
+            attrs: Extra fields to record
+
+        Returns:
+            Span: The running span, now current
+        """
+        current = _current.get() if parent is None else None
+        if current is not None:
+            return Span(self, name, kind, current.trace_id, current.span_id, current.sampled,
+                        current._buffer, False, current, attrs)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+            sampled = random.random() < self.sample_rate
+        return Span(self, name, kind, trace_id, parent_id, sampled, _Buffer(), True, None, attrs)
+
+    def child_span(self, name: str, kind: str = "internal", attrs: Optional[dict] = None):
+        """Like ``start_span`` but a no-op outside a trace (for SQL, templates, HTTP calls)."""
+        if _current.get() is None:
+            return NULL_SPAN
+        return self.start_span(name, kind, attrs=attrs)
+
+    def write(self, spans: Iterable[dict]) -> None:
+        lines = "\n".join(json.dumps(span, separators=(",", ":"), default=str) for span in spans)
+        if not lines:
+            return
+        try:
+            handler = self._handler if self._pid == os.getpid() else self._open()
+            handler.handle(logging.makeLogRecord({"msg": lines, "levelno": logging.INFO}))
+        except Exception:
+            # Tracing must never break a request
+            pass
+
+    def _open(self) -> logging.Handler:
+        # Also reopens after a fork, so each worker gets its own file
+        with self._lock:
+            pid = os.getpid()
+            if self._handler is None or self._pid != pid:
+                os.makedirs(self.directory, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    os.path.join(self.directory, f"{self.service}-{pid}.jsonl"),
+                    maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8",
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._handler, self._pid = handler, pid
+            return self._handler
+
+
+tracer = Tracer()
+configure = tracer.configure
+start_span = tracer.start_span
+child_span = tracer.child_span
+
+
+def current_context() -> Optional[SpanContext]:
+    """Context of the current span, to continue the trace in another thread."""
+    span = _current.get()
+    return span.context if span is not None else None
+
+
+def traceparent() -> Optional[str]:
+    """``traceparent`` header value for an outgoing call, or None outside a trace."""
+    context = current_context()
+    return format_traceparent(context) if context is not None else None
+
+
+# ============================================================
+# FastAPI / SQLAlchemy integration
+# ============================================================
+class TracingMiddleware:
+    """ASGI middleware: one server span per request, continuing the caller's ``traceparent``.
+
+    The span is named after the matched route (``GET /orders/{order_id}``)
+    and the response gets an ``X-Trace-Id`` header.
+    """
+
+    def __init__(self, app, skip_paths: Iterable[str] = ()):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        parent = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+        span = start_span(f"{scope['method']} {path_name(scope['path'])}", "server", parent=parent)
+        trace_id = span.trace_id.encode()
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                span.set(status=message["status"])
+                message["headers"] = [*message.get("headers", ()), (b"x-trace-id", trace_id)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                span.name = f"{scope['method']} {route.path}"
+            span.end()
+
+
+def instrument_engine(engine) -> None:
+    """
+    Record a span for every statement run on a SQLAlchemy engine.
+
+    Args:
+        engine: SQLAlchemy engine
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_spans", []).append(
+            child_span(sql_span_name(statement), "sql", attrs={"sql": statement[:SQL_MAX_LENGTH]})
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            span = spans.pop()
+            span.set(error=type(exception_context.original_exception).__name__)
+            span.end()
+
+
+# ============================================================
+# Summaries (python -m fastapi_app.tracing)
+# ============================================================
+def load_spans(directory: str) -> Dict[str, List[dict]]:
+    """
+    Read every trace file in ``directory``, rotated ones included.
+
+    Args:
+        directory: Trace directory
+
+    Returns:
+        dict: Spans grouped by trace id
+    """
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    for path in sorted(glob.glob(os.path.join(directory, "*.jsonl*"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def _tree(spans: List[dict]):
+    ids = {span["span_id"] for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        span["end"] = span["start"] + span["duration_ms"] / 1000
+        if span["parent_id"] in ids:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+    roots.sort(key=lambda s: s["start"])
+    return roots, children
+
+
+def critical_path(span: dict, children: dict, into: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    Milliseconds each span name contributes to the critical path under ``span``.
+
+    Walks back from the end of the span, always into the child that finished
+    last; time not covered by a child is the span's own. Work still running
+    after its parent ended (background threads) is cut at the parent's end.
+
+    Args:
+        span: Span with ``start``/``end`` seconds
+        children: Child spans by parent span id
+        into: Totals to add to
+
+    Returns:
+        dict: Span name to milliseconds
+    """
+    into = {} if into is None else into
+    cursor = span["end"]
+    own = 0.0
+    for child in sorted(children.get(span["span_id"], ()), key=lambda s: s["end"], reverse=True):
+        if child["start"] >= cursor:
+            continue
+        child_end = min(child["end"], cursor)
+        own += cursor - child_end
+        clipped = dict(child, end=child_end)
+        critical_path(clipped, children, into)
+        cursor = max(child["start"], span["start"])
+    own += max(cursor - span["start"], 0.0)
+    into[span["name"]] = into.get(span["name"], 0.0) + own * 1000
+    return into
+
+
+def _percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def summarize(directory: str, top: int = 10, out=sys.stdout) -> None:
+    """Print latency per entry point and where the critical path spends its time."""
+    by_root: Dict[str, list] = defaultdict(list)
+    for spans in load_spans(directory).values():
+        roots, children = _tree(spans)
+        if roots:
+            by_root[roots[0]["name"]].append((roots[0], children))
+
+    ranked = sorted(by_root.items(), key=lambda item: -sum(r["duration_ms"] for r, _ in item[1]))
+    for name, traces in ranked[:top]:
+        durations = [root["duration_ms"] for root, _ in traces]
+        out.write(f"\n{name}  n={len(traces)}  p50={_percentile(durations, 0.5):.1f}ms  "
+                  f"p95={_percentile(durations, 0.95):.1f}ms  max={max(durations):.1f}ms\n")
+        totals: Dict[str, float] = {}
+        for root, children in traces:
+            critical_path(root, children, totals)
+        whole = sum(totals.values()) or 1.0
+        for span_name, ms in sorted(totals.items(), key=lambda item: -item[1])[:top]:
+            out.write(f"    {ms / len(traces):9.2f}ms  {ms / whole:6.1%}  {span_name}\n")
+        slowest = max(traces, key=lambda t: t[0]["duration_ms"])[0]
+        out.write(f"    slowest: {slowest['trace_id']}\n")
+
+
+def show(directory: str, trace_id: str, out=sys.stdout) -> None:
+    """Print one trace as an indented tree with offsets from its start."""
+    spans = load_spans(directory).get(trace_id)
+    if not spans:
+        out.write(f"Trace {trace_id} not found\n")
+        return
+    roots, children = _tree(spans)
+    origin = roots[0]["start"]
+
+    def walk(span, depth):
+        offset = (span["start"] - origin) * 1000
+        out.write(f"{offset:9.2f}ms {span['duration_ms']:9.2f}ms  {'  ' * depth}{span['name']} "
+                  f"[{span['service']}/{span['kind']}]\n")
+        for child in sorted(children.get(span["span_id"], ()), key=lambda s: s["start"]):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m fastapi_app.tracing", description="Summarize trace files")
+    parser.add_argument("--dir", default=TRACE_DIR, help="Trace directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summarize", help="Latency and critical path per entry point")
+    summary.add_argument("--top", type=int, default=10)
+    one = commands.add_parser("show", help="Print one trace as a tree")
+    one.add_argument("trace_id")
+    args = parser.parse_args(argv)
+    if args.command == "summarize":
+        summarize(args.dir, args.top)
+    else:
+        show(args.dir, args.trace_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,71 @@
 from django.contrib import admin
-from .models import ShippingAddress, Order, OrderItem
+from django.utils import timezone
+from .models import ShippingAddress, Order, OrderItem, OrderOutbox
 from django.contrib.auth.models import User
 
-#Register the model on the admin section
-admin.site.register(ShippingAddress)
-admin.site.register(Order)
-admin.site.register(OrderItem)
+class ShippingAddressAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "user", "shipping_full_name", "shipping_city", "shipping_country"]
+    list_select_related = ["user"]
+    search_fields = ["^user__username", "^shipping_email"]
+    raw_id_fields = ["user"]
+    show_full_result_count = False
 
 class OrderItemInline(admin.StackedInline):
     model = OrderItem
     extra = 0
+    # Don't render every product / user as a <select> option for each item
+    autocomplete_fields = ["product"]
+    raw_id_fields = ["user"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product", "user")
 
 class OrderAdmin(admin.ModelAdmin):
     model = Order
     readonly_fields = ["date_oredered"]
     fields = ["user", "full_name", "email", "shipping_address", "amount_paid", "date_oredered", "shipped", "date_shipped"]
     inlines = [OrderItemInline]
+    actions = ["mark_shipped", "mark_unshipped"]
+    list_display = ["__str__", "user", "full_name", "email", "amount_paid", "date_oredered", "shipped", "date_shipped"]
+    list_select_related = ["user"]
+    # shipped + date order is payment_order_ship_date_idx
+    list_filter = ["shipped"]
+    ordering = ["-date_oredered", "-id"]
+    search_fields = ["=id", "^email", "^user__username"]
+    raw_id_fields = ["user"]
+    show_full_result_count = False
+
+    @admin.action(description="Mark selected orders as shipped")
+    def mark_shipped(self, request, queryset):
+        changed = queryset.mark_shipped()
+        self.message_user(request, f"{changed} orders marked as shipped.")
+
+    @admin.action(description="Mark selected orders as not shipped")
+    def mark_unshipped(self, request, queryset):
+        changed = queryset.mark_unshipped()
+        self.message_user(request, f"{changed} orders marked as not shipped.")
+
+class OrderItemAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "order", "product", "user", "quantity", "price"]
+    list_select_related = ["order", "product", "user"]
+    search_fields = ["=order__id", "^product__name"]
+    autocomplete_fields = ["product"]
+    raw_id_fields = ["order", "user"]
+    show_full_result_count = False
+
+#Register the model on the admin section
+admin.site.register(ShippingAddress, ShippingAddressAdmin)
+admin.site.register(Order, OrderAdmin)
+admin.site.register(OrderItem, OrderItemAdmin)
+
+class OrderOutboxAdmin(admin.ModelAdmin):
+    list_display = ["key", "status", "attempts", "next_attempt_at", "order_id", "created_at"]
+    list_filter = ["status"]
+    readonly_fields = ["key", "user", "payload", "attempts", "last_error", "order_id", "created_at", "sent_at"]
+    actions = ["retry_now"]
 
-admin.site.unregister(Order)
+    @admin.action(description="Retry selected entries now")
+    def retry_now(self, request, queryset):
+        queryset.exclude(status=OrderOutbox.SENT).update(status=OrderOutbox.PENDING, attempts=0, next_attempt_at=timezone.now())
 
-admin.site.register(Order, OrderAdmin)
\ No newline at end of file
+admin.site.register(OrderOutbox, OrderOutboxAdmin)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payment.outbox import dispatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver pending checkouts from the order outbox to the FastAPI service. Run it with "
+        "--loop as a worker so retries happen even when no new orders come in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help="Outbox rows claimed per batch")
+        parser.add_argument('--loop', action='store_true', help="Keep running instead of exiting when done")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep between passes with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = dispatch(options['batch_size'])
+            if processed or not options['loop']:
+                self.stdout.write(f"Processed {processed} outbox entries.")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
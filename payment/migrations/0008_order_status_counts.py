@@ -0,0 +1,81 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Orders are written by both Django and FastAPI, so the counts are kept by the database itself.
+TRIGGERS = [
+    """
+    CREATE TRIGGER payment_order_count_insert AFTER INSERT ON payment_order
+    BEGIN
+        UPDATE payment_orderstatuscount SET count = count + 1 WHERE shipped = NEW.shipped;
+    END
+    """,
+    """
+    CREATE TRIGGER payment_order_count_delete AFTER DELETE ON payment_order
+    BEGIN
+        UPDATE payment_orderstatuscount SET count = count - 1 WHERE shipped = OLD.shipped;
+    END
+    """,
+    """
+    CREATE TRIGGER payment_order_count_update AFTER UPDATE OF shipped ON payment_order
+    WHEN OLD.shipped IS NOT NEW.shipped
+    BEGIN
+        UPDATE payment_orderstatuscount SET count = count - 1 WHERE shipped = OLD.shipped;
+        UPDATE payment_orderstatuscount SET count = count + 1 WHERE shipped = NEW.shipped;
+    END
+    """,
+]
+
+DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS payment_order_count_insert",
+    "DROP TRIGGER IF EXISTS payment_order_count_delete",
+    "DROP TRIGGER IF EXISTS payment_order_count_update",
+]
+
+
+def install_counts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        # OrderStatusCount.counts() falls back to COUNT(*) without the rows
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO payment_orderstatuscount (shipped, count) "
+            "SELECT 0, (SELECT COUNT(*) FROM payment_order WHERE shipped = 0) "
+            "UNION ALL SELECT 1, (SELECT COUNT(*) FROM payment_order WHERE shipped = 1)"
+        )
+        for sql in TRIGGERS:
+            cursor.execute(sql)
+
+
+def remove_counts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_TRIGGERS:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0007_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shipped', models.BooleanField(unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['shipped', 'date_oredered'], name='payment_order_ship_date_idx'),
+        ),
+        migrations.RunPython(install_counts, remove_counts),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0008_order_status_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'date_oredered'], name='payment_order_user_date_idx'),
+        ),
+    ]
@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from store.models import Product
-from django.db.models.signals import post_save, pre_save
-from django.dispatch import receiver
-import datetime
+from store.tracking import TrackChangesMixin
+from django.db.models.functions import Lower
+from django.db.models.signals import post_save
+from django.utils import timezone
+import uuid
 
 class ShippingAddress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -31,7 +33,35 @@ def create_shipping(sender, instance, created, **kwargs):
 # Automate the Shipping Address thing
 post_save.connect(create_shipping, sender=User)
     
-class Order(models.Model):
+class OrderQuerySet(models.QuerySet):
+    # Stay below SQLite's bound-parameter limit in IN (...) lists
+    CHUNK_SIZE = 500
+
+    def mark_shipped(self, when=None):
+        """Ship every unshipped order in the queryset with one UPDATE; returns the number changed."""
+        return self.filter(shipped=False).update(shipped=True, date_shipped=when or timezone.now())
+
+    def mark_unshipped(self):
+        """Move shipped orders back to the queue with one UPDATE; returns the number changed."""
+        return self.filter(shipped=True).update(shipped=False, date_shipped=None)
+
+    def set_shipped(self, ids, shipped=True):
+        """Ship or unship orders by id in a single transaction, however many ids there are.
+
+        This doesn't publish anything to the API's /orders/events feed, only
+        POST /orders:ship does.
+        """
+        ids = list(ids)
+        when = timezone.now()
+        changed = 0
+        with transaction.atomic():
+            for start in range(0, len(ids), self.CHUNK_SIZE):
+                chunk = self.filter(id__in=ids[start:start + self.CHUNK_SIZE])
+                changed += chunk.mark_shipped(when) if shipped else chunk.mark_unshipped()
+        return changed
+
+
+class Order(TrackChangesMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     full_name = models.CharField(max_length=250)
     email = models.EmailField(max_length=250)
@@ -41,17 +71,52 @@ class Order(models.Model):
     shipped = models.BooleanField(default=False)
     date_shipped = models.DateTimeField(blank=True, null=True)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Shipping dashboards page through one status ordered by date (see payment/pagination.py)
+            models.Index(fields=['shipped', 'date_oredered'], name='payment_order_ship_date_idx'),
+            # Per-customer order history (GET /users/{id}/orders)
+            models.Index(fields=['user', 'date_oredered'], name='payment_order_user_date_idx'),
+            # Dashboard search: case-insensitive prefix ranges on email and name (see payment.views).
+            # Not led by shipped: Django writes shipped=False as NOT shipped, which can't seek an index.
+            models.Index(Lower('email'), name='payment_order_email_search_idx'),
+            models.Index(Lower('full_name'), name='payment_order_name_search_idx'),
+        ]
+
     def __str__(self):
         return f'Order - {str(self.id)}'
+
+    def save(self, *args, **kwargs):
+        # Stamp the ship date when an existing order flips to shipped. Loaded orders know their
+        # old status (see store.tracking); ones built by hand or loaded without it fetch that column.
+        if self.pk and self.shipped:
+            if self.is_loaded('shipped'):
+                flipped = self.has_changed('shipped')
+            else:
+                flipped = not Order.objects.filter(pk=self.pk).values_list('shipped', flat=True).first()
+            if flipped:
+                self.date_shipped = timezone.now()
+        super().save(*args, **kwargs)
     
-@receiver(pre_save, sender=Order)
-def set_shipped_date_on_update(sender, instance, **kwargs):
-    if instance.pk:
-        now = datetime.datetime.now()
-        obj = sender._default_manager.get(pk=instance.pk)
-        if instance.shipped and not obj.shipped:
-            instance.date_shipped = now
-    
+class OrderStatusCount(models.Model):
+    """Number of orders per shipped status, kept current by triggers on payment_order (migration 0008)."""
+    shipped = models.BooleanField(unique=True)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{"Shipped" if self.shipped else "Not shipped"}: {self.count}'
+
+    @classmethod
+    def counts(cls):
+        """``{True: shipped, False: not shipped}`` without counting the orders table."""
+        counts = dict(cls.objects.values_list('shipped', 'count'))
+        if len(counts) < 2:
+            # Triggers not installed (non-SQLite database): count the slow way
+            counts = {shipped: Order.objects.filter(shipped=shipped).count() for shipped in (True, False)}
+        return counts
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True)
@@ -62,3 +127,45 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f'Order Item - {str(self.id)}'
+
+
+class OrderOutbox(models.Model):
+    """Checkout waiting to be delivered to the FastAPI /orders endpoint (see payment/outbox.py)."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)  # Idempotency-Key sent to the API
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    order_id = models.IntegerField(null=True, blank=True)  # payment_order id once delivered
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Order outbox'
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f'Outbox - {self.key} ({self.status})'
+
+
+class IdempotencyKey(models.Model):
+    """Idempotency-Key of a POST /orders request and the response it got (written by FastAPI)."""
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(max_length=64)  # Same key with a different body is rejected
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    response = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'Idempotency key - {self.key}'
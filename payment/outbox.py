@@ -0,0 +1,150 @@
+"""Asynchronous delivery of checkouts to the FastAPI service.
+
+process_order only writes an OrderOutbox row (in the same transaction that
+empties the saved cart) and returns. Rows are delivered to ``POST /orders``
+by ``dispatch()``, which runs in a background thread started after the
+commit and in the ``dispatch_outbox`` management command for retries. Each
+row carries its own Idempotency-Key, so a retry after a timeout can't create
+a second order. A row the API refuses (409 for a changed price or sold-out
+stock, 422 for an unknown product) ends FAILED; its payload still has the
+cart lines, which the order page offers to put back in the cart
+(``views.restore_cart``).
+"""
+import datetime
+import json
+import logging
+import threading
+from urllib.error import HTTPError
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ecom.backend import post_json
+from ecom.tracing import trace_sql
+from fastapi_app import tracing
+from .models import OrderOutbox
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed row is hidden from other dispatchers
+LEASE = datetime.timedelta(seconds=60)
+
+_kick_lock = threading.Lock()
+_kick_running = False
+
+
+def enqueue(user, payload):
+    """Store a checkout for delivery; the dispatcher is started once the transaction commits."""
+    entry = OrderOutbox.objects.create(user=user if user and user.is_authenticated else None, payload=payload)
+    if getattr(settings, 'OUTBOX_DISPATCH_ON_COMMIT', True):
+        transaction.on_commit(kick)
+    return entry
+
+
+def backoff(attempts):
+    """Delay before the next try: 2, 4, 8... seconds, capped at 10 minutes."""
+    return datetime.timedelta(seconds=min(2 ** attempts, 600))
+
+
+def claim(limit):
+    """Lease up to ``limit`` due rows to this dispatcher and return them."""
+    now = timezone.now()
+    due = (OrderOutbox.objects
+           .filter(status=OrderOutbox.PENDING, next_attempt_at__lte=now)
+           .order_by('next_attempt_at')
+           .values_list('pk', flat=True)[:limit])
+    claimed = []
+    for pk in list(due):
+        # Conditional UPDATE: only one dispatcher wins each row
+        won = OrderOutbox.objects.filter(
+            pk=pk, status=OrderOutbox.PENDING, next_attempt_at__lte=now,
+        ).update(next_attempt_at=now + LEASE)
+        if won:
+            claimed.append(pk)
+    return list(OrderOutbox.objects.filter(pk__in=claimed).order_by('created_at'))
+
+
+def deliver(entry):
+    """Send one row to the API and record the outcome."""
+    entry.attempts += 1
+    try:
+        # Short timeout: the key makes a retry after a timeout safe
+        data = post_json('/orders', entry.payload, timeout=5, headers={'Idempotency-Key': str(entry.key)})
+    except HTTPError as e:
+        detail = _error_detail(e)
+        if 400 <= e.code < 500 and e.code not in (408, 429):
+            # The API refused the order itself (e.g. prices changed), retrying won't help
+            _finish(entry, OrderOutbox.FAILED, error=detail)
+        else:
+            _retry(entry, detail)
+        return
+    except Exception as e:
+        _retry(entry, str(e))
+        return
+    _finish(entry, OrderOutbox.SENT, order_id=data.get('order_id'))
+
+
+def dispatch(batch_size=None):
+    """Deliver due rows in batches until none are left; returns the number processed."""
+    batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 20)
+    processed = 0
+    while True:
+        entries = claim(batch_size)
+        if not entries:
+            return processed
+        for entry in entries:
+            deliver(entry)
+        processed += len(entries)
+
+
+def kick():
+    """Run ``dispatch`` in a background thread, unless one is already running in this process."""
+    global _kick_running
+    with _kick_lock:
+        if _kick_running:
+            return
+        _kick_running = True
+    # The dispatch joins the trace of the checkout that committed
+    parent = tracing.current_context()
+    threading.Thread(target=_run, args=(parent,), name='outbox-dispatch', daemon=True).start()
+
+
+def _run(parent=None):
+    global _kick_running
+    try:
+        with tracing.start_span('outbox.dispatch', parent=parent), connection.execute_wrapper(trace_sql):
+            dispatch()
+    except Exception:
+        logger.exception('Outbox dispatch failed')
+    finally:
+        with _kick_lock:
+            _kick_running = False
+        connection.close()
+
+
+def _retry(entry, error):
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+    if entry.attempts >= max_attempts:
+        _finish(entry, OrderOutbox.FAILED, error=error)
+        return
+    entry.next_attempt_at = timezone.now() + backoff(entry.attempts)
+    entry.last_error = error
+    entry.save(update_fields=['attempts', 'next_attempt_at', 'last_error'])
+
+
+def _finish(entry, status, order_id=None, error=''):
+    entry.status = status
+    entry.order_id = order_id
+    entry.last_error = error
+    entry.sent_at = timezone.now() if status == OrderOutbox.SENT else None
+    entry.save(update_fields=['status', 'attempts', 'order_id', 'last_error', 'sent_at'])
+    if status == OrderOutbox.FAILED:
+        logger.warning('Outbox %s failed after %s attempts: %s', entry.key, entry.attempts, error)
+
+
+def _error_detail(error):
+    try:
+        return str(json.loads(error.read().decode()).get('detail', error.reason))
+    except Exception:
+        return f'HTTP {error.code}'
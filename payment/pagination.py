@@ -0,0 +1,45 @@
+"""Keyset pagination for the order dashboards.
+
+Pages are addressed by the ``(date_oredered, id)`` of the last row shown
+instead of an OFFSET, so every page is an index range scan on
+``payment_order_ship_date_idx`` no matter how deep the shopper pages.
+"""
+import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(order):
+    """``<microseconds since epoch>-<id>`` of the order, safe to put in a URL."""
+    stamp = order.date_oredered
+    micros = int(stamp.timestamp()) * 1_000_000 + stamp.microsecond
+    return f'{micros}-{order.id}'
+
+
+def decode_cursor(value):
+    """Parse a cursor into ``(datetime, id)``; returns None when it's missing or malformed."""
+    micros, _, pk = (value or '').partition('-')
+    if not micros.isdigit() or not pk.isdigit():
+        return None
+    seconds, micros = divmod(int(micros), 1_000_000)
+    stamp = datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc).replace(microsecond=micros)
+    return stamp, int(pk)
+
+
+def keyset_page(queryset, cursor=None, size=50, descending=False):
+    """Return ``(orders, next_cursor)`` for the page after ``cursor``.
+
+    ``next_cursor`` is None on the last page.
+    """
+    position = decode_cursor(cursor)
+    if position is not None:
+        stamp, pk = position
+        if descending:
+            queryset = queryset.filter(date_oredered__lte=stamp).exclude(Q(date_oredered=stamp) & Q(id__gte=pk))
+        else:
+            queryset = queryset.filter(date_oredered__gte=stamp).exclude(Q(date_oredered=stamp) & Q(id__lte=pk))
+    ordering = ('-date_oredered', '-id') if descending else ('date_oredered', 'id')
+    # One extra row tells us whether there is a next page without a COUNT
+    orders = list(queryset.order_by(*ordering)[:size + 1])
+    next_cursor = encode_cursor(orders[size - 1]) if len(orders) > size else None
+    return orders[:size], next_cursor
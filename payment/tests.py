@@ -1,3 +1,297 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from cart.persistence import decode_cart
+from ecom.testing import FakeAPI, QueryBudgetMixin, count_queries, make_products, set_cart
+from payment import outbox, views
+from payment.models import Order, OrderItem, OrderOutbox
+from payment.pagination import encode_cursor
+from store.models import Category, Product, Profile
+
+CART_SIZES = (1, 10, 100)
+ORDER_SIZES = (10, 10_000)
+SHIPPING = {
+    'shipping_full_name': 'Jo Shopper',
+    'shipping_email': 'jo@example.com',
+    'shipping_address1': '1 Main St',
+    'shipping_address2': '',
+    'shipping_city': 'Portland',
+    'shipping_state': 'OR',
+    'shipping_zipcode': '97201',
+    'shipping_country': 'US',
+}
+
+
+def make_orders(count, shipped=False, **fields):
+    Order.objects.bulk_create(
+        (Order(full_name=f'Customer {i}', email=f'customer{i}@example.com', shipping_address='1 Main St',
+               amount_paid=Decimal('10.00'), shipped=shipped, **fields) for i in range(count)),
+        batch_size=1000,
+    )
+
+
+@override_settings(CART_PERSIST_DELAY=0, OUTBOX_DISPATCH_ON_COMMIT=False, TRACE_SAMPLE_RATE=0)
+class CheckoutQueryCountTests(QueryBudgetMixin, TestCase):
+    """Checkout steps cost the same number of queries for 1 or 100 cart items."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes')
+        cls.products = make_products(max(CART_SIZES), category)
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw')
+
+    def setUp(self):
+        self.api = FakeAPI(self.products)
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+
+    def request_queries(self, method, url, data=None):
+        def measure(size):
+            set_cart(self.client, self.products[:size])
+            response, queries = count_queries(lambda: getattr(self.client, method)(url, data))
+            self.assertIn(response.status_code, (200, 302))
+            return queries
+        return measure
+
+    def test_checkout_guest(self):
+        self.assertConstantQueries(self.request_queries('get', reverse('checkout')), CART_SIZES, budget=0)
+
+    def test_checkout_logged_in(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(self.request_queries('get', reverse('checkout')), CART_SIZES, budget=3)
+
+    def test_billing_info(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(
+            self.request_queries('post', reverse('billing_info'), SHIPPING), CART_SIZES, budget=5,
+        )
+
+    def test_process_order(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('billing_info'), SHIPPING)
+        self.assertConstantQueries(
+            self.request_queries('post', reverse('process_order'), {'card_name': 'Jo'}), CART_SIZES, budget=6,
+        )
+        entry = OrderOutbox.objects.latest('created_at')
+        self.assertEqual(len(entry.payload['items']), max(CART_SIZES))
+
+
+@override_settings(CART_PERSIST_DELAY=0, OUTBOX_DISPATCH_ON_COMMIT=False, TRACE_SAMPLE_RATE=0)
+class StockReservationTests(TestCase):
+    """Billing holds the cart's stock and the order is sent with the hold's key."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes')
+        cls.products = make_products(2, category)
+        Product.objects.filter(pk=cls.products[0].pk).update(stock=1)
+        cls.products[0].stock = 1
+
+    def setUp(self):
+        self.api = FakeAPI(self.products)
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+
+    def test_order_uses_the_reservation(self):
+        set_cart(self.client, self.products)
+        self.client.post(reverse('billing_info'), SHIPPING)
+        key = self.client.session['reservation_key']
+        self.assertEqual(self.api.reservations[key], {self.products[0].id: 1})
+
+        self.client.post(reverse('process_order'), {'card_name': 'Jo'})
+        self.assertEqual(OrderOutbox.objects.get().payload['reservation_key'], key)
+        self.assertNotIn('reservation_key', self.client.session)
+
+    def test_warns_about_lines_without_stock(self):
+        set_cart(self.client, self.products[:1], quantity=3)
+        response = self.client.post(reverse('billing_info'), SHIPPING, follow=True)
+        self.assertContains(response, 'not enough stock left for: Product 0000')
+
+    def test_refused_order_can_go_back_to_the_cart(self):
+        user = User.objects.create_user('shopper', 'shopper@example.com', 'pw')
+        self.client.force_login(user)
+        set_cart(self.client, self.products, quantity=2)
+        self.client.post(reverse('billing_info'), SHIPPING)
+        response = self.client.post(reverse('process_order'), {'card_name': 'Jo'})
+        self.assertEqual(Profile.objects.get(user=user).old_cart, '')
+
+        self.api.order_error = (409, 'Sold out: [1]')
+        outbox.dispatch()
+        entry = OrderOutbox.objects.get()
+        self.assertEqual(entry.status, OrderOutbox.FAILED)
+        self.assertContains(self.client.get(response.url), 'Put these items back in my cart')
+
+        response = self.client.post(reverse('restore_cart', args=[entry.key]))
+        self.assertRedirects(response, reverse('cart_summary'), fetch_redirect_response=False)
+        expected = {str(product.id): 2 for product in self.products}
+        self.assertEqual(decode_cart(Profile.objects.get(user=user).old_cart), expected)
+        cart = self.client.get(reverse('cart_summary')).context['cart_lines']
+        self.assertEqual({str(line.product_id): line.quantity for line in cart}, expected)
+
+    def test_billing_works_when_the_api_is_down(self):
+        set_cart(self.client, self.products)
+        self.api.down = True
+        response = self.client.post(reverse('billing_info'), SHIPPING)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('reservation_key', self.client.session)
+
+
+@override_settings(TRACE_SAMPLE_RATE=0)
+class OrderPagesQueryCountTests(QueryBudgetMixin, TestCase):
+    """Order detail and the shipping dashboards don't grow with items or orders."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes')
+        cls.products = make_products(max(CART_SIZES), category)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.api = FakeAPI(self.products)
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+
+    def order_with_items(self, size):
+        order = Order.objects.create(full_name='Jo', email='jo@example.com', shipping_address='1 Main St',
+                                     amount_paid=Decimal('10.00'))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, price=product.price) for product in self.products[:size]
+        )
+        items = list(OrderItem.objects.filter(order=order))
+        self.api.add_order(order, items)
+        return order
+
+    def detail_queries(self, size):
+        order = self.order_with_items(size)
+        response, queries = count_queries(lambda: self.client.get(reverse('orders', args=[order.id])))
+        self.assertEqual(len(response.context['items']), size)
+        return queries
+
+    def test_order_detail(self):
+        self.assertConstantQueries(self.detail_queries, CART_SIZES, budget=2)
+
+    def test_order_detail_from_orm_when_api_is_down(self):
+        self.api.down = True
+        self.assertConstantQueries(self.detail_queries, CART_SIZES, budget=4)
+
+    def dashboard_queries(self, name, shipped, **params):
+        def measure(size):
+            Order.objects.all().delete()
+            make_orders(size, shipped=shipped)
+            url = reverse(name)
+            if params.get('second_page'):
+                first = self.client.get(url)
+                url += f'?after={first.context["next_cursor"]}'
+            elif params.get('q'):
+                url += f'?q={params["q"]}'
+            response, queries = count_queries(lambda: self.client.get(url))
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.context['orders']), 50)
+            # The heading shows the status total, searching or not
+            self.assertEqual(response.context['total'], size)
+            if params.get('q'):
+                self.assertTrue(all(params['q'] in order.email for order in response.context['orders']))
+            return queries
+        return measure
+
+    def test_not_shipped_dashboard(self):
+        self.assertConstantQueries(self.dashboard_queries('not_shipped_dash', False), ORDER_SIZES, budget=4)
+
+    def test_shipped_dashboard(self):
+        self.assertConstantQueries(self.dashboard_queries('shipped_dash', True), ORDER_SIZES, budget=4)
+
+    def test_dashboard_next_page(self):
+        self.assertConstantQueries(
+            self.dashboard_queries('not_shipped_dash', False, second_page=True), (100, 10_000), budget=4,
+        )
+
+    def test_dashboard_search(self):
+        self.assertConstantQueries(self.dashboard_queries('shipped_dash', True, q='customer1'), ORDER_SIZES, budget=4)
+
+    def test_search_is_a_prefix_match_on_the_indexes(self):
+        make_orders(3)
+        Order.objects.create(full_name='Zelda Rare', email='ZR@example.com', shipping_address='x',
+                             amount_paid=Decimal('1.00'))
+        found = lambda q: sorted(o.full_name for o in views._search_orders(Order.objects.filter(shipped=False), q))
+        self.assertEqual(found('zel'), ['Zelda Rare'])
+        self.assertEqual(found('zr@'), ['Zelda Rare'])
+        self.assertEqual(found('rare'), [])
+        self.assertEqual(found('CUSTOMER'), ['Customer 0', 'Customer 1', 'Customer 2'])
+        plan = views._search_orders(Order.objects.filter(shipped=False), 'zel').explain()
+        self.assertIn('payment_order_email_search_idx', plan)
+        self.assertIn('payment_order_name_search_idx', plan)
+        self.assertNotIn('SCAN payment_order', plan)
+
+    def test_bulk_ship_is_one_update(self):
+        def measure(size):
+            Order.objects.all().delete()
+            make_orders(size)
+            ids = list(Order.objects.values_list('id', flat=True))
+            response, queries = count_queries(lambda: self.client.post(reverse('not_shipped_dash'), {'nums': ids}))
+            self.assertEqual(response.status_code, 302)
+            self.assertFalse(Order.objects.filter(shipped=False).exists())
+            return queries
+
+        self.assertConstantQueries(measure, (1, 10, 100), budget=5)
+
+    def test_bulk_ship_with_nothing_selected(self):
+        make_orders(2)
+        response = self.client.post(reverse('not_shipped_dash'), {'shipping_status': 'true'})
+        self.assertRedirects(response, reverse('not_shipped_dash'), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.filter(shipped=False).count(), 2)
+        self.assertContains(self.client.get(response.url), 'No orders selected')
+
+    def test_cursor_round_trip(self):
+        make_orders(3)
+        first, second = Order.objects.order_by('date_oredered', 'id')[:2]
+        response = self.client.get(reverse('not_shipped_dash') + f'?after={encode_cursor(first)}')
+        self.assertEqual(response.context['orders'][0].id, second.id)
+
+
+class ShipDateTests(TestCase):
+    """Orders flipping to shipped get a ``date_shipped``, however they were loaded."""
+
+    def setUp(self):
+        make_orders(1)
+        self.order = Order.objects.get()
+
+    def test_loaded_order(self):
+        self.order.shipped = True
+        self.order.save()
+        self.assertIsNotNone(Order.objects.get().date_shipped)
+
+    def test_order_built_by_hand(self):
+        Order(pk=self.order.pk, full_name='Customer 0', email='customer0@example.com', shipping_address='1 Main St',
+              amount_paid=Decimal('10.00'), date_oredered=self.order.date_oredered, shipped=True).save()
+        self.assertIsNotNone(Order.objects.get().date_shipped)
+
+    def test_order_loaded_without_its_status(self):
+        order = Order.objects.only('id').get()
+        order.refresh_from_db(fields=['full_name'])
+        order.shipped = True
+        order.save()
+        self.assertIsNotNone(Order.objects.get().date_shipped)
+
+    def test_already_shipped_order_keeps_its_date(self):
+        Order.objects.update(shipped=True)
+        order = Order.objects.only('id').get()
+        order.shipped = True
+        order.save()
+        self.assertIsNone(Order.objects.get().date_shipped)
+
+    def test_save_without_changes_writes_nothing(self):
+        receiver = mock.Mock()
+        post_save.connect(receiver, sender=Order)
+        self.addCleanup(post_save.disconnect, receiver, sender=Order)
+        _, queries = count_queries(self.order.save)
+        self.assertEqual(queries, 0)
+        receiver.assert_not_called()
+        # update_fields forces the write (and the signals)
+        self.order.save(update_fields=['full_name'])
+        receiver.assert_called_once()
@@ -6,6 +6,9 @@ urlpatterns = [
     path('checkout', views.checkout, name='checkout'),
     path('billing_info', views.billing_info, name='billing_info'),
     path('process_order', views.process_order, name='process_order'),
+    path('order_received/<uuid:key>', views.order_received, name='order_received'),
+    path('order_status/<uuid:key>', views.order_status, name='order_status'),
+    path('restore_cart/<uuid:key>', views.restore_cart, name='restore_cart'),
     path('shipped_dash', views.shipped_dash, name='shipped_dash'),
     path('not_shipped_dash', views.not_shipped_dash, name='not_shipped_dash'),
     path('orders/<int:pk>', views.orders, name='orders'),
@@ -1,30 +1,47 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, JsonResponse
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
 from cart.cart import Cart
+from cart.persistence import save_now
 from payment.forms import ShippingForm, PaymentForm
-from payment.models import ShippingAddress, Order, OrderItem
-from django.contrib.auth.models import User
+from payment.models import ShippingAddress, Order, OrderItem, OrderOutbox, OrderStatusCount
+from payment.pagination import keyset_page
+from payment import outbox
 from django.contrib import messages
-from store.models import Product, Profile
-import datetime
-from django.conf import settings
-import json
-from urllib.request import urlopen, Request
-from urllib.error import URLError, HTTPError
+import uuid
+from urllib.error import HTTPError
+from ecom.backend import get_json, post_json, parse_api_datetime
+
+def _order_detail(pk):
+    # Order, items and products in one API call (a fixed 3 queries on the FastAPI side)
+    try:
+        order = get_json(f"/orders/{pk}")
+    except HTTPError as e:
+        if e.code == 404:
+            raise Http404
+        order = None
+    except Exception:
+        order = None
+    if order is None:
+        # API unreachable: same data from the ORM, still a fixed number of queries
+        order = get_object_or_404(Order, id=pk)
+        return order, list(OrderItem.objects.filter(order=pk).select_related('product'))
+    order['date_oredered'] = parse_api_datetime(order.get('date_oredered'))
+    order['date_shipped'] = parse_api_datetime(order.get('date_shipped'))
+    return order, order['items']
 
 def orders(request, pk):
     if request.user.is_authenticated and request.user.is_superuser:
-        order = Order.objects.get(id=pk)
-        items = OrderItem.objects.filter(order=pk)
+        order, items = _order_detail(pk)
 
         if request.POST:
             status = request.POST['shipping_status']
             if status == "true":
-                order = Order.objects.filter(id=pk)
-                now = datetime.datetime.now()
-                order.update(shipped=True, date_shipped=now)
+                Order.objects.filter(id=pk).mark_shipped()
             else:
-                order = Order.objects.filter(id=pk)
-                order.update(shipped=False)
+                Order.objects.filter(id=pk).mark_unshipped()
             messages.success(request, "Shipping Status Updated")
             return redirect('home')
 
@@ -33,48 +50,78 @@ def orders(request, pk):
         messages.success(request, "Access Denied")
         return redirect('home')
 
+DASHBOARD_PAGE_SIZE = 50
+
+def _starts_with(field, prefix):
+    # A range instead of LIKE, so SQLite can read it off the lower(...) search indexes
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+
+def _search_orders(orders, query):
+    # Email or name starting with the query, ignoring case (SQLite's lower() only folds ASCII).
+    # Each side is a range seek on its search index, so the cost is the number of matches.
+    prefix = ''.join(c.lower() if c.isascii() else c for c in query)
+    return orders.alias(email_lower=Lower('email'), name_lower=Lower('full_name')).filter(
+        _starts_with('email_lower', prefix) | _starts_with('name_lower', prefix)
+    )
+
+def _dashboard_context(request, shipped, descending):
+    orders = Order.objects.filter(shipped=shipped)
+    query = request.GET.get('q', '').strip()
+    if query:
+        orders = _search_orders(orders, query)
+    page, next_cursor = keyset_page(orders, request.GET.get('after'), DASHBOARD_PAGE_SIZE, descending)
+    return {
+        "orders": page,
+        "next_cursor": next_cursor,
+        "query": query,
+        "paged": bool(request.GET.get('after')),
+        # Every order with this status, the search doesn't narrow it (a filtered COUNT would scan)
+        "total": OrderStatusCount.counts()[shipped],
+    }
+
+def _update_shipping(request, shipped):
+    # The per-row buttons post a single "num", the bulk form the ticked orders as "nums"
+    if 'num' in request.POST:
+        Order.objects.set_shipped([int(request.POST['num'])] if request.POST['num'].isdigit() else [], shipped)
+        messages.success(request, "Shipping Status Updated")
+        return redirect('home')
+    ids = [int(num) for num in request.POST.getlist('nums') if num.isdigit()]
+    if not ids:
+        messages.success(request, "No orders selected")
+        return redirect(request.get_full_path())
+    changed = Order.objects.set_shipped(ids, shipped)
+    messages.success(request, f"Shipping Status Updated for {changed} orders")
+    return redirect(request.get_full_path())
+
 def shipped_dash(request):
     if request.user.is_authenticated and request.user.is_superuser:
-        orders = Order.objects.filter(shipped=True)
-
         if request.POST:
-            status = request.POST['shipping_status']
-            num = request.POST['num']
-            order = Order.objects.filter(id=num)
-            now = datetime.datetime.now()
-            order.update(shipped=False, date_shipped=now)
-            messages.success(request, "Shipping Status Updated")
-            return redirect('home')
+            return _update_shipping(request, shipped=False)
         
-        return render(request, 'payment/shipped_dash.html', {"orders":orders})
+        # Most recently ordered first
+        return render(request, 'payment/shipped_dash.html', _dashboard_context(request, shipped=True, descending=True))
     else:
         messages.success(request, "Access Denied")
         return redirect('home')
 
 def not_shipped_dash(request):
      if request.user.is_authenticated and request.user.is_superuser:
-        orders = Order.objects.filter(shipped=False)
-
         if request.POST:
-            status = request.POST['shipping_status']
-            num = request.POST['num']
-            order = Order.objects.filter(id=num)
-            now = datetime.datetime.now()
-            order.update(shipped=True, date_shipped=now)
-            messages.success(request, "Shipping Status Updated")
-            return redirect('home')
+            return _update_shipping(request, shipped=True)
         
-        return render(request, 'payment/not_shipped_dash.html', {"orders":orders})
+        # Oldest first: it's the shipping queue
+        return render(request, 'payment/not_shipped_dash.html', _dashboard_context(request, shipped=False, descending=False))
      else:
         messages.success(request, "Access Denied")
         return redirect('home')
 
 def process_order(request):
     if request.POST:
-        cart = Cart(request)
-        cart_products = cart.get_prods
-        quantities = cart.get_quants
-        totals = cart.cart_total()
+        cart = Cart.for_request(request)
+        if not cart.lines:
+            messages.success(request, "Your cart is empty")
+            return redirect('cart_summary')
+        totals = cart.total
         payment_form = PaymentForm(request.POST or None)
         my_shipping = request.session.get('my_shipping') 
         full_name = my_shipping['shipping_full_name']
@@ -82,17 +129,14 @@ def process_order(request):
         shipping_address = f"{my_shipping['shipping_address1']}\n{my_shipping['shipping_address2']}\n{my_shipping['shipping_city']}\n{my_shipping['shipping_state']}\n{my_shipping['shipping_zipcode']}\n{my_shipping['shipping_country']}"
         amount_paid = totals
         # Build payload for FastAPI
-        items_payload = []
-        for product in cart_products():
-            product_id = product.id
-            price = product.sale_price if getattr(product, 'is_sale', False) else product.price
-            for key, value in quantities().items():
-                if int(key) == product.id:
-                    items_payload.append({
-                        "product_id": product_id,
-                        "quantity": int(value),
-                        "price": str(price),
-                    })
+        items_payload = [
+            {
+                "product_id": line.product_id,
+                "quantity": int(line.quantity),
+                "price": str(line.unit_price),
+            }
+            for line in cart.lines
+        ]
 
         payload = {
             "user_id": request.user.id if request.user.is_authenticated else None,
@@ -101,47 +145,87 @@ def process_order(request):
             "shipping_address": shipping_address,
             "amount_paid": str(amount_paid),
             "items": items_payload,
+            # Uses up the stock held at billing
+            "reservation_key": request.session.pop('reservation_key', None),
         }
 
-        try:
-            req = Request(f"{settings.FASTAPI_BASE_URL}/orders", data=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'})
-            with urlopen(req, timeout=10) as resp:
-                _ = json.loads(resp.read().decode())
-        except Exception:
-            messages.error(request, "Failed to place order. Please try again.")
-            return redirect('checkout')
+        # Record the order and empty the saved cart together; delivery to the API happens in the background
+        with transaction.atomic():
+            entry = outbox.enqueue(request.user, payload)
+            if request.user.is_authenticated:
+                save_now(request.user.id, {})
 
-        # Clear session cart
-        for key in list(request.session.keys()):
-            if key == "session_key":
-                del request.session[key]
+        # Clear the cart
+        cart.clear()
 
-        if request.user.is_authenticated:
-            current_user = Profile.objects.filter(user__id=request.user.id)
-            current_user.update(old_cart="")
-
-        messages.success(request, "Order Placed")
-        return redirect('home')
+        return redirect('order_received', key=entry.key)
     else:
         messages.success(request, "Access Denied")
         return redirect('home')
 
+def _outbox_entry(request, key):
+    entry = get_object_or_404(OrderOutbox, key=key)
+    # Guests only have the unguessable key; logged in orders stay with their owner
+    if entry.user_id and entry.user_id != request.user.id:
+        raise Http404
+    return entry
+
+def order_received(request, key):
+    entry = _outbox_entry(request, key)
+    return render(request, 'payment/order_received.html', {'entry': entry})
+
+def restore_cart(request, key):
+    # The API refused the order (price changed, sold out...): put its items back so the shopper can try again
+    entry = _outbox_entry(request, key)
+    if request.method == 'POST' and entry.status == OrderOutbox.FAILED:
+        Cart.for_request(request).merge({item['product_id']: item['quantity'] for item in entry.payload['items']})
+        messages.success(request, "The items of your order are back in your cart")
+        return redirect('cart_summary')
+    return redirect('order_received', key=entry.key)
+
+def order_status(request, key):
+    entry = _outbox_entry(request, key)
+    return JsonResponse({
+        'status': entry.status,
+        'order_id': entry.order_id,
+        'error': entry.last_error if entry.status == OrderOutbox.FAILED else '',
+    })
+
+def _reserve_cart(request, cart):
+    # Hold the cart's stock while the shopper pays; the hold goes back on sale if they don't
+    key = request.session.get('reservation_key') or uuid.uuid4().hex
+    payload = {
+        'key': key,
+        'items': [{'product_id': line.product_id, 'quantity': int(line.quantity)} for line in cart.lines],
+    }
+    try:
+        reservation = post_json('/reservations', payload, timeout=3)
+    except Exception:
+        return  # The order is still checked against stock when it reaches the API
+    request.session['reservation_key'] = key
+    unavailable = set(reservation.get('unavailable', ()))
+    names = [
+        line.product['name'] if isinstance(line.product, dict) else line.product.name
+        for line in cart.lines if line.product_id in unavailable
+    ]
+    if names:
+        messages.success(request, f"Sorry, not enough stock left for: {', '.join(names)}")
+
 def billing_info(request):
     if request.POST:
-        cart = Cart(request)
-        cart_products = cart.get_prods
-        quantities = cart.get_quants
-        totals = cart.cart_total()
+        cart = Cart.for_request(request)
 
         my_shipping = request.POST
         request.session['my_shipping'] = my_shipping
+        if cart.lines:
+            _reserve_cart(request, cart)
 
         if request.user.is_authenticated:
             billing_form = PaymentForm()
-            return render(request, 'payment/billing_info.html', {'cart_products':cart_products, 'quantities':quantities, 'totals':totals, 'shipping_info':request.POST, 'billing_form':billing_form })
+            return render(request, 'payment/billing_info.html', {'cart_lines':cart.lines, 'totals':cart.total, 'shipping_info':request.POST, 'billing_form':billing_form })
         else:
             billing_form = PaymentForm()
-            return render(request, 'payment/billing_info.html', {'cart_products':cart_products, 'quantities':quantities, 'totals':totals, 'shipping_info':request.POST, 'billing_form':billing_form })
+            return render(request, 'payment/billing_info.html', {'cart_lines':cart.lines, 'totals':cart.total, 'shipping_info':request.POST, 'billing_form':billing_form })
     else:
         messages.success(request, "Access Denied")
         return redirect('home')
@@ -150,15 +234,12 @@ def payment_success(request):
     return render(request, "payment/payment_success.html", {})
 
 def checkout(request):
-    cart = Cart(request)
-    cart_products = cart.get_prods
-    quantities = cart.get_quants
-    totals = cart.cart_total()
+    cart = Cart.for_request(request)
 
     if request.user.is_authenticated:
         shipping_user = ShippingAddress.objects.get(user__id=request.user.id)
         shipping_form = ShippingForm(request.POST or None, instance=shipping_user)
-        return render(request, 'payment/checkout.html', {'cart_products':cart_products, 'quantities':quantities, 'totals':totals, 'shipping_form':shipping_form})
+        return render(request, 'payment/checkout.html', {'cart_lines':cart.lines, 'totals':cart.total, 'shipping_form':shipping_form})
     else:
         shipping_form = ShippingForm(request.POST or None)
-        return render(request, 'payment/checkout.html', {'cart_products':cart_products, 'quantities':quantities, 'totals':totals, 'shipping_form':shipping_form})
+        return render(request, 'payment/checkout.html', {'cart_lines':cart.lines, 'totals':cart.total, 'shipping_form':shipping_form})
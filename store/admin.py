@@ -1,12 +1,81 @@
+from decimal import Decimal
+
 from django.contrib import admin
-from .models import Category, Customer, Product, Order, Profile
+from django.db.models import F
+from django.db.models.functions import Round
+from .models import Category, Customer, Product, Order, Profile, Promotion
+from . import pricing
 from django.contrib.auth.models import User
 
-admin.site.register(Category)
-admin.site.register(Customer)
-admin.site.register(Product)
-admin.site.register(Order)
-admin.site.register(Profile)
+
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ["name", "slug"]
+    search_fields = ["name"]
+    prepopulated_fields = {"slug": ["name"]}
+
+
+def _sale_action(percent):
+    # One UPDATE for the whole selection, computed by the database
+    factor = (100 - Decimal(percent)) / 100
+
+    def put_on_sale(modeladmin, request, queryset):
+        changed = queryset.update(is_sale=True, sale_price=Round(F('price') * factor, 2))
+        pricing.invalidate()
+        modeladmin.message_user(request, f"{changed} products put on sale at {percent}% off.")
+
+    put_on_sale.__name__ = f'put_on_sale_{percent}'
+    return admin.action(description=f"Put selected products on sale ({percent}%% off)")(put_on_sale)
+
+
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ["name", "category", "price", "is_sale", "sale_price", "stock"]
+    list_select_related = ["category"]
+    list_filter = ["is_sale", "category"]
+    search_fields = ["^name"]  # prefix search can use the name index
+    autocomplete_fields = ["category"]
+    show_full_result_count = False
+    actions = [_sale_action(10), _sale_action(20), _sale_action(30), "end_sale"]
+
+    @admin.action(description="End sale for selected products")
+    def end_sale(self, request, queryset):
+        changed = queryset.update(is_sale=False)
+        pricing.invalidate()
+        self.message_user(request, f"{changed} products taken off sale.")
+
+
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ["first_name", "last_name", "email", "phone"]
+    search_fields = ["^email", "^last_name"]
+
+
+class LegacyOrderAdmin(admin.ModelAdmin):
+    list_display = ["id", "product", "Customer", "quantity", "date", "status"]
+    list_select_related = ["product", "Customer"]
+    autocomplete_fields = ["product", "Customer"]
+
+
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ["user", "phone", "city", "country", "date_modified"]
+    list_select_related = ["user"]
+    search_fields = ["^user__username", "^user__email"]
+    raw_id_fields = ["user"]
+    show_full_result_count = False
+
+
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ["name", "kind", "product", "category", "percent_off", "bundle_quantity", "bundle_price", "is_active", "starts_at", "ends_at"]
+    list_select_related = ["product", "category"]
+    list_filter = ["kind", "is_active"]
+    search_fields = ["name"]
+    autocomplete_fields = ["product", "category"]
+
+
+admin.site.register(Category, CategoryAdmin)
+admin.site.register(Customer, CustomerAdmin)
+admin.site.register(Product, ProductAdmin)
+admin.site.register(Order, LegacyOrderAdmin)
+admin.site.register(Profile, ProfileAdmin)
+admin.site.register(Promotion, PromotionAdmin)
 
 # Mix profile info and user info
 class ProfileInline(admin.StackedInline):
@@ -17,9 +86,14 @@ class UserAdmin(admin.ModelAdmin):
     model = User
     field = ["username", "first_name", "last_name", "email"]
     inlines = [ProfileInline]
+    list_display = ["username", "email", "first_name", "last_name", "profile__city", "is_staff"]
+    list_select_related = ["profile"]
+    list_filter = ["is_staff", "is_superuser", "is_active"]
+    search_fields = ["^username", "^email"]  # also used by autocomplete widgets on orders
+    show_full_result_count = False
 
 # unregister the old way
 admin.site.unregister(User)
 
 # Re-register the new way
-admin.site.register(User, UserAdmin)
\ No newline at end of file
+admin.site.register(User, UserAdmin)
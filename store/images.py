@@ -0,0 +1,113 @@
+"""Responsive image variants for product uploads.
+
+Each product image gets resized AVIF/WebP/JPEG copies written under
+``<upload dir>/variants/``. File names carry a short hash of the source bytes,
+so a replaced image always gets new URLs and the old ones can be cached forever.
+
+The manifest describing the variants is stored on ``Product.image_variants``
+so the FastAPI service can return it without touching the media directory.
+"""
+import hashlib
+import os
+
+from PIL import Image, ImageOps, features
+
+VARIANT_WIDTHS = (320, 640, 1024)
+
+# Best format first, this is also the order of the <source> tags.
+VARIANT_FORMATS = ('avif', 'webp', 'jpeg')
+
+_SAVE_OPTIONS = {
+    'avif': {'format': 'AVIF', 'quality': 55},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def available_formats():
+    """Variant formats the installed Pillow can encode."""
+    return [fmt for fmt in VARIANT_FORMATS if fmt == 'jpeg' or features.check(fmt)]
+
+
+def _content_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def build_variants(name, media_root, force=False):
+    """Write the resized variants of the media file ``name`` and return its manifest.
+
+    Only touches the filesystem, so it is safe to run in a worker process.
+    Variants that already exist on disk are reused unless ``force`` is set.
+    """
+    source = os.path.join(media_root, name)
+    digest = _content_hash(source)
+    folder, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    variant_dir = os.path.join(folder, 'variants')
+    os.makedirs(os.path.join(media_root, variant_dir), exist_ok=True)
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        src_width, src_height = img.size
+        # Never upscale: keep the widths smaller than the original, plus the original width.
+        widths = [w for w in VARIANT_WIDTHS if w < src_width] + [min(src_width, VARIANT_WIDTHS[-1])]
+        widths = sorted(set(widths))
+
+        variants = {}
+        for fmt in available_formats():
+            variants[fmt] = []
+            for width in widths:
+                variant_name = f"{variant_dir}/{stem}.{digest}.{width}w.{fmt}"
+                target = os.path.join(media_root, variant_name)
+                if force or not os.path.exists(target):
+                    height = max(1, round(src_height * width / src_width))
+                    resized = img.resize((width, height), Image.LANCZOS)
+                    if fmt == 'jpeg' and resized.mode not in ('RGB', 'L'):
+                        resized = resized.convert('RGB')
+                    resized.save(target, **_SAVE_OPTIONS[fmt])
+                variants[fmt].append([variant_name, width])
+
+    return {
+        'source': name,
+        'hash': digest,
+        'width': src_width,
+        'height': src_height,
+        'variants': variants,
+    }
+
+
+def refresh_variants(product, force=False):
+    """Build variants for ``product`` when missing or stale and save the manifest.
+
+    A source that can't be decoded gets a manifest with an ``error`` and no
+    ``variants``, so renders don't hash and decode it again until the image
+    is replaced. A missing file is only a failed open, it's retried as is.
+    """
+    if not product.image:
+        return {}
+    manifest = product.image_variants or {}
+    if not force and manifest.get('source') == product.image.name:
+        return manifest
+    try:
+        manifest = build_variants(product.image.name, product.image.storage.location, force=force)
+    except FileNotFoundError:
+        # Not uploaded (yet), fall back to the original image.
+        return {}
+    except (OSError, ValueError) as exc:
+        # Corrupt or unsupported source, fall back to the original image.
+        manifest = {'source': product.image.name, 'error': str(exc)[:200]}
+    product.image_variants = manifest
+    type(product).objects.filter(pk=product.pk).update(image_variants=manifest)
+    return manifest
+
+
+def srcset(manifest, fmt, media_url):
+    """Return the ``srcset`` attribute value for one format of ``manifest``."""
+    entries = (manifest or {}).get('variants', {}).get(fmt, [])
+    return ', '.join(f"{media_url}{name} {width}w" for name, width in entries)
@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.images import build_variants
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = "Generate responsive image variants for existing products using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+        parser.add_argument('--force', action='store_true', help="Rebuild variants that are already up to date")
+        parser.add_argument('--batch-size', type=int, default=200, help="Manifests saved per UPDATE batch")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').only('id', 'image', 'image_variants')
+        todo = {
+            p.id: p for p in products
+            # Images that failed before are tried again
+            if options['force'] or p.image_variants.get('source') != p.image.name or 'error' in p.image_variants
+        }
+        if not todo:
+            self.stdout.write("All product images are up to date.")
+            return
+
+        done, failed = [], 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(build_variants, p.image.name, settings.MEDIA_ROOT, options['force']): p
+                for p in todo.values()
+            }
+            for future in as_completed(futures):
+                product = futures[future]
+                try:
+                    product.image_variants = future.result()
+                except (OSError, ValueError) as exc:
+                    failed += 1
+                    self.stderr.write(f"{product.image.name}: {exc}")
+                    continue
+                done.append(product)
+
+        Product.objects.bulk_update(done, ['image_variants'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {len(done)} products ({failed} failed)."))
@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.related import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the 'customers also bought' table (store.RelatedProduct) from all orders. "
+        "The API keeps it current as orders come in; run this nightly to drop stale pairs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=settings.RELATED_KEEP, help="Neighbours kept per product")
+        parser.add_argument('--max-basket', type=int, default=settings.RELATED_MAX_BASKET,
+                            help="Orders with more distinct products than this are not counted")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows = rebuild(keep=options['keep'], max_basket=options['max_basket'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {rows} related product rows in {time.monotonic() - started:.1f}s."
+        ))
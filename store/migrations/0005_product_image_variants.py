@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_profile_old_cart'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='category',
+            options={'ordering': ['name'], 'verbose_name_plural': 'Categories'},
+        ),
+        migrations.AlterModelOptions(
+            name='product',
+            options={'ordering': ['name']},
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='old_cart',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('percent', 'Percent off a product'), ('category', 'Percent off a category'), ('bundle', 'Bundle price for several units')], default='percent', max_length=10)),
+                ('percent_off', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('bundle_quantity', models.PositiveIntegerField(default=0)),
+                ('bundle_price', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('is_active', models.BooleanField(default=True)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='store.category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='store.product')),
+            ],
+        ),
+    ]
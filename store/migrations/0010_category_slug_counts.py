@@ -0,0 +1,114 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def fill_slugs(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    taken = set()
+    for category in Category.objects.order_by('id'):
+        base = slugify(category.name)[:50] or 'category'
+        slug, n = base, 1
+        while slug in taken:
+            n += 1
+            slug = f'{base}-{n}'
+        taken.add(slug)
+        category.slug = slug
+        category.save(update_fields=['slug'])
+
+
+# Products are written by Django (admin, bulk sale actions) and by FastAPI, so the
+# counts are kept by the database itself. A migration that rebuilds store_product
+# or store_category on SQLite drops these triggers and must create them again.
+TRIGGERS = [
+    """
+    CREATE TRIGGER store_category_count_create AFTER INSERT ON store_category
+    BEGIN
+        INSERT INTO store_categorycount (category_id, products, on_sale) VALUES (NEW.id, 0, 0);
+    END
+    """,
+    """
+    CREATE TRIGGER store_product_count_insert AFTER INSERT ON store_product
+    BEGIN
+        UPDATE store_categorycount SET products = products + 1, on_sale = on_sale + NEW.is_sale
+        WHERE category_id = NEW.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER store_product_count_delete AFTER DELETE ON store_product
+    BEGIN
+        UPDATE store_categorycount SET products = products - 1, on_sale = on_sale - OLD.is_sale
+        WHERE category_id = OLD.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER store_product_count_update AFTER UPDATE OF category_id, is_sale ON store_product
+    WHEN OLD.category_id IS NOT NEW.category_id OR OLD.is_sale IS NOT NEW.is_sale
+    BEGIN
+        UPDATE store_categorycount SET products = products - 1, on_sale = on_sale - OLD.is_sale
+        WHERE category_id = OLD.category_id;
+        UPDATE store_categorycount SET products = products + 1, on_sale = on_sale + NEW.is_sale
+        WHERE category_id = NEW.category_id;
+    END
+    """,
+]
+
+DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS store_category_count_create",
+    "DROP TRIGGER IF EXISTS store_product_count_insert",
+    "DROP TRIGGER IF EXISTS store_product_count_delete",
+    "DROP TRIGGER IF EXISTS store_product_count_update",
+]
+
+
+def install_counts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO store_categorycount (category_id, products, on_sale) "
+            "SELECT c.id, COUNT(p.id), COALESCE(SUM(p.is_sale), 0) "
+            "FROM store_category c LEFT JOIN store_product p ON p.category_id = c.id GROUP BY c.id"
+        )
+        for sql in TRIGGERS:
+            cursor.execute(sql)
+
+
+def remove_counts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_TRIGGERS:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(max_length=60, null=True),
+        ),
+        migrations.RunPython(fill_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(max_length=60, unique=True),
+        ),
+        migrations.CreateModel(
+            name='CategoryCount',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counts', serialize=False, to='store.category')),
+                ('products', models.PositiveIntegerField(default=0)),
+                ('on_sale', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(install_counts, remove_counts),
+    ]
@@ -1,9 +1,13 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 import datetime
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
+from django.utils.text import slugify
+from .images import refresh_variants
+from .tracking import TrackChangesMixin
 
-class Profile(models.Model):
+class Profile(TrackChangesMixin, models.Model):
     """Extended user profile with additional information."""
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     date_modified = models.DateTimeField(auto_now=True)
@@ -30,9 +34,20 @@ def create_profile(sender, instance, created, **kwargs):
 # Automate the profile creation
 post_save.connect(create_profile, sender=User)
 
+def unique_slug(model, name, pk=None):
+    """``slugify(name)``, with ``-2``, ``-3``... appended while another row already uses it."""
+    base = slugify(name)[:50] or 'category'
+    slug, n = base, 1
+    while model.objects.filter(slug=slug).exclude(pk=pk).exists():
+        n += 1
+        slug = f'{base}-{n}'
+    return slug
+
+
 class Category(models.Model):
     """Product category model."""
     name = models.CharField(max_length=50)
+    slug = models.SlugField(max_length=60, unique=True)  # URL of the category page
 
     class Meta:
         verbose_name_plural = 'Categories'
@@ -41,6 +56,21 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = unique_slug(Category, self.name, self.pk)
+        super().save(*args, **kwargs)
+
+
+class CategoryCount(models.Model):
+    """Products and on-sale products per category, kept current by triggers on store_product (migration 0010)."""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='counts')
+    products = models.PositiveIntegerField(default=0)
+    on_sale = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.category_id}: {self.products} products, {self.on_sale} on sale'
+
 
 class Customer(models.Model):
     """Legacy customer model (may not be in use)."""
@@ -56,13 +86,16 @@ class Customer(models.Model):
 
 class Product(models.Model):
     """Product model for store items."""
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)  # Default ordering, admin changelist pages
     price = models.DecimalField(default=0, decimal_places=2, max_digits=6)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, default=1)
     description = models.CharField(max_length=250, default='', blank=True, null=True)
     image = models.ImageField(upload_to='uploads/product/')
     is_sale = models.BooleanField(default=False)
     sale_price = models.DecimalField(default=0, decimal_places=2, max_digits=6)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Manifest written by store.images
+    # Units left to sell; empty means the product isn't stock-tracked. Decremented by the API at checkout.
+    stock = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ['name']
@@ -71,6 +104,99 @@ class Product(models.Model):
         return self.name
 
 
+def create_image_variants(sender, instance, **kwargs):
+    """Generate responsive image variants when a product image is uploaded or replaced."""
+    refresh_variants(instance)
+
+
+post_save.connect(create_image_variants, sender=Product)
+
+
+class StockReservation(models.Model):
+    """Units held for a shopper between the billing step and the order.
+
+    Reserving takes the units off ``Product.stock`` straight away. The order
+    with the same key uses them up; otherwise the API puts them back once
+    ``expires_at`` has passed (see fastapi_app/inventory.py).
+    """
+    key = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'product'], name='store_reservation_key_product'),
+        ]
+        indexes = [
+            # Expiry sweep
+            models.Index(fields=['expires_at'], name='store_reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.key}: {self.quantity} x {self.product_id}'
+
+
+class RelatedProduct(models.Model):
+    """Product often bought in the same order as another ("customers also bought").
+
+    Keeps the top few neighbours per product. ``manage.py rebuild_related``
+    recomputes the table from all orders and the API adds to it as orders
+    come in (see fastapi_app/related.py).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField(default=0)  # Orders containing both products
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='store_related_product_pair'),
+        ]
+        indexes = [
+            # Top neighbours of a product (GET /items/{id}/related)
+            models.Index(fields=['product', '-orders', 'related'], name='store_related_top_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id} ({self.orders})'
+
+
+class Promotion(models.Model):
+    """Price rule applied on top of product prices (compiled by fastapi_app/pricing.py)."""
+    PERCENT = 'percent'
+    CATEGORY = 'category'
+    BUNDLE = 'bundle'
+    KIND_CHOICES = [
+        (PERCENT, 'Percent off a product'),
+        (CATEGORY, 'Percent off a category'),
+        (BUNDLE, 'Bundle price for several units'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=PERCENT)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    percent_off = models.DecimalField(default=0, decimal_places=2, max_digits=5)
+    bundle_quantity = models.PositiveIntegerField(default=0)
+    bundle_price = models.DecimalField(default=0, decimal_places=2, max_digits=6)
+    is_active = models.BooleanField(default=True)
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if self.kind in (self.PERCENT, self.BUNDLE) and self.product_id is None:
+            raise ValidationError({'product': 'This promotion needs a product.'})
+        if self.kind == self.CATEGORY and self.category_id is None:
+            raise ValidationError({'category': 'This promotion needs a category.'})
+        if self.kind != self.BUNDLE and not 0 < self.percent_off <= 100:
+            raise ValidationError({'percent_off': 'Enter a percentage between 0 and 100.'})
+        if self.kind == self.BUNDLE and self.bundle_quantity < 2:
+            raise ValidationError({'bundle_quantity': 'A bundle has at least 2 units.'})
+
+
 class Order(models.Model):
     """Legacy order model (may not be in use, payment.Order is primary)."""
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -0,0 +1,44 @@
+"""Django-side access to the shared pricing engine (fastapi_app/pricing.py).
+
+Used when the cart has to be priced locally because the API is unreachable.
+The compiled engine is kept per process; saving a product or promotion drops
+it, and it is also rebuilt after PRICING_ENGINE_TTL seconds so changes made
+by other processes show up.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from fastapi_app.pricing import PricingEngine, active_promotions
+from .models import Product, Promotion
+
+_engine = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine, _built_at
+    ttl = getattr(settings, 'PRICING_ENGINE_TTL', 30)
+    engine = _engine
+    if engine is not None and time.monotonic() - _built_at < ttl:
+        return engine
+    with _lock:
+        if _engine is None or time.monotonic() - _built_at >= ttl:
+            products = Product.objects.only('id', 'price', 'sale_price', 'is_sale', 'category_id')
+            promotions = active_promotions(Promotion.objects.filter(is_active=True))
+            _engine = PricingEngine(products, promotions)
+            _built_at = time.monotonic()
+        return _engine
+
+
+def invalidate(**kwargs):
+    global _engine
+    _engine = None
+
+
+for model in (Product, Promotion):
+    post_save.connect(invalidate, sender=model)
+    post_delete.connect(invalidate, sender=model)
@@ -0,0 +1,86 @@
+"""Co-occurrence model behind "customers also bought" (store.RelatedProduct).
+
+Orders are turned into a sparse order x product matrix ``X`` (1 when the
+order contains the product); ``X.T @ X`` then counts, for every pair of
+products, the orders containing both. Only the top ``keep`` neighbours of
+each product are stored. The API adds to the same counts as orders come in
+(fastapi_app/related.py), so a rebuild is only needed to catch up with
+deleted orders and pairs that fell out of a top list.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from payment.models import OrderItem
+from .models import RelatedProduct
+
+
+def top_neighbors(order_ids, product_ids, keep, max_basket):
+    """
+    Most co-purchased products for every product.
+
+    Args:
+        order_ids: Order of each order line
+        product_ids: Product of each order line (same length)
+        keep: Neighbours kept per product
+        max_basket: Orders with more distinct products than this are left out
+
+    Returns:
+        tuple: ``(product, related, orders)`` arrays, each product's neighbours
+        by most shared orders first, then by related id
+    """
+    order_ids = np.asarray(order_ids, dtype=np.int64)
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    if not len(order_ids) or keep <= 0:
+        return empty, empty, empty
+
+    orders, rows = np.unique(order_ids, return_inverse=True)
+    products, cols = np.unique(product_ids, return_inverse=True)
+    x = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(orders), len(products)),
+    )
+    x.data[:] = 1  # the same product on two lines of one order counts once
+    basket = np.diff(x.indptr)
+    x = x[(basket >= 2) & (basket <= max_basket)]
+
+    counts = (x.T @ x).tocsr()
+    counts = (counts - sparse.diags(counts.diagonal(), dtype=counts.dtype)).tocsr()  # a product isn't its own neighbour
+    counts.eliminate_zeros()
+
+    # Rank the entries of every row at once: sort by (row, -count, column)
+    row_of = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    ranked = np.lexsort((counts.indices, -counts.data, row_of))
+    position = np.arange(len(ranked)) - counts.indptr[row_of[ranked]]
+    kept = ranked[position < keep]
+    return products[row_of[kept]], products[counts.indices[kept]], counts.data[kept].astype(np.int64)
+
+
+def rebuild(keep=None, max_basket=None, batch_size=2000):
+    """
+    Recompute store_relatedproduct from every order.
+
+    Args:
+        keep: Neighbours kept per product (default ``settings.RELATED_KEEP``)
+        max_basket: Largest order counted (default ``settings.RELATED_MAX_BASKET``)
+        batch_size: Rows per INSERT
+
+    Returns:
+        int: Rows written
+    """
+    keep = settings.RELATED_KEEP if keep is None else keep
+    max_basket = settings.RELATED_MAX_BASKET if max_basket is None else max_basket
+    lines = OrderItem.objects.filter(order__isnull=False, product__isnull=False).values_list('order_id', 'product_id')
+    lines = np.array(list(lines.iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 2)
+    product, related, orders = top_neighbors(lines[:, 0], lines[:, 1], keep, max_basket)
+
+    # Orders placed while this runs are picked up by the next rebuild
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        RelatedProduct.objects.bulk_create(
+            (RelatedProduct(product_id=p, related_id=r, orders=n)
+             for p, r, n in zip(product.tolist(), related.tolist(), orders.tolist())),
+            batch_size=batch_size,
+        )
+    return len(product)
@@ -0,0 +1,52 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+
+from store.images import MIME_TYPES, refresh_variants, srcset
+
+register = template.Library()
+
+# Product grids show 4/3/2 cards per row (see home.html / category.html)
+GRID_SIZES = '(min-width: 1200px) 25vw, (min-width: 768px) 33vw, 50vw'
+
+
+@register.simple_tag
+def product_picture(product, css_class='img-fluid', sizes=GRID_SIZES):
+    """Render a <picture> with AVIF/WebP/JPEG srcsets for a product.
+
+    Works with both model instances and the product dicts returned by the API.
+    Model instances without variants get them generated on first render.
+    """
+    if isinstance(product, dict):
+        manifest = product.get('image_variants') or {}
+        image = product.get('image') or {}
+        url = image.get('url', '') if isinstance(image, dict) else image
+        name = product.get('name', '')
+    else:
+        manifest = refresh_variants(product)
+        url = product.image.url if product.image else ''
+        name = product.name
+
+    if not manifest.get('variants'):
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">', url, css_class, name)
+
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[fmt], srcset(manifest, fmt, settings.MEDIA_URL), sizes)
+            for fmt in manifest['variants']
+            if fmt != 'jpeg'
+        ),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" class="{}" alt="{}" loading="lazy"></picture>',
+        sources,
+        url,
+        srcset(manifest, 'jpeg', settings.MEDIA_URL),
+        sizes,
+        manifest.get('width', ''),
+        manifest.get('height', ''),
+        css_class,
+        name,
+    )
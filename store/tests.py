@@ -1,3 +1,225 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from cart.persistence import decode_cart, encode_cart
+from ecom.testing import FakeAPI, QueryBudgetMixin, count_queries, make_products, set_cart
+from payment.models import Order, OrderItem
+from store.models import Category, CategoryCount, Product, Profile, RelatedProduct
+from store.related import rebuild, top_neighbors
+from store.templatetags.product_images import product_picture
+
+CART_SIZES = (1, 10, 100)
+
+
+@override_settings(CART_PERSIST_DELAY=0, TRACE_SAMPLE_RATE=0)
+class StoreQueryCountTests(QueryBudgetMixin, TestCase):
+    """Store pages cost the same number of queries whatever the cart or catalog size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes')
+        cls.products = make_products(max(CART_SIZES), cls.category)
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw')
+
+    def setUp(self):
+        self.api = FakeAPI()
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+
+    def test_home(self):
+        def measure(size):
+            self.api.products.clear()
+            self.api.add_products(self.products[:size])
+            response, queries = count_queries(lambda: self.client.get(reverse('home')))
+            self.assertEqual(len(response.context['products']), size)
+            return queries
+
+        self.assertConstantQueries(measure, CART_SIZES, budget=0)
+
+    def test_api_calls_carry_the_shopper_address(self):
+        self.client.get(reverse('home'), REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(self.api.headers.get('X-forwarded-for'), '203.0.113.7')
+
+    def test_category_pages(self):
+        def measure(size):
+            self.api.products.clear()
+            self.api.add_products(self.products[:size])
+            self.api.add_categories([self.category])
+            response, queries = count_queries(lambda: self.client.get(reverse('category', args=['shoes'])))
+            self.assertEqual(len(response.context['products']), min(size, 24))
+            summary, summary_queries = count_queries(lambda: self.client.get(reverse('category_summary')))
+            self.assertEqual(summary.context['categories'][0]['product_count'], size)
+            return queries + summary_queries
+
+        self.assertConstantQueries(measure, CART_SIZES, budget=0)
+
+    def test_product_page_related_products(self):
+        product, *others = self.products[:4]
+        self.api.add_products(self.products[:4])
+        self.api.related = {product.id: [p.id for p in others]}
+        response, queries = count_queries(lambda: self.client.get(reverse('product', args=[product.id])))
+        self.assertEqual([p['id'] for p in response.context['related_products']], [p.id for p in others])
+        self.assertContains(response, 'Customers also bought')
+        self.assertEqual(queries, 0)
+
+        self.api.down = True
+        self.api.related = {}
+        self.assertEqual(self.client.get(reverse('cart_summary')).context['related_products'], [])
+
+    def test_update_info(self):
+        self.client.force_login(self.user)
+        self.api.add_products(self.products)
+
+        def measure(size):
+            set_cart(self.client, self.products[:size])
+            response, queries = count_queries(lambda: self.client.get(reverse('update_info')))
+            self.assertEqual(response.status_code, 200)
+            return queries
+
+        self.assertConstantQueries(measure, CART_SIZES, budget=4)
+
+    def test_login_merges_saved_cart(self):
+        self.api.add_products(self.products)
+
+        def measure(size):
+            self.client.logout()
+            saved = {str(product.id): 2 for product in self.products[:size]}
+            Profile.objects.filter(user=self.user).update(old_cart=encode_cart(saved))
+            response, queries = count_queries(lambda: self.client.post(
+                reverse('login'), {'username': 'shopper', 'password': 'pw'},
+            ))
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(decode_cart(Profile.objects.get(user=self.user).old_cart), saved)
+            return queries
+
+        self.assertConstantQueries(measure, CART_SIZES, budget=11)
+
+
+class RelatedProductsTests(TestCase):
+    """Co-occurrence counts behind "customers also bought"."""
+
+    def test_top_neighbors(self):
+        orders = [1, 1, 1, 2, 2, 3, 3, 3, 4]
+        products = [10, 20, 30, 10, 20, 10, 30, 30, 40]
+        product, related, shared = top_neighbors(orders, products, keep=1, max_basket=20)
+        self.assertEqual(list(zip(product, related, shared)), [(10, 20, 2), (20, 10, 2), (30, 10, 2)])
+        # Order 1 has three products, too many with max_basket=2
+        product, related, shared = top_neighbors(orders, products, keep=5, max_basket=2)
+        self.assertEqual(list(zip(product, related, shared)), [(10, 20, 1), (10, 30, 1), (20, 10, 1), (30, 10, 1)])
+
+    def test_rebuild(self):
+        a, b, c = make_products(3, Category.objects.create(name='Shoes'))
+        for basket in ([a, b], [a, b, c], [a, c], [b]):
+            order = Order.objects.create(full_name='Jo', email='jo@example.com', shipping_address='x', amount_paid=10)
+            OrderItem.objects.bulk_create(OrderItem(order=order, product=p, price=p.price) for p in basket)
+        RelatedProduct.objects.create(product=c, related=b, orders=99)
+
+        self.assertEqual(rebuild(keep=5, max_basket=20), 6)
+        self.assertEqual(
+            list(RelatedProduct.objects.filter(product=a).order_by('-orders', 'related').values_list('related', 'orders')),
+            [(b.id, 2), (c.id, 2)],
+        )
+        self.assertEqual(RelatedProduct.objects.get(product=c, related=b).orders, 1)
+
+
+@override_settings(TRACE_SAMPLE_RATE=0)
+class CategoryTests(TestCase):
+    """Category slugs, the trigger-maintained counts and the paged category page."""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='New Arrivals')
+        self.api = FakeAPI()
+        self.api.__enter__()
+        self.addCleanup(self.api.__exit__)
+
+    def counts(self, category):
+        row = CategoryCount.objects.get(category=category)
+        return row.products, row.on_sale
+
+    def test_slugs_are_unique(self):
+        self.assertEqual(self.category.slug, 'new-arrivals')
+        self.assertEqual(Category.objects.create(name='NEW arrivals!').slug, 'new-arrivals-2')
+        self.category.name = 'Just In'
+        self.category.save()
+        self.assertEqual(self.category.slug, 'new-arrivals')
+
+    def test_counts_follow_product_writes(self):
+        other = Category.objects.create(name='Sale')
+        a, b, c = make_products(3, self.category)
+        self.assertEqual(self.counts(self.category), (3, 0))
+
+        # Bulk updates skip save signals; the triggers still see them
+        Product.objects.filter(pk__in=[a.pk, b.pk]).update(is_sale=True)
+        self.assertEqual(self.counts(self.category), (3, 2))
+        Product.objects.filter(pk=b.pk).update(category=other)
+        self.assertEqual(self.counts(self.category), (2, 1))
+        self.assertEqual(self.counts(other), (1, 1))
+        a.delete()
+        self.assertEqual(self.counts(self.category), (1, 0))
+
+    def test_old_links_redirect_to_the_slug(self):
+        response = self.client.get(reverse('category', args=['New-Arrivals']))
+        self.assertRedirects(response, reverse('category', args=['new-arrivals']),
+                             status_code=301, fetch_redirect_response=False)
+
+    def test_pages(self):
+        self.api.add_products(make_products(30, self.category))
+        self.api.add_categories([self.category])
+        response = self.client.get(reverse('category', args=['new-arrivals']))
+        self.assertEqual(len(response.context['products']), 24)
+        next_cursor = response.context['next_cursor']
+        self.assertContains(response, f'?after={next_cursor}')
+
+        response = self.client.get(reverse('category', args=['new-arrivals']), {'after': next_cursor})
+        self.assertEqual(len(response.context['products']), 6)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_unknown_category(self):
+        response = self.client.get(reverse('category', args=['nope']))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_pages_when_the_api_is_down(self):
+        make_products(2, self.category)
+        self.api.down = True
+        summary = self.client.get(reverse('category_summary'))
+        self.assertEqual(summary.context['categories'][0]['product_count'], 2)
+        self.assertContains(summary, '2 products')
+        response = self.client.get(reverse('category', args=['new-arrivals']))
+        self.assertContains(response, 'New Arrivals')
+        self.assertEqual(response.context['products'], [])
+
+
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes')
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        os.makedirs(os.path.join(media, 'uploads', 'product'))
+        with open(os.path.join(media, 'uploads', 'product', 'broken.jpg'), 'wb') as f:
+            f.write(b'not a jpeg')
+
+    def test_corrupt_image_is_not_retried(self):
+        product = Product.objects.create(
+            name='Sneaker', price=Decimal('10.00'), category=self.category, image='uploads/product/broken.jpg',
+        )
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['source'], 'uploads/product/broken.jpg')
+        self.assertIn('error', product.image_variants)
+
+        with mock.patch('store.images.build_variants') as build:
+            html = product_picture(product)
+        build.assert_not_called()
+        self.assertIn('<img src="/media/uploads/product/broken.jpg"', html)
@@ -0,0 +1,92 @@
+"""Field change tracking for models.
+
+``TrackChangesMixin`` remembers every field value as it was loaded from the
+database, so a model can ask what changed without re-fetching itself, and
+``save()`` only writes the columns that actually changed.
+"""
+import copy
+
+from django.db.models import DEFERRED
+
+
+class TrackChangesMixin:
+    """Record loaded field values; ``save()`` on a loaded instance writes only changed fields.
+
+    Instances that weren't loaded from the database (new objects, or ones
+    built by hand) have nothing to compare with and save normally; use
+    ``is_loaded()`` before trusting ``has_changed()`` for a field.
+
+    A save where nothing changed writes nothing and, like any save with an
+    empty ``update_fields``, sends no ``pre_save``/``post_save`` signals.
+    Pass ``update_fields`` explicitly to force a write.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self, attnames=None):
+        # Copy mutable values (JSONField dicts...) so in-place edits show up as changes
+        loaded = getattr(self, '_loaded_values', {}) if attnames is not None else {}
+        for field in self._meta.concrete_fields:
+            attname = field.attname
+            if attnames is not None and attname not in attnames:
+                continue
+            value = self.__dict__.get(attname, DEFERRED)
+            if value is not DEFERRED:
+                loaded[attname] = copy.deepcopy(value)
+        self._loaded_values = loaded
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        if self.is_tracked:
+            # Also how deferred fields get loaded: they start being tracked from here
+            attnames = None if fields is None else {self._meta.get_field(name).attname for name in fields}
+            self._snapshot(attnames)
+
+    @property
+    def is_tracked(self):
+        return hasattr(self, '_loaded_values')
+
+    def changed_fields(self):
+        """Names (attnames) of the loaded fields whose value differs from the database."""
+        if not self.is_tracked:
+            return set()
+        changed = set()
+        for field in self._meta.concrete_fields:
+            attname = field.attname
+            if field.primary_key or attname not in self.__dict__:
+                continue
+            if attname not in self._loaded_values or self.__dict__[attname] != self._loaded_values[attname]:
+                changed.add(attname)
+        return changed
+
+    def is_loaded(self, name):
+        """Whether the database value of ``name`` is known (loaded, refreshed or saved)."""
+        field = self._meta.get_field(name)
+        return field.attname in getattr(self, '_loaded_values', {})
+
+    def has_changed(self, name):
+        field = self._meta.get_field(name)
+        return field.attname in self.changed_fields()
+
+    def previous(self, name):
+        """Value of ``name`` when the instance was loaded (None if it wasn't loaded)."""
+        field = self._meta.get_field(name)
+        return getattr(self, '_loaded_values', {}).get(field.attname)
+
+    def save(self, *args, **kwargs):
+        if (self.is_tracked and not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert') and not args):
+            changed = self.changed_fields()
+            if changed:
+                # auto_now fields are set during save, write them along with the real changes
+                changed.update(
+                    field.attname for field in self._meta.concrete_fields
+                    if getattr(field, 'auto_now', False)
+                )
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self._snapshot()
@@ -8,31 +8,23 @@ from .forms import SignUpForm, UpdateUserForm, ChangePasswordForm, UserInfoForm
 from payment.forms import ShippingForm
 from payment.models import ShippingAddress
 from django import forms
-from django.db.models import Q
+from django.db.models import F, Q
+from django.utils.text import slugify
 from django.conf import settings
 import json
-from urllib.request import urlopen, Request
-from urllib.error import URLError, HTTPError
-import json
+from urllib.error import HTTPError
+from ecom.backend import get_json, normalize_product, related_products
 from cart.cart import Cart
+from cart.persistence import decode_cart
 
 def search(request):
     if request.method == "POST":
         query = request.POST['searched']
         try:
-            req = Request(f"{settings.FASTAPI_BASE_URL}/items")
-            with urlopen(req, timeout=5) as resp:
-                products = json.loads(resp.read().decode())
+            products = get_json("/items")
         except Exception:
             products = []
-        def _norm(p):
-            img = p.get('image')
-            if img and not str(img).startswith(('http://', 'https://', settings.MEDIA_URL)):
-                p['image'] = {'url': f"{settings.MEDIA_URL}{img}"}
-            elif isinstance(img, str):
-                p['image'] = {'url': img}
-            return p
-        products = [_norm(p) for p in products]
+        products = [normalize_product(p) for p in products]
         searched = [p for p in products if query.lower() in (p.get('name','') or '').lower() or query.lower() in (p.get('description','') or '').lower()]
         if not searched:
             messages.success(request, ("That product does not exist, please try again"))
@@ -41,65 +33,65 @@ def search(request):
 
 
 def category_summary(request):
-    categories = Category.objects.all()
+    # Counts come precomputed with the categories
+    try:
+        categories = get_json("/categories")
+    except Exception:
+        categories = [
+            {'name': c.name, 'slug': c.slug, 'product_count': c.products, 'sale_count': c.on_sale}
+            for c in Category.objects.annotate(products=F('counts__products'), on_sale=F('counts__on_sale'))
+        ]
     return render(request, 'category_summary.html', {"categories": categories})
 
 def category(request, foo):
-    foo = foo.replace('-', ' ')
+    slug = slugify(foo)
+    if slug and slug != foo:
+        # Old links used the category name with dashes
+        return redirect('category', slug, permanent=True)
+    after = request.GET.get('after', '')
+    query = f"?after={after}" if after.isdigit() else ''
     try:
-        category = Category.objects.get(name=foo)
-        try:
-            req = Request(f"{settings.FASTAPI_BASE_URL}/items")
-            with urlopen(req, timeout=5) as resp:
-                items = json.loads(resp.read().decode())
-        except Exception:
-            items = []
-        def _norm(p):
-            img = p.get('image')
-            if img and not str(img).startswith(('http://', 'https://', settings.MEDIA_URL)):
-                p['image'] = {'url': f"{settings.MEDIA_URL}{img}"}
-            elif isinstance(img, str):
-                p['image'] = {'url': img}
-            return p
-        products = [_norm(p) for p in items if p.get('category_id') == category.id]
-        return render(request, 'category.html', {'products': products, 'category': category})
-    except:
-        messages.success(request, ("That category doesn't exist"))
-        return redirect('home')
+        page = get_json(f"/categories/{slug}/items{query}")
+    except HTTPError as e:
+        page = None
+        if e.code == 404:
+            messages.success(request, ("That category doesn't exist"))
+            return redirect('home')
+    except Exception:
+        page = None
+    if page is None:
+        category = Category.objects.filter(slug=slug).first()
+        if category is None:
+            messages.success(request, ("That category doesn't exist"))
+            return redirect('home')
+        products, next_cursor = [], None
+    else:
+        category = page['category']
+        products = [normalize_product(p) for p in page['items']]
+        next_cursor = page['next_cursor']
+    return render(request, 'category.html', {
+        'products': products, 'category': category, 'next_cursor': next_cursor, 'paged': bool(query),
+    })
 
 def product(request, pk):
     try:
-        req = Request(f"{settings.FASTAPI_BASE_URL}/items/{pk}")
-        with urlopen(req, timeout=5) as resp:
-            product = json.loads(resp.read().decode())
+        product = get_json(f"/items/{pk}")
     except Exception:
         product = None
     if not product:
         messages.success(request, ("That product doesn't exist"))
         return redirect('home')
-    img = product.get('image')
-    if img and not str(img).startswith(('http://', 'https://', settings.MEDIA_URL)):
-        product['image'] = {'url': f"{settings.MEDIA_URL}{img}"}
-    elif isinstance(img, str):
-        product['image'] = {'url': img}
-    return render(request, 'product.html', {'product': product})
+    normalize_product(product)
+    related = related_products(f"/items/{pk}/related")
+    return render(request, 'product.html', {'product': product, 'related_products': related})
 
 
 def home(request):
     try:
-        req = Request(f"{settings.FASTAPI_BASE_URL}/items")
-        with urlopen(req, timeout=5) as resp:
-            products = json.loads(resp.read().decode())
+        products = get_json("/items")
     except Exception:
         products = []
-    def _norm(p):
-        img = p.get('image')
-        if img and not str(img).startswith(('http://', 'https://', settings.MEDIA_URL)):
-            p['image'] = {'url': f"{settings.MEDIA_URL}{img}"}
-        elif isinstance(img, str):
-            p['image'] = {'url': img}
-        return p
-    products = [_norm(p) for p in products]
+    products = [normalize_product(p) for p in products]
     return render(request, 'home.html', {'products': products})
 
 def about(request):
@@ -113,12 +105,10 @@ def login_user(request):
         if user is not None:
             login(request, user)
             current_user = Profile.objects.get(user__id=request.user.id)
-            saved_cart = current_user.old_cart
+            saved_cart = decode_cart(current_user.old_cart)
             if saved_cart:
-                converted_cart = json.loads(saved_cart)
-                cart = Cart(request)
-                for key,value in converted_cart.items():
-                    cart.db_add(product=key, quantity=value)
+                cart = Cart.for_request(request)
+                cart.merge(saved_cart)
 
             messages.success(request, ("You have been logged in"))
             return redirect('home')